@@ -1,31 +1,43 @@
 import sys
 from src.embeddings import build_embeddings
-from src.vectorstore import build_vector_store
+from src.index_manager import open_active_store, centroid_router_for, xref_graph_for, active_db_path, IndexWatcher
 from src.prompts import QA_PROMPT, DOCUMENT_PROMPT
 from src.rag_chain import build_rag_chain
 from src.chat import display_answer
-from langchain_community.chat_models import ChatOllama
-from src.config import SERVER_URL, MODEL_NAME, RETRIEVER_K
+from src.llm_client import build_llm
+from src.config import RETRIEVER_K, QUERY_LOG_ENABLED
 from src.chat import debug_retrieved_documents
 from src.routing_retriever import ActRoutingRetriever
+from src.warmup import CacheWarmer, QueryEmbeddingCache, QueryLog
 
 def main():
-    # LLM
-    llm = ChatOllama(
-    base_url=SERVER_URL,   # http://127.0.0.1:11434
-    model=MODEL_NAME,      # gemma3:27b-it-q4_K_M
-    temperature=0.2,
-    )
+    # LLM (wspólna pula połączeń + rozgrzewka modelu w Ollamie)
+    llm = build_llm(temperature=0.2)
     
-    # Embeddings
-    embeddings = build_embeddings()
+    # Embeddings (z cache wektorów pytań)
+    embeddings = QueryEmbeddingCache(build_embeddings())
     
-    # Vectorstore
-    db, retriever = build_vector_store(embeddings)
+    # Vectorstore (aktywna wersja indeksu)
+    db, index_version = open_active_store(embeddings)
+
+    retriever = ActRoutingRetriever(
+        vectorstore=db,
+        k=RETRIEVER_K,
+        max_acts=2,
+        debug=True,
+        centroid_router=centroid_router_for(db, active_db_path()),
+        xref_graph=xref_graph_for(db, active_db_path()),
+    )
+    # Podmiana indeksu w locie po publikacji nowej wersji
+    IndexWatcher(embeddings, [retriever], index_version).start()
+    # RAG chain + log pytań
+    query_log = QueryLog() if QUERY_LOG_ENABLED else None
+    rag_chain = build_rag_chain(llm, retriever, QA_PROMPT, DOCUMENT_PROMPT, query_log=query_log)
 
-    retriever = ActRoutingRetriever(vectorstore=db, k=RETRIEVER_K, max_acts=2, debug=True)
-    # RAG chain
-    rag_chain = build_rag_chain(llm, retriever, QA_PROMPT, DOCUMENT_PROMPT)
+    # Rozgrzewka przed pierwszym pytaniem (w CLI synchronicznie – nie miesza się z wejściem)
+    if query_log is not None:
+        query_log.compact()
+        CacheWarmer(retriever, query_log, query_cache=embeddings).run()
     
     # CLI loop
     while True:
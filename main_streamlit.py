@@ -1,13 +1,19 @@
+import uuid
 import streamlit as st
 from PIL import Image
-from langchain_community.chat_models import ChatOllama
 from langchain_core.messages import HumanMessage, AIMessage
 from src.routing_retriever import ActRoutingRetriever
-from src.config import MODEL_NAME, SERVER_URL, RETRIEVER_K
+from src.config import RETRIEVER_K, UPLOAD_QUERY_WAIT_S, QUERY_LOG_ENABLED
+from src.llm_client import build_llm
+from src.load_budget import build_budget_policy
 from src.embeddings import build_embeddings
-from src.vectorstore import build_vector_store
+from src.index_manager import open_active_store, centroid_router_for, xref_graph_for, active_db_path, IndexWatcher
 from src.prompts import QA_PROMPT, DOCUMENT_PROMPT
 from src.rag_chain import build_rag_chain
+from src.session_retriever import SessionRetriever
+from src.upload_index import SessionToken, session_uploads
+from src.dedup import duplicate_pointers
+from src.warmup import CacheWarmer, QueryEmbeddingCache, QueryLog
 
 # ---------- Ustawienia strony ----------
 st.set_page_config(
@@ -78,13 +84,10 @@ if "rag_ready" not in st.session_state:
 # ---------- Inicjalizacja RAG (Bez zmian w logice) ----------
 @st.cache_resource(show_spinner=True)
 def init_rag():
-    llm = ChatOllama(
-        base_url=SERVER_URL,
-        model=MODEL_NAME,
-        temperature=0.2,
-    )
-    embeddings = build_embeddings()
-    db, _ = build_vector_store(embeddings)
+    llm = build_llm(temperature=0.2)
+    # Cache wektorów pytań – wspólny dla sesji i rozgrzewki
+    embeddings = QueryEmbeddingCache(build_embeddings())
+    db, index_version = open_active_store(embeddings)
 
     retriever = ActRoutingRetriever(
         vectorstore=db,
@@ -96,23 +99,77 @@ def init_rag():
         lambda_mult=0.6,
         enable_sanction_filter=True,
         sanction_k=6,
+        centroid_router=centroid_router_for(db, active_db_path()),
+        xref_graph=xref_graph_for(db, active_db_path()),
+        # Wspólna dla wszystkich sesji: pod obciążeniem mniejsze k / fetch_k, bez MMR
+        budget_policy=build_budget_policy(llm.client),
     )
-
-    rag_chain = build_rag_chain(llm, retriever, QA_PROMPT, DOCUMENT_PROMPT)
-    return rag_chain, retriever
+    # Podmiana indeksu w locie po publikacji nowej wersji (bez restartu aplikacji)
+    IndexWatcher(embeddings, [retriever], index_version).start()
+
+    # Rozgrzewka najczęstszymi pytaniami z logu (w tle – aplikacja przyjmuje pytania od razu)
+    query_log = None
+    if QUERY_LOG_ENABLED:
+        query_log = QueryLog()
+        query_log.compact()
+        CacheWarmer(
+            retriever,
+            query_log,
+            rag_chain=build_rag_chain(llm, retriever, QA_PROMPT, DOCUMENT_PROMPT),
+            llm_client=llm.client,
+            query_cache=embeddings,
+        ).start()
+
+    return llm, retriever, query_log
 
 if not st.session_state.rag_ready:
     with st.spinner("🚀 Inicjalizacja bazy przepisów..."):
-        rag_chain, retriever = init_rag()
-        st.session_state.rag_chain = rag_chain
-        st.session_state.retriever = retriever
+        llm, retriever, query_log = init_rag()
+        # Model, indeks i retriever są wspólne; cache fragmentów z poprzednich tur – osobny dla sesji
+        # Załączniki: indeks w pamięci tej sesji, zwalniany po jej zakończeniu (SessionToken)
+        st.session_state.session_token = SessionToken()
+        st.session_state.upload_session_id = uuid.uuid4().hex
+        uploads = session_uploads(
+            st.session_state.upload_session_id, retriever.vectorstore.embeddings, owner=st.session_state.session_token
+        )
+        session_retriever = SessionRetriever(base=retriever, uploads=uploads)
+        st.session_state.rag_chain = build_rag_chain(
+            llm, session_retriever, QA_PROMPT, DOCUMENT_PROMPT, query_log=query_log
+        )
+        st.session_state.retriever = session_retriever
+        st.session_state.uploads = uploads
         st.session_state.rag_ready = True
 
+# Indeks załączników przez rejestr w każdym przebiegu skryptu: odświeża last_used (TTL liczy się
+# od ostatniej tury, nie od ostatniego pliku), a po zwolnieniu przez TTL / limit pamięci tworzy nowy
+st.session_state.uploads = session_uploads(
+    st.session_state.upload_session_id,
+    st.session_state.retriever.base.vectorstore.embeddings,
+    owner=st.session_state.session_token,
+)
+st.session_state.retriever.uploads = st.session_state.uploads
+
 # ---------- Ekran Główny ----------
 
 st.title("⚖️ Asystent Prawny AI")
 st.markdown("Skonsultuj problem prawny w oparciu o aktualne kodeksy.")
 
+# ---------- Załączniki sesji ----------
+_UPLOAD_ICONS = {"pending": "⏳", "parsing": "⏳", "embedding": "⏳", "ready": "✅", "error": "⚠️"}
+upload_status = st.session_state.uploads.status()
+if upload_status:
+    with st.sidebar:
+        st.subheader("📎 Załączniki")
+        for f in upload_status:
+            line = f"{_UPLOAD_ICONS.get(f['status'], '')} {f['name']}"
+            if f["status"] == "embedding":
+                line += f" – indeksowanie {f['embedded']}/{f['chunks']}"
+            elif f["status"] == "ready":
+                line += f" – {f['chunks']} fragm. ({f['memory_mb']} MB)"
+            elif f["error"]:
+                line += f" – {f['error']}"
+            st.caption(line)
+
 # ---------- Wyświetlanie Historii ----------
 if not st.session_state.messages:
     st.write("")
@@ -140,28 +197,51 @@ if chat_value:
     user_text = chat_value.text or ""
     user_files = chat_value.files or []
 
+    # Pliki trafiają do indeksu sesji w tle – czat nie czeka na embedding
+    upload_jobs = [st.session_state.uploads.add_file(f.name, f.getvalue()) for f in user_files]
+
     if user_text.strip() or user_files:
         # 1. User Message
-        st.session_state.messages.append({"role": "user", "content": user_text})
+        user_content = user_text or "📎 " + ", ".join(f.name for f in user_files)
+        st.session_state.messages.append({"role": "user", "content": user_content})
         with st.chat_message("user", avatar="👤"):
-            st.markdown(user_text)
+            st.markdown(user_content)
 
         # 2. AI Response
         with st.chat_message("assistant", avatar="⚖️"):
             message_placeholder = st.empty()
-            with st.spinner("⚖️ Analizuję treść aktów prawnych..."):
-                answer_text, final_docs = run_rag_pipeline(user_text)
+            if not user_text.strip():
+                # Same pliki: potwierdzamy przyjęcie, indeksowanie trwa w tle
+                answer_text, final_docs = (
+                    "📎 Dodano pliki – indeksuję je w tle. Możesz już zadawać pytania; "
+                    "fragmenty załączników trafią do kontekstu, gdy będą gotowe.",
+                    [],
+                )
                 message_placeholder.markdown(answer_text)
+            else:
+                if upload_jobs:
+                    # Pytanie razem z plikami zwykle ich dotyczy – chwilę czekamy na indeks
+                    with st.spinner("📎 Przetwarzam załączniki..."):
+                        st.session_state.uploads.wait_for(upload_jobs, UPLOAD_QUERY_WAIT_S)
+                with st.spinner("⚖️ Analizuję treść aktów prawnych..."):
+                    answer_text, final_docs = run_rag_pipeline(user_text)
+                    message_placeholder.markdown(answer_text)
                 
                 if final_docs:
                     with st.expander("📚 Wykorzystane źródła"):
                         for doc in final_docs:
                             src = doc.metadata.get("source", "Dokument").split("/")[-1]
                             act = doc.metadata.get("act_name", "Przepis")
+                            # Fragment zwinięty z duplikatami przy ingestii pokrywa też inne przepisy
+                            also = ", ".join(
+                                f"art. {p['article']}" + (f" § {p['paragraph']}" if p.get("paragraph") not in (None, "all") else "")
+                                for p in duplicate_pointers(doc) if p.get("article")
+                            )
+                            also_html = f"<br><small>Ten sam tekst: {also}</small>" if also else ""
                             st.markdown(
                                 f"""
                                 <div class="source-box">
-                                    <strong>{act}</strong> <small>({src})</small><br>
+                                    <strong>{act}</strong> <small>({src})</small>{also_html}<br>
                                     <p style="font-size: 0.85rem; color: #444; margin-top: 8px;">
                                     "{doc.page_content[:350]}..."
                                     </p>
@@ -0,0 +1,80 @@
+import argparse
+import json
+
+from src.config import INDEX_ROOT
+from src.embeddings import build_embeddings
+from src.index_manager import (
+    build_version,
+    verify_version,
+    publish_version,
+    rollback,
+    prune_versions,
+    versions_summary,
+    version_path,
+    active_version,
+)
+from src.snapshot_store import export_snapshot, snapshot_dir_for, source_fingerprint
+from src.vectorstore import open_vector_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zarządzanie wersjami indeksu (blue/green).")
+    parser.add_argument("--root", default=INDEX_ROOT, help="Katalog z wersjami indeksu")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_build = sub.add_parser("build", help="Zbuduj nową wersję (i opcjonalnie opublikuj)")
+    p_build.add_argument("--publish", action="store_true", help="Opublikuj, jeśli weryfikacja przejdzie")
+    p_build.add_argument("--questions", default="tests/questions.jsonl")
+
+    p_verify = sub.add_parser("verify", help="Zweryfikuj wersję")
+    p_verify.add_argument("version")
+    p_verify.add_argument("--questions", default="tests/questions.jsonl")
+
+    p_publish = sub.add_parser("publish", help="Opublikuj wersję")
+    p_publish.add_argument("version")
+    p_publish.add_argument("--force", action="store_true", help="Pomiń wymóg udanej weryfikacji")
+
+    sub.add_parser("rollback", help="Wróć do poprzedniej wersji")
+    sub.add_parser("prune", help="Usuń najstarsze wersje")
+    sub.add_parser("list", help="Pokaż wersje")
+
+    p_snapshot = sub.add_parser("snapshot", help="Eksportuj snapshot mmap wersji (dla serve.py)")
+    p_snapshot.add_argument("version", nargs="?", help="Domyślnie aktywna wersja")
+
+    args = parser.parse_args()
+
+    if args.cmd in ("build", "verify"):
+        embeddings = build_embeddings()
+        version = build_version(embeddings, args.root) if args.cmd == "build" else args.version
+        report = verify_version(embeddings, version, args.root, questions_path=args.questions)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+        if args.cmd == "build" and args.publish:
+            if not report["passed"]:
+                raise SystemExit(f"❌ Wersja {version} nie przeszła weryfikacji – nie publikuję.")
+            publish_version(version, args.root)
+            prune_versions(args.root)
+        elif not report["passed"]:
+            raise SystemExit(1)
+
+    elif args.cmd == "publish":
+        publish_version(args.version, args.root, force=args.force)
+    elif args.cmd == "rollback":
+        rollback(args.root)
+    elif args.cmd == "prune":
+        prune_versions(args.root)
+    elif args.cmd == "snapshot":
+        version = args.version or active_version(args.root)
+        if not version:
+            raise SystemExit("❌ Brak aktywnej wersji – podaj wersję.")
+        path = version_path(version, args.root)
+        source = source_fingerprint(path)
+        export_snapshot(open_vector_store(None, path), snapshot_dir_for(path), version=version, source=source)
+    elif args.cmd == "list":
+        for row in versions_summary(args.root):
+            mark = "*" if row["active"] else " "
+            print(f"{mark} {row['version']} | passed={row['passed']} | p95={row['p95_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,15 +4,15 @@ import time
 from pathlib import Path
 from datetime import datetime
 
-from langchain_community.chat_models import ChatOllama
-
-from src.config import MODEL_NAME, SERVER_URL, DEBUG, RETRIEVER_K
+from src.config import MODEL_NAME, SERVER_URL, DEBUG, RETRIEVER_K, EMBED_BATCH_SIZE
+from src.dedup import duplicate_pointers
 from src.embeddings import build_embeddings
-from src.vectorstore import build_vector_store
+from src.llm_client import build_llm
+from src.index_manager import open_active_store, centroid_router_for, xref_graph_for, active_db_path
+from src.metrics import trace_request
 from src.prompts import QA_PROMPT, DOCUMENT_PROMPT
 from src.rag_chain import build_rag_chain
 from src.routing_retriever import ActRoutingRetriever
-from src.routing import route_act_names
 
 
 def _doc_to_dict(doc, max_preview_chars: int = 500):
@@ -25,19 +25,16 @@ def _doc_to_dict(doc, max_preview_chars: int = 500):
         "article": meta.get("article"),
         "paragraph": meta.get("paragraph"),
         "page": meta.get("page"),
+        "duplicates": duplicate_pointers(doc),
         "preview": text[:max_preview_chars] + ("..." if len(text) > max_preview_chars else ""),
     }
 
 
 def init_rag():
-    llm = ChatOllama(
-        base_url=SERVER_URL,
-        model=MODEL_NAME,
-        temperature=0.2,
-    )
+    llm = build_llm(temperature=0.2)
 
     embeddings = build_embeddings()
-    db, _base_retriever = build_vector_store(embeddings)
+    db, _index_version = open_active_store(embeddings)
 
     # Zamiast db.as_retriever() używamy Twojego routingu po aktach (metadata["act_name"])
     routed_retriever = ActRoutingRetriever(
@@ -50,6 +47,8 @@ def init_rag():
     lambda_mult=0.6,
     enable_sanction_filter=True,
     sanction_k=6,
+    centroid_router=centroid_router_for(db, active_db_path()),
+    xref_graph=xref_graph_for(db, active_db_path()),
     )
 
     rag_chain = build_rag_chain(
@@ -62,15 +61,47 @@ def init_rag():
     return rag_chain, routed_retriever
 
 
-def run_one(rag_chain, query: str):
+def run_one(rag_chain, query: str, mode: str = "auto", context=None):
     t0 = time.time()
-    result = rag_chain.invoke({"input": query})
+    inputs = {"input": query, "mode": mode}
+    if context is not None:
+        inputs["context"] = context
+    result = rag_chain.invoke(inputs)
     elapsed_ms = int((time.time() - t0) * 1000)
 
     answer = (result.get("answer") or "").strip()
     docs = result.get("context") or []
 
-    return answer, docs, elapsed_ms
+    return answer, docs, elapsed_ms, result
+
+
+def _prefetch(retriever, batch, mode: str, enabled: int):
+    """
+    Retrieval wsadowy dla pytań, które pójdą ścieżką generacji (lookup nie potrzebuje wyszukiwania).
+    Zwraca (konteksty albo None, routing albo None, {"timings": udział w czasie wsadu, "budget": ...}).
+    """
+    contexts = [None] * len(batch)
+    routes = [None] * len(batch)
+    info = {"timings": {}, "budget": None}
+    if not enabled or mode == "lookup":
+        return contexts, routes, info
+
+    idx = [
+        i for i, item in enumerate(batch)
+        if mode == "generate" or not retriever.is_lookup_query(item.get("query") or "")
+    ]
+    if not idx:
+        return contexts, routes, info
+
+    batch_routes = []
+    with trace_request() as trace:
+        docs = retriever.batch_retrieve([batch[i].get("query") for i in idx], routes=batch_routes)
+    for i, d, r in zip(idx, docs, batch_routes):
+        contexts[i], routes[i] = d, r
+    info["timings"] = {f"batch_{k}": round(v / len(idx), 1) for k, v in trace.stages.items()}
+    info["budget"] = trace.info.get("retrieval_budget")
+    print(f"📦 Retrieval wsadowy: {len(idx)} pytań w {trace.stages['total']:.0f} ms")
+    return contexts, routes, info
 
 
 def main():
@@ -78,6 +109,10 @@ def main():
     parser.add_argument("--in", dest="in_path", default="tests/questions.jsonl", help="Input questions JSONL path")
     parser.add_argument("--out", dest="out_path", default="tests/results.jsonl", help="Output results JSONL path")
     parser.add_argument("--limit", dest="limit", type=int, default=0, help="Limit number of questions (0 = no limit)")
+    parser.add_argument("--mode", dest="mode", default="auto", choices=["auto", "lookup", "generate"],
+                        help="auto = szybka ścieżka dla wyszukań przepisu, lookup/generate = wymuszenie ścieżki")
+    parser.add_argument("--retrieval-batch", dest="retrieval_batch", type=int, default=EMBED_BATCH_SIZE,
+                        help="Ile pytań naraz przechodzi retrieval (batch_retrieve); 0 = pytanie po pytaniu")
     args = parser.parse_args()
 
     in_path = Path(args.in_path)
@@ -87,7 +122,7 @@ def main():
     if not in_path.exists():
         raise FileNotFoundError(f"Brak pliku wejściowego: {in_path}")
 
-    rag_chain, _retriever = init_rag()
+    rag_chain, retriever = init_rag()
 
     run_meta = {
         "run_id": datetime.now().strftime("%Y%m%d_%H%M%S"),
@@ -96,41 +131,51 @@ def main():
         "retriever_k": RETRIEVER_K,
     }
 
-    processed = 0
-
-    with in_path.open("r", encoding="utf-8") as fin, out_path.open("a", encoding="utf-8") as fout:
+    items = []
+    with in_path.open("r", encoding="utf-8") as fin:
         for line in fin:
             line = line.strip()
-            if not line:
-                continue
-
-            item = json.loads(line)
-            qid = item.get("id")
-            query = item.get("query")
-
-            # Dodatkowo zapisujemy routing (jakie akty zostały wybrane)
-            routed_acts = route_act_names(query, max_acts=2)
-
-            answer, docs, elapsed_ms = run_one(rag_chain, query)
-
-            out = {
-                **run_meta,
-                "id": qid,
-                "query": query,
-                "routing": routed_acts if routed_acts else "ALL (fallback)",
-                "elapsed_ms": elapsed_ms,
-                "answer": answer,
-                "docs": [_doc_to_dict(d) for d in docs],
-            }
-
-            fout.write(json.dumps(out, ensure_ascii=False) + "\n")
-            fout.flush()
-
-            processed += 1
-            print(f"[OK] {qid} | {elapsed_ms} ms | docs={len(docs)}")
-
-            if args.limit and processed >= args.limit:
-                break
+            if line:
+                items.append(json.loads(line))
+    if args.limit:
+        items = items[: args.limit]
+
+    batch_size = args.retrieval_batch or 1
+    with out_path.open("a", encoding="utf-8") as fout:
+        for start in range(0, len(items), batch_size):
+            batch = items[start : start + batch_size]
+            contexts, routes, batch_info = _prefetch(retriever, batch, args.mode, args.retrieval_batch)
+
+            for item, context, route in zip(batch, contexts, routes):
+                qid = item.get("id")
+                query = item.get("query")
+
+                # Dodatkowo zapisujemy routing (jakie akty zostały wybrane)
+                routed_acts, routing_source = route or retriever.route(query)[:2]
+
+                answer, docs, elapsed_ms, result = run_one(rag_chain, query, args.mode, context)
+                timings = {k: round(v, 1) for k, v in (result.get("timings") or {}).items()}
+                if context is not None:
+                    # Udział pytania w czasie wsadowego retrievalu (czas wsadu / liczba pytań)
+                    timings.update(batch_info["timings"])
+
+                out = {
+                    **run_meta,
+                    "id": qid,
+                    "query": query,
+                    "routing": routed_acts if routed_acts else "ALL (fallback)",
+                    "routing_source": routing_source,
+                    "path": result.get("path"),
+                    "elapsed_ms": elapsed_ms,
+                    "timings": timings,
+                    "retrieval_budget": result.get("retrieval_budget") or (batch_info["budget"] if context is not None else None),
+                    "answer": answer,
+                    "docs": [_doc_to_dict(d) for d in docs],
+                }
+
+                fout.write(json.dumps(out, ensure_ascii=False) + "\n")
+                fout.flush()
+                print(f"[OK] {qid} | {elapsed_ms} ms | docs={len(docs)}")
 
     print(f"\nZapisano wyniki do: {out_path.resolve()}")
 
@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from src.compressed_store import CompressedVectorStore, write_full_vectors
+from src.embeddings import build_embeddings
+from src.index_manager import _benchmark_retriever, _load_questions, active_db_path, active_version
+from src.metrics import percentile
+from src.numpy_store import export_chroma
+from src.vectorstore import build_vector_store, open_vector_store
+
+
+def _run(retriever, questions):
+    retriever.invoke("test")  # rozgrzewka
+    latencies, results = [], {}
+    for item in questions:
+        t0 = time.perf_counter()
+        docs = retriever.invoke(item["query"])
+        latencies.append((time.perf_counter() - t0) * 1000)
+        results[item["id"]] = [d.id or d.page_content[:80] for d in docs]
+    return results, latencies
+
+
+def _recall(results, baseline):
+    scores = []
+    for qid, base_ids in baseline.items():
+        if not base_ids:
+            continue
+        scores.append(len(set(results.get(qid, [])) & set(base_ids)) / len(base_ids))
+    return round(sum(scores) / len(scores), 4) if scores else None
+
+
+def _parse_config(spec: str) -> dict:
+    """'pca:256:int8' -> method/dim/quantization; 'none' = brak redukcji/kwantyzacji."""
+    method, dim, quant = (spec.split(":") + ["none", "768", "none"])[:3]
+    return {
+        "method": None if method == "none" else method,
+        "dim": int(dim),
+        "quantization": None if quant == "none" else quant,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark kompresji wektorów vs ActRoutingRetriever na Chroma.")
+    parser.add_argument("--questions", default="tests/questions.jsonl")
+    parser.add_argument(
+        "--configs",
+        default="none:768:none,pca:256:int8,pca:256:binary,truncate:384:int8,pca:128:binary",
+        help="Lista konfiguracji method:dim:quantization",
+    )
+    parser.add_argument("--rescore", type=int, default=200, help="Liczba kandydatów do dokładnego rescoringu")
+    parser.add_argument("--memmap", action="store_true", help="Pełne wektory do rescoringu w np.memmap na dysku")
+    args = parser.parse_args()
+
+    questions = _load_questions(args.questions)
+    embeddings = build_embeddings()
+    # Punkt odniesienia: zawsze zwykła Chroma (open_active_store przy COMPRESSION_ENABLED zwraca już
+    # skompresowany indeks, a wtedy porównywalibyśmy kompresję samą ze sobą)
+    version = active_version()
+    db_path = active_db_path()
+    db = open_vector_store(embeddings, db_path) if version else build_vector_store(embeddings)[0]
+
+    baseline, base_lat = _run(_benchmark_retriever(db), questions)
+    ids, vectors, texts, metas = export_chroma(db)
+    bench_path = os.path.join(db_path, "bench_full_vectors.npy")
+    if args.memmap:
+        write_full_vectors(vectors, bench_path)
+        full_vectors = np.load(bench_path, mmap_mode="r")
+    else:
+        full_vectors = vectors
+    report = {
+        "index_version": version,
+        "chunks": len(ids),
+        "baseline": {
+            "store": "chroma",
+            "vectors_mb": round(vectors.nbytes / 2**20, 2),
+            "p50_ms": round(percentile(base_lat, 50), 1),
+            "p95_ms": round(percentile(base_lat, 95), 1),
+        },
+        "configs": [],
+    }
+
+    for spec in args.configs.split(","):
+        cfg = _parse_config(spec.strip())
+        t0 = time.perf_counter()
+        store = CompressedVectorStore(
+            embeddings,
+            ids,
+            full_vectors,
+            texts,
+            metas,
+            rescore_candidates=args.rescore,
+            **cfg,
+        )
+        build_s = time.perf_counter() - t0
+        results, lat = _run(_benchmark_retriever(store), questions)
+        report["configs"].append({
+            "config": spec,
+            **store.memory_report(),
+            "build_s": round(build_s, 2),
+            "p50_ms": round(percentile(lat, 50), 1),
+            "p95_ms": round(percentile(lat, 95), 1),
+            "recall_vs_chroma": _recall(results, baseline),
+        })
+
+    if args.memmap:
+        del full_vectors
+        Path(bench_path).unlink(missing_ok=True)
+        Path(bench_path).with_suffix(".json").unlink(missing_ok=True)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import json
+import os
+
+from src.config import DOCS_PATH, DEDUP_THRESHOLD
+from src.dedup import collapse_near_duplicates, duplicate_pointers, format_shrink_report
+from src.vectorstore import _chunk_id, _load_json_files, _split_documents
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Raport deduplikacji (MinHash/LSH) bez budowania indeksu: ile chunków ubędzie przy ingestii."
+    )
+    parser.add_argument("--docs", default=DOCS_PATH)
+    parser.add_argument("--threshold", type=float, default=DEDUP_THRESHOLD)
+    parser.add_argument("--dim", type=int, default=768, help="Wymiar wektorów (do szacunku oszczędności)")
+    parser.add_argument("--examples", type=int, default=3, help="Ile przykładowych grup pokazać na plik")
+    parser.add_argument("--out", default=None, help="Zapis raportu JSON")
+    args = parser.parse_args()
+
+    files = sorted(f for f in os.listdir(args.docs) if f.lower().endswith(".json"))
+    report = {"threshold": args.threshold, "files": {}}
+    before = removed = 0
+
+    for filename in files:
+        chunks = _split_documents(_load_json_files(args.docs, [filename]))
+        ids = [_chunk_id(filename, i, c.page_content) for i, c in enumerate(chunks)]
+        kept, _, stats = collapse_near_duplicates(chunks, ids, args.threshold)
+        before += stats["chunks_before"]
+        removed += stats["removed"]
+
+        groups = sorted((d for d in kept if duplicate_pointers(d)), key=lambda d: -len(duplicate_pointers(d)))
+        stats["examples"] = [
+            {
+                "article": d.metadata.get("article"),
+                "covers": [p.get("article") for p in duplicate_pointers(d)],
+                "preview": d.page_content.strip().splitlines()[-1][:120],
+            }
+            for d in groups[: args.examples]
+        ]
+        report["files"][filename] = stats
+        print(f"🧬 {filename}: {format_shrink_report(stats, args.dim)}")
+
+    report["total"] = {
+        "chunks_before": before,
+        "chunks_after": before - removed,
+        "removed": removed,
+        "shrink_pct": round(100.0 * removed / before, 2) if before else 0.0,
+        "vectors_saved_mb": round(removed * args.dim * 4 / (1024 * 1024), 2),
+    }
+    print(f"\n📊 Razem: {before} -> {before - removed} chunków (-{report['total']['shrink_pct']}%), "
+          f"wektory: -{report['total']['vectors_saved_mb']} MB")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Raport zapisany: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
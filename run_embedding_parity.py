@@ -0,0 +1,148 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from src.config import DOCS_PATH, DEDUP_ENABLED
+from src.metrics import percentile, rss_mb
+
+
+def _load_corpus():
+    """Chunki jak w indeksie (cały korpus, po deduplikacji) – recall liczymy na tym, co widzi retriever."""
+    from src.dedup import collapse_near_duplicates
+    from src.vectorstore import _chunk_id, _load_json_files, _split_documents
+
+    texts = []
+    for filename in sorted(f for f in os.listdir(DOCS_PATH) if f.lower().endswith(".json")):
+        chunks = _split_documents(_load_json_files(DOCS_PATH, [filename]))
+        if DEDUP_ENABLED:
+            ids = [_chunk_id(filename, i, c.page_content) for i, c in enumerate(chunks)]
+            chunks, _, _ = collapse_near_duplicates(chunks, ids)
+        texts.extend(c.page_content for c in chunks)
+    return texts
+
+
+def _load_queries(path: Path):
+    queries = []
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                queries.append(json.loads(line)["query"])
+    return queries
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    return m / np.maximum(norms, 1e-12)
+
+
+def _measure(backend: str, corpus, queries, repeats: int) -> dict:
+    """Pomiar jednego backendu – wołany w osobnym procesie (--measure), żeby RSS nie był zaniżony."""
+    # Importy bibliotek przed pomiarem: ich narzut nie jest kosztem modelu
+    import torch  # noqa: F401
+    import sentence_transformers  # noqa: F401
+    from src.embeddings import build_embeddings
+
+    rss_before = rss_mb()
+    emb = build_embeddings(backend)
+    rss_model = rss_mb() - rss_before
+
+    t0 = time.perf_counter()
+    doc_vecs = _normalize(np.asarray(emb.embed_documents(corpus), dtype=np.float32))
+    corpus_s = time.perf_counter() - t0
+
+    latencies = []
+    for _ in range(repeats):
+        for q in queries:
+            t = time.perf_counter()
+            emb.embed_query(q)
+            latencies.append((time.perf_counter() - t) * 1000)
+    query_vecs = _normalize(np.asarray([emb.embed_query(q) for q in queries], dtype=np.float32))
+
+    return {
+        "backend": backend,
+        "doc_vecs": doc_vecs,
+        "query_vecs": query_vecs,
+        "model_rss_mb": round(rss_model, 1),
+        "corpus_embed_s": round(corpus_s, 2),
+        "query_p50_ms": round(percentile(latencies, 50), 2),
+        "query_p95_ms": round(percentile(latencies, 95), 2),
+    }
+
+
+def _measure_in_subprocess(backend: str, args) -> dict:
+    """Każdy backend w świeżym procesie: bez ponownie użytych aren pamięci i importów poprzedniego modelu."""
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, f"{backend}.npz")
+        cmd = [
+            sys.executable, os.path.abspath(__file__),
+            "--measure", backend, "--out", out,
+            "--questions", args.questions, "--repeats", str(args.repeats),
+        ]
+        subprocess.run(cmd, check=True)
+        data = np.load(out, allow_pickle=False)
+        result = json.loads(str(data["stats"]))
+        result["doc_vecs"], result["query_vecs"] = data["doc_vecs"], data["query_vecs"]
+    return result
+
+
+def _top_k(query_vecs: np.ndarray, doc_vecs: np.ndarray, k: int) -> np.ndarray:
+    scores = query_vecs @ doc_vecs.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parytet backendu embeddingów względem fp32 (CPU).")
+    parser.add_argument("--backend", default="int8", help="Backend kandydujący: int8 | onnx | cpu | auto")
+    parser.add_argument("--baseline", default="cpu", help="Backend referencyjny (domyślnie fp32 CPU)")
+    parser.add_argument("--questions", default="tests/questions.jsonl",
+                        help="Pytania benchmarku retrievalu – recall@k liczony na nich, po całym korpusie")
+    parser.add_argument("--k", type=int, default=10, help="k dla recall@k")
+    parser.add_argument("--repeats", type=int, default=3, help="Powtórzenia pomiaru latencji zapytań")
+    parser.add_argument("--measure", default=None, help=argparse.SUPPRESS)  # tryb procesu pomiarowego
+    parser.add_argument("--out", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    corpus = _load_corpus()
+    queries = _load_queries(Path(args.questions))
+
+    if args.measure:
+        result = _measure(args.measure, corpus, queries, args.repeats)
+        stats = {key: v for key, v in result.items() if not key.endswith("_vecs")}
+        np.savez(args.out, doc_vecs=result["doc_vecs"], query_vecs=result["query_vecs"], stats=json.dumps(stats))
+        return
+
+    print(f"📚 Korpus: {len(corpus)} chunków (cały indeks) | pytania benchmarku: {len(queries)}")
+    base = _measure_in_subprocess(args.baseline, args)
+    cand = _measure_in_subprocess(args.backend, args)
+
+    doc_cos = np.sum(base["doc_vecs"] * cand["doc_vecs"], axis=1)
+    query_cos = np.sum(base["query_vecs"] * cand["query_vecs"], axis=1)
+
+    k = min(args.k, len(corpus))
+    base_top = _top_k(base["query_vecs"], base["doc_vecs"], k)
+    cand_top = _top_k(cand["query_vecs"], cand["doc_vecs"], k)
+    recall = [len(set(b) & set(c)) / k for b, c in zip(base_top, cand_top)]
+
+    report = {
+        "baseline": {key: v for key, v in base.items() if not key.endswith("_vecs")},
+        "candidate": {key: v for key, v in cand.items() if not key.endswith("_vecs")},
+        "doc_cosine_mean": round(float(doc_cos.mean()), 4),
+        "doc_cosine_min": round(float(doc_cos.min()), 4),
+        "query_cosine_mean": round(float(query_cos.mean()), 4),
+        f"recall@{k}": round(float(np.mean(recall)), 4),
+        f"recall@{k}_min": round(float(np.min(recall)), 4),
+        "query_speedup_p50": round(base["query_p50_ms"] / cand["query_p50_ms"], 2) if cand["query_p50_ms"] else None,
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
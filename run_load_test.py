@@ -0,0 +1,237 @@
+import argparse
+import json
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from src.embeddings import build_embeddings
+from src.index_manager import _benchmark_retriever, active_db_path, centroid_router_for, open_active_store, xref_graph_for
+from src.llm_client import OllamaClient, PooledChatOllama
+from src.llm_stub import start_stub_server
+from src.load_budget import build_budget_policy
+from src.loadgen import DEFAULT_MIX, QueryGenerator
+from src.metrics import percentile
+from src.prompts import QA_PROMPT, DOCUMENT_PROMPT
+from src.rag_chain import build_rag_chain
+
+
+def init_pipeline(args):
+    server = None
+    if args.real_llm:
+        client = OllamaClient(max_concurrency=args.llm_concurrency)
+    else:
+        server, url = start_stub_server(
+            latency_ms=args.stub_latency_ms,
+            tokens_per_s=args.stub_tokens_per_s,
+            answer_tokens=args.stub_answer_tokens,
+        )
+        print(f"🧪 Stub LLM: {url} | {args.stub_latency_ms} ms + {args.stub_answer_tokens} tok @ {args.stub_tokens_per_s} tok/s")
+        client = OllamaClient(base_url=url, model="stub", max_concurrency=args.llm_concurrency)
+
+    llm = PooledChatOllama(client=client, temperature=0.2)
+    embeddings = build_embeddings()
+    db, _version = open_active_store(embeddings)
+    retriever = _benchmark_retriever(db, centroid_router_for(db, active_db_path()))
+    retriever.budget_policy = build_budget_policy(client, enabled=not args.fixed_budget)
+    retriever.xref_graph = xref_graph_for(db, active_db_path())
+    rag_chain = build_rag_chain(llm, retriever, QA_PROMPT, DOCUMENT_PROMPT)
+    return rag_chain, client, server
+
+
+class HttpChain:
+    """Ten sam interfejs co łańcuch RAG, ale przez HTTP do serve.py (test wieloprocesowego serwowania)."""
+
+    def __init__(self, base_url: str, timeout_s: float = 600.0):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.url = base_url.rstrip("/") + "/ask"
+        self.timeout_s = timeout_s
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=256))
+
+    def invoke(self, inputs: dict) -> dict:
+        resp = self.session.post(
+            self.url, json={"query": inputs["input"], "mode": inputs.get("mode")}, timeout=self.timeout_s
+        )
+        data = resp.json()
+        if not resp.ok:
+            raise RuntimeError(data.get("error") or f"HTTP {resp.status_code}")
+        return {**data, "context": data.get("docs") or []}
+
+
+def _one(rag_chain, kind: str, query: str, mode: str, scheduled: float) -> dict:
+    started = time.perf_counter()
+    record = {"kind": kind, "query": query, "queue_ms": (started - scheduled) * 1000}
+    try:
+        result = rag_chain.invoke({"input": query, "mode": mode})
+        budget = result.get("retrieval_budget") or {}
+        record.update({
+            "path": result.get("path"),
+            "timings": result.get("timings") or {},
+            "docs": len(result.get("context") or []),
+            "budget": budget.get("name"),
+        })
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["latency_ms"] = (time.perf_counter() - scheduled) * 1000
+    return record
+
+
+def run_open_loop(rag_chain, gen: QueryGenerator, qps: float, duration_s: float, mode: str, max_workers: int):
+    """Stałe tempo przychodzenia żądań (niezależne od czasu obsługi) – kolejka rośnie przy przeciążeniu."""
+    records, futures = [], []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        i = 0
+        while True:
+            at = start + i / qps
+            if at - start >= duration_s:
+                break
+            delay = at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            kind, query = gen.next()
+            futures.append(pool.submit(_one, rag_chain, kind, query, mode, at))
+            i += 1
+        for f in futures:
+            records.append(f.result())
+    return records, time.perf_counter() - start
+
+
+def run_closed_loop(rag_chain, gen: QueryGenerator, concurrency: int, duration_s: float, mode: str):
+    """N wirtualnych użytkowników, każdy wysyła kolejne pytanie zaraz po odpowiedzi."""
+    records, lock = [], threading.Lock()
+    start = time.perf_counter()
+    deadline = start + duration_s
+
+    def worker():
+        while time.perf_counter() < deadline:
+            with lock:
+                kind, query = gen.next()
+            rec = _one(rag_chain, kind, query, mode, time.perf_counter())
+            with lock:
+                records.append(rec)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return records, time.perf_counter() - start
+
+
+def _dist(values) -> dict:
+    values = list(values)
+    return {
+        "n": len(values),
+        "p50": round(percentile(values, 50), 1),
+        "p95": round(percentile(values, 95), 1),
+        "p99": round(percentile(values, 99), 1),
+        "max": round(max(values), 1) if values else 0.0,
+    }
+
+
+def summarize(records, wall_s: float, client: Optional[OllamaClient]) -> dict:
+    ok = [r for r in records if "error" not in r]
+    stages = defaultdict(list)
+    for r in ok:
+        for name, ms in r["timings"].items():
+            stages[name].append(ms)
+
+    by_kind = defaultdict(list)
+    for r in ok:
+        by_kind[r["kind"]].append(r["latency_ms"])
+
+    return {
+        "requests": len(records),
+        "errors": len(records) - len(ok),
+        "error_samples": [r["error"] for r in records if "error" in r][:5],
+        "wall_s": round(wall_s, 2),
+        "throughput_rps": round(len(ok) / wall_s, 3) if wall_s else 0.0,
+        "latency_ms": _dist(r["latency_ms"] for r in ok),
+        "client_queue_ms": _dist(r["queue_ms"] for r in ok),
+        "stages_ms": {name: _dist(v) for name, v in sorted(stages.items())},
+        "latency_by_kind_ms": {k: _dist(v) for k, v in sorted(by_kind.items())},
+        "paths": dict(Counter(r.get("path") for r in ok)),
+        "budgets": dict(Counter(r.get("budget") or "n/a" for r in ok)),
+        "llm_client": client.stats() if client is not None else None,
+    }
+
+
+def _parse_mix(spec: str) -> dict:
+    if not spec:
+        return DEFAULT_MIX
+    mix = {}
+    for part in spec.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test obciążeniowy łańcucha RAG z syntetycznymi zapytaniami i stubem LLM.")
+    load = parser.add_mutually_exclusive_group(required=True)
+    load.add_argument("--qps", type=float, help="Otwarta pętla: stałe tempo żądań na sekundę")
+    load.add_argument("--concurrency", type=int, help="Zamknięta pętla: liczba równoległych użytkowników")
+    parser.add_argument("--duration", type=float, default=60.0, help="Czas trwania testu w sekundach")
+    parser.add_argument("--mode", default="auto", choices=["auto", "lookup", "generate"])
+    parser.add_argument("--mix", default="", help="Udział rodzajów zapytań, np. chapter=0.4,alias=0.2,amount=0.3,lookup=0.1")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-workers", type=int, default=64, help="Wątki obsługujące otwartą pętlę")
+    parser.add_argument("--llm-concurrency", type=int, default=2, help="Limit równoległych generacji w kliencie LLM")
+    parser.add_argument("--stub-latency-ms", type=float, default=800.0, help="Stub: czas do pierwszego tokenu")
+    parser.add_argument("--stub-tokens-per-s", type=float, default=25.0, help="Stub: tempo generacji")
+    parser.add_argument("--stub-answer-tokens", type=int, default=250, help="Stub: długość odpowiedzi w tokenach")
+    parser.add_argument("--url", default="", help="Testuj działający serwis (serve.py) zamiast łańcucha w procesie")
+    parser.add_argument("--fixed-budget", action="store_true", help="Wyłącz adaptacyjny budżet retrievalu")
+    parser.add_argument("--real-llm", action="store_true", help="Zamiast stuba użyj SERVER_URL z configu")
+    parser.add_argument("--out", default="", help="Zapisz raport JSON (i surowe rekordy *.records.jsonl)")
+    args = parser.parse_args()
+
+    if args.url:
+        rag_chain, client, server = HttpChain(args.url), None, None
+    else:
+        rag_chain, client, server = init_pipeline(args)
+    gen = QueryGenerator(seed=args.seed, mix=_parse_mix(args.mix))
+
+    if args.qps:
+        records, wall_s = run_open_loop(rag_chain, gen, args.qps, args.duration, args.mode, args.max_workers)
+    else:
+        records, wall_s = run_closed_loop(rag_chain, gen, args.concurrency, args.duration, args.mode)
+
+    report = {
+        "load": {
+            "qps": args.qps,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "mode": args.mode,
+            "adaptive_budget": not args.fixed_budget,
+        },
+        "target": args.url or "in-process",
+        "llm": "service" if args.url else "ollama" if args.real_llm else {
+            "stub_latency_ms": args.stub_latency_ms,
+            "stub_tokens_per_s": args.stub_tokens_per_s,
+            "stub_answer_tokens": args.stub_answer_tokens,
+        },
+        **summarize(records, wall_s, client),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if args.out:
+        out = Path(args.out)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        with out.with_suffix(".records.jsonl").open("w", encoding="utf-8") as f:
+            for r in records:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import argparse
+import json
+import sys
+from collections import Counter, OrderedDict, defaultdict
+from pathlib import Path
+from statistics import mean
+
+from src.metrics import percentile
+
+FALLBACK = "ALL (fallback)"
+
+
+def load_runs(path: Path) -> "OrderedDict[str, list]":
+    """Rekordy z results.jsonl pogrupowane po run_id (w kolejności dopisywania)."""
+    runs: "OrderedDict[str, list]" = OrderedDict()
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            rec = json.loads(line)
+            runs.setdefault(rec.get("run_id") or "unknown", []).append(rec)
+    return runs
+
+
+def _articles(rec: dict) -> set:
+    return {f"{d.get('act_name')}|art. {d.get('article')}" for d in rec.get("docs") or [] if d.get("article")}
+
+
+def _routing_label(rec: dict) -> str:
+    routing = rec.get("routing")
+    if not routing or routing == FALLBACK:
+        return "fallback"
+    return " + ".join(routing) if isinstance(routing, list) else str(routing)
+
+
+def summarize_run(records: list) -> dict:
+    lat = [r.get("elapsed_ms") or 0 for r in records]
+    stages = defaultdict(list)
+    for r in records:
+        for name, ms in (r.get("timings") or {}).items():
+            stages[name].append(ms)
+
+    first = records[0]
+    return {
+        "model": first.get("model"),
+        "retriever_k": first.get("retriever_k"),
+        "questions": len(records),
+        "latency_ms": {
+            "p50": percentile(lat, 50),
+            "p95": percentile(lat, 95),
+            "p99": percentile(lat, 99),
+            "mean": round(mean(lat), 1) if lat else 0.0,
+        },
+        "stages_p95_ms": {name: round(percentile(v, 95), 1) for name, v in sorted(stages.items())},
+        "answer_chars_mean": round(mean(len(r.get("answer") or "") for r in records), 1),
+        "docs_per_answer": round(mean(len(r.get("docs") or []) for r in records), 2),
+        "no_docs": sum(1 for r in records if not r.get("docs")),
+        "routing": dict(Counter(_routing_label(r) for r in records).most_common()),
+        "routing_source": dict(Counter(r.get("routing_source") or "n/a" for r in records)),
+        "path": dict(Counter(r.get("path") or "n/a" for r in records)),
+    }
+
+
+def diff_runs(base: list, cand: list) -> dict:
+    """Porównanie per id pytania: opóźnienie, liczba dokumentów, zmienione artykuły, routing."""
+    base_by_id = {r.get("id"): r for r in base}
+    rows = []
+    for r in cand:
+        b = base_by_id.get(r.get("id"))
+        if b is None:
+            continue
+        a_base, a_cand = _articles(b), _articles(r)
+        union = a_base | a_cand
+        rows.append({
+            "id": r.get("id"),
+            "query": r.get("query"),
+            "elapsed_ms": [b.get("elapsed_ms"), r.get("elapsed_ms")],
+            "delta_ms": (r.get("elapsed_ms") or 0) - (b.get("elapsed_ms") or 0),
+            "docs": [len(b.get("docs") or []), len(r.get("docs") or [])],
+            "article_overlap": round(len(a_base & a_cand) / len(union), 3) if union else 1.0,
+            "articles_added": sorted(a_cand - a_base),
+            "articles_removed": sorted(a_base - a_cand),
+            "routing_changed": _routing_label(b) != _routing_label(r),
+            "routing": [_routing_label(b), _routing_label(r)],
+        })
+    return {
+        "matched": len(rows),
+        "only_in_base": sorted(set(base_by_id) - {r.get("id") for r in cand}, key=str),
+        "mean_article_overlap": round(mean(x["article_overlap"] for x in rows), 3) if rows else 1.0,
+        "lost_all_docs": [x["id"] for x in rows if x["docs"][0] and not x["docs"][1]],
+        "routing_changed": [x["id"] for x in rows if x["routing_changed"]],
+        "questions": rows,
+    }
+
+
+def check_regressions(base_sum: dict, cand_sum: dict, diff: dict, args) -> list:
+    """Lista opisów przekroczonych progów (pusta = brak regresji)."""
+    problems = []
+    for q in ("p50", "p95"):
+        b, c = base_sum["latency_ms"][q], cand_sum["latency_ms"][q]
+        limit_pct = getattr(args, f"max_{q}_increase_pct")
+        # Drobne zmiany bezwzględne ignorujemy – przy kilkunastu pytaniach to szum
+        if b and c - b > args.min_latency_delta_ms and (c - b) / b * 100 > limit_pct:
+            problems.append(f"latency {q}: {b:.0f} -> {c:.0f} ms (+{(c - b) / b * 100:.0f}% > {limit_pct:.0f}%)")
+
+    if diff["mean_article_overlap"] < args.min_article_overlap:
+        problems.append(
+            f"retrieval: średnie pokrycie artykułów {diff['mean_article_overlap']:.2f} < {args.min_article_overlap:.2f}"
+        )
+    if len(diff["lost_all_docs"]) > args.max_lost_docs:
+        problems.append(f"retrieval: pytania bez dokumentów (wcześniej z): {', '.join(map(str, diff['lost_all_docs']))}")
+
+    drop = base_sum["docs_per_answer"] - cand_sum["docs_per_answer"]
+    if drop > args.max_docs_drop:
+        problems.append(
+            f"retrieval: dokumentów na odpowiedź {base_sum['docs_per_answer']} -> {cand_sum['docs_per_answer']}"
+        )
+    return problems
+
+
+def _print_summary(run_id: str, s: dict):
+    lat = s["latency_ms"]
+    print(f"\n=== {run_id} | {s['model']} | k={s['retriever_k']} | pytań: {s['questions']} ===")
+    print(f"  latency ms: p50={lat['p50']:.0f} p95={lat['p95']:.0f} p99={lat['p99']:.0f} mean={lat['mean']:.0f}")
+    if s["stages_p95_ms"]:
+        print("  p95 etapów: " + ", ".join(f"{k}={v:.0f}" for k, v in s["stages_p95_ms"].items()))
+    print(f"  odpowiedź: {s['answer_chars_mean']:.0f} znaków | dokumentów: {s['docs_per_answer']} | bez dokumentów: {s['no_docs']}")
+    print(f"  routing: {s['routing']}")
+    if any(k != "n/a" for k in s["routing_source"]):
+        print(f"  źródło routingu: {s['routing_source']}")
+    if any(k != "n/a" for k in s["path"]):
+        print(f"  ścieżka: {s['path']}")
+
+
+def _print_diff(diff: dict, top: int):
+    print(f"\n--- Porównanie per pytanie ({diff['matched']} wspólnych) ---")
+    print(f"  średnie pokrycie artykułów: {diff['mean_article_overlap']:.2f}")
+    if diff["only_in_base"]:
+        print(f"  brak w kandydacie: {', '.join(map(str, diff['only_in_base']))}")
+    if diff["routing_changed"]:
+        print(f"  zmieniony routing: {', '.join(map(str, diff['routing_changed']))}")
+
+    slowest = sorted(diff["questions"], key=lambda x: -x["delta_ms"])[:top]
+    print("\n  Największe wzrosty opóźnienia:")
+    for x in slowest:
+        print(f"    {x['id']}: {x['elapsed_ms'][0]} -> {x['elapsed_ms'][1]} ms ({x['delta_ms']:+d})")
+
+    changed = [x for x in diff["questions"] if x["articles_added"] or x["articles_removed"]]
+    changed.sort(key=lambda x: x["article_overlap"])
+    if changed:
+        print(f"\n  Zmienione artykuły ({len(changed)} pytań):")
+        for x in changed[:top]:
+            print(f"    {x['id']} (pokrycie {x['article_overlap']:.2f}) {x['query']}")
+            if x["articles_removed"]:
+                print(f"      - {', '.join(x['articles_removed'])}")
+            if x["articles_added"]:
+                print(f"      + {', '.join(x['articles_added'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Raport wydajności i regresji między przebiegami run_batch_tests.")
+    parser.add_argument("--results", default="tests/results.jsonl", help="Plik wyników JSONL")
+    parser.add_argument("--base", default="", help="run_id bazowy (domyślnie przedostatni)")
+    parser.add_argument("--candidate", default="", help="run_id porównywany (domyślnie ostatni)")
+    parser.add_argument("--list", action="store_true", help="Tylko podsumowanie wszystkich przebiegów")
+    parser.add_argument("--top", type=int, default=10, help="Ile pytań pokazać w zestawieniach")
+    parser.add_argument("--json", dest="json_out", default="", help="Zapisz raport JSON")
+    # Progi bramki
+    parser.add_argument("--max-p50-increase-pct", type=float, default=25.0)
+    parser.add_argument("--max-p95-increase-pct", type=float, default=25.0)
+    parser.add_argument("--min-latency-delta-ms", type=float, default=250.0,
+                        help="Wzrosty poniżej tej wartości nie są regresją")
+    parser.add_argument("--min-article-overlap", type=float, default=0.7,
+                        help="Minimalne średnie pokrycie (Jaccard) pobranych artykułów")
+    parser.add_argument("--max-lost-docs", type=int, default=0,
+                        help="Ile pytań może stracić wszystkie dokumenty")
+    parser.add_argument("--max-docs-drop", type=float, default=1.0,
+                        help="Dopuszczalny spadek średniej liczby dokumentów na odpowiedź")
+    args = parser.parse_args()
+
+    path = Path(args.results)
+    if not path.exists():
+        raise FileNotFoundError(f"Brak pliku wyników: {path}")
+    runs = load_runs(path)
+    summaries = {run_id: summarize_run(records) for run_id, records in runs.items()}
+
+    if args.list or (len(runs) < 2 and not (args.base and args.candidate)):
+        for run_id, s in summaries.items():
+            _print_summary(run_id, s)
+        if not args.list:
+            print("\nℹ️ Tylko jeden przebieg – brak porównania.")
+        return 0
+
+    ids = list(runs)
+    base_id = args.base or ids[-2]
+    cand_id = args.candidate or ids[-1]
+    for run_id in (base_id, cand_id):
+        if run_id not in runs:
+            raise SystemExit(f"Nieznany run_id: {run_id} (dostępne: {', '.join(ids)})")
+
+    diff = diff_runs(runs[base_id], runs[cand_id])
+    problems = check_regressions(summaries[base_id], summaries[cand_id], diff, args)
+
+    _print_summary(base_id, summaries[base_id])
+    _print_summary(cand_id, summaries[cand_id])
+    _print_diff(diff, args.top)
+
+    if args.json_out:
+        report = {
+            "base": {"run_id": base_id, **summaries[base_id]},
+            "candidate": {"run_id": cand_id, **summaries[cand_id]},
+            "diff": diff,
+            "regressions": problems,
+        }
+        Path(args.json_out).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    if problems:
+        print("\n❌ Regresje:")
+        for p in problems:
+            print(f"  - {p}")
+        return 1
+    print("\n✅ Brak regresji względem przebiegu bazowego.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
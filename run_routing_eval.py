@@ -0,0 +1,83 @@
+import argparse
+import json
+import time
+from pathlib import Path
+
+from src.centroid_router import CentroidRouter
+from src.embeddings import build_embeddings
+from src.index_manager import open_active_store, active_db_path
+from src.metrics import percentile
+from src.routing import route_act_names
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Trafność routingu po centroidach na pytaniach testowych. "
+                    "Złoty standard: pole 'expected_acts' w JSONL, a gdy go brak – routing aliasowy "
+                    "(wtedy pytania pominięte przez aliasy nie są oceniane – stąd osobna trafność na nich)."
+    )
+    parser.add_argument("--in", dest="in_path", default="tests/questions.jsonl")
+    parser.add_argument("--max-acts", type=int, default=2)
+    args = parser.parse_args()
+
+    embeddings = build_embeddings()
+    db, _version = open_active_store(embeddings)
+    router = CentroidRouter.load_or_build(db, active_db_path())
+
+    rows, route_us = [], []
+    with Path(args.in_path).open("r", encoding="utf-8") as fin:
+        for line in fin:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            query = item["query"]
+
+            alias_acts = route_act_names(query, max_acts=args.max_acts)
+            gold = item.get("expected_acts") or alias_acts
+
+            qvec = embeddings.embed_query(query)
+            t0 = time.perf_counter()
+            acts, _scores = router.route(qvec, max_acts=args.max_acts)
+            route_us.append((time.perf_counter() - t0) * 1e6)
+
+            rows.append({
+                "id": item.get("id"),
+                "query": query,
+                "gold": gold,
+                "gold_source": "expected_acts" if item.get("expected_acts") else ("aliases" if alias_acts else None),
+                "alias_acts": alias_acts,
+                "centroid_acts": acts,
+                "top3": router.top_acts(qvec, 3),
+                "correct": bool(acts and gold and acts[0] in gold),
+            })
+
+    labelled = [r for r in rows if r["gold"]]
+    confident = [r for r in labelled if r["centroid_acts"]]
+    # Pytania, których aliasy nie rozpoznały – tu centroidy faktycznie decydują o routingu
+    misses = [r for r in rows if not r["alias_acts"]]
+    misses_labelled = [r for r in misses if r["gold_source"] == "expected_acts"]
+    summary = {
+        "questions": len(rows),
+        "labelled": len(labelled),
+        "coverage": round(len(confident) / len(labelled), 3) if labelled else None,
+        "accuracy_when_confident": round(sum(r["correct"] for r in confident) / len(confident), 3) if confident else None,
+        "accuracy_overall": round(sum(r["correct"] for r in labelled) / len(labelled), 3) if labelled else None,
+        "alias_misses": len(misses),
+        "alias_misses_routed": sum(1 for r in misses if r["centroid_acts"]),
+        "alias_misses_labelled": len(misses_labelled),
+        "accuracy_on_alias_misses": (
+            round(sum(r["correct"] for r in misses_labelled) / len(misses_labelled), 3) if misses_labelled else None
+        ),
+        "route_p95_us": round(percentile(route_us, 95), 1),
+    }
+
+    for r in rows:
+        mark = "✅" if r["correct"] else ("·" if not r["gold"] else "❌")
+        print(f"{mark} {r['id']} | gold={r['gold'] or '-'} | aliasy={r['alias_acts'] or '-'} | "
+              f"centroid={r['centroid_acts'] or 'ALL'} | top3={r['top3']}")
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
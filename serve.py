@@ -0,0 +1,317 @@
+"""
+Serwowanie wieloprocesowe (HTTP JSON):
+  POST /ask     {"query": "...", "mode": "auto"} -> odpowiedź, ścieżka, czasy etapów, dokumenty
+  GET  /health  – pid, wersja indeksu, RSS/PSS procesu, statystyki klienta LLM, postęp rozgrzewki
+
+Nadzorca:
+  1) przygotowuje snapshot aktywnej wersji indeksu (jednorazowo, w osobnym procesie),
+  2) startuje jeden proces embeddingów (jedyna kopia modelu),
+  3) otwiera gniazdo i forkuje N workerów, które przyjmują połączenia z tego samego gniazda.
+Workery mapują snapshot tylko do odczytu – strony współdzieli OS, Chroma nie jest otwierana.
+Snapshot dotyczy wersji aktywnej przy starcie; po publikacji nowej wersji serwis restartujemy.
+Po starcie każdy worker odtwarza w tle najczęstsze pytania z logu (src.warmup), żeby p95 zaraz
+po wdrożeniu nie odbiegało od stanu ustalonego.
+
+Uruchomienie: python serve.py --workers 4 --port 8000
+"""
+import os
+
+# Jeden wątek BLAS na worker – skalujemy procesami, nie wątkami w każdym procesie.
+# Musi być ustawione przed importem numpy; proces embeddingów przywraca pełną liczbę wątków.
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
+import argparse
+import json
+import multiprocessing
+import socket
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.config import (
+    INDEX_ROOT,
+    RETRIEVER_K,
+    SERVER_URL,
+    LLM_MAX_CONCURRENCY,
+    SERVE_HOST,
+    SERVE_PORT,
+    SERVE_WORKERS,
+    EMBED_SERVER_PORT,
+    QUERY_LOG_ENABLED,
+)
+from src.dedup import duplicate_pointers
+from src.embedding_server import RemoteEmbeddings, serve_forever as serve_embeddings, wait_until_ready
+from src.index_manager import active_db_path, active_version, centroid_router_for, xref_graph_for
+from src.metrics import pss_mb, rss_mb
+from src.snapshot_store import (
+    MmapSnapshotStore,
+    export_snapshot,
+    read_manifest,
+    snapshot_dir_for,
+    snapshot_is_current,
+    source_fingerprint,
+)
+from src.warmup import CacheWarmer, QueryEmbeddingCache, QueryLog
+
+
+def _doc_to_dict(doc, max_preview_chars: int = 500):
+    meta = doc.metadata or {}
+    text = (doc.page_content or "").strip()
+    return {
+        "id": doc.id,
+        "act_name": meta.get("act_name"),
+        "article": meta.get("article"),
+        "paragraph": meta.get("paragraph"),
+        "duplicates": duplicate_pointers(doc),
+        "preview": text[:max_preview_chars] + ("..." if len(text) > max_preview_chars else ""),
+    }
+
+
+# ============================================================
+#  PRZYGOTOWANIE (nadzorca)
+# ============================================================
+
+def _prepare_snapshot(db_path: str, version, embed_url: str):
+    """W osobnym procesie: eksport Chroma -> snapshot, centroidy routingu i graf odwołań (cache w katalogu wersji)."""
+    from src.vectorstore import open_vector_store
+
+    snapshot_dir = snapshot_dir_for(db_path)
+    # Odcisk danych, nie tylko wersja: bez publikacji wersji (version=None) ingestia do chroma_db
+    # też musi odświeżyć snapshot
+    if not snapshot_is_current(read_manifest(snapshot_dir), db_path, version):
+        source = source_fingerprint(db_path)
+        export_snapshot(open_vector_store(None, db_path), snapshot_dir, version=version, source=source)
+    snapshot = MmapSnapshotStore(RemoteEmbeddings(embed_url), snapshot_dir)
+    centroid_router_for(snapshot, db_path)
+    xref_graph_for(snapshot, db_path)
+
+
+# ============================================================
+#  WORKER
+# ============================================================
+
+def _make_handler(state: dict):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, payload: dict, status: int = 200):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if not self.path.startswith("/health"):
+                self._send({"error": "not found"}, 404)
+                return
+            self._send({
+                "worker": state["worker_id"],
+                "pid": os.getpid(),
+                "index_version": state["version"],
+                "chunks": len(state["db"]),
+                "rss_mb": round(rss_mb(), 1),
+                "pss_mb": round(pss_mb(), 1),
+                "llm": state["llm"].client.stats(),
+                "query_cache": state["embeddings"].stats(),
+                "warmup": state["warmer"].progress() if state["warmer"] else None,
+            })
+
+        def do_POST(self):
+            if not self.path.startswith("/ask"):
+                self._send({"error": "not found"}, 404)
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            data = json.loads(self.rfile.read(length) or b"{}")
+            query = (data.get("query") or "").strip()
+            if not query:
+                self._send({"error": "Brak pola 'query'."}, 400)
+                return
+            try:
+                result = state["rag_chain"].invoke({"input": query, "mode": data.get("mode") or "auto"})
+            except ValueError as e:
+                self._send({"error": str(e)}, 400)
+                return
+            except Exception as e:
+                self._send({"error": f"{type(e).__name__}: {e}"}, 500)
+                return
+            self._send({
+                "answer": (result.get("answer") or "").strip(),
+                "path": result.get("path"),
+                "timings": result.get("timings"),
+                "retrieval_budget": result.get("retrieval_budget"),
+                "routing": (result.get("trace") or {}).get("routing"),
+                "docs": [_doc_to_dict(d) for d in result.get("context") or []],
+                "worker": state["worker_id"],
+            })
+
+    return Handler
+
+
+def _run_worker(sock: socket.socket, worker_id: int, snapshot_dir: str, db_path: str, version,
+                embed_url: str, llm_url: str, llm_concurrency: int, llm_slots=None, llm_waiting=None):
+    from src.llm_client import build_llm
+    from src.load_budget import build_budget_policy
+    from src.prompts import QA_PROMPT, DOCUMENT_PROMPT
+    from src.rag_chain import build_rag_chain
+    from src.routing_retriever import ActRoutingRetriever
+
+    embeddings = QueryEmbeddingCache(RemoteEmbeddings(embed_url))
+    db = MmapSnapshotStore(embeddings, snapshot_dir)
+    # Rozgrzewka modelu w Ollamie wystarczy raz (robi ją worker 0)
+    llm = build_llm(
+        temperature=0.2,
+        warm_up=worker_id == 0,
+        base_url=llm_url,
+        max_concurrency=llm_concurrency,
+        slots=llm_slots,
+        waiting=llm_waiting,
+    )
+    retriever = ActRoutingRetriever(
+        vectorstore=db,
+        k=RETRIEVER_K,
+        max_acts=2,
+        debug=False,
+        search_type="mmr",
+        fetch_k=60,
+        lambda_mult=0.6,
+        enable_sanction_filter=True,
+        sanction_k=6,
+        centroid_router=centroid_router_for(db, db_path),
+        xref_graph=xref_graph_for(db, db_path),
+        budget_policy=build_budget_policy(llm.client),
+    )
+    query_log = QueryLog() if QUERY_LOG_ENABLED else None
+    rag_chain = build_rag_chain(llm, retriever, QA_PROMPT, DOCUMENT_PROMPT, query_log=query_log)
+    warmer = None
+    if query_log is not None:
+        # Cache są per proces, więc retrieval rozgrzewa każdy worker; generację (wspólna Ollama) – tylko worker 0
+        warmer = CacheWarmer(
+            retriever,
+            query_log,
+            rag_chain=rag_chain if worker_id == 0 else None,
+            llm_client=llm.client,
+            query_cache=embeddings,
+            label=f" (worker {worker_id})",
+        )
+    state = {
+        "worker_id": worker_id,
+        "version": version,
+        "db": db,
+        "embeddings": embeddings,
+        "llm": llm,
+        "rag_chain": rag_chain,
+        "warmer": warmer,
+    }
+
+    server = ThreadingHTTPServer(sock.getsockname()[:2], _make_handler(state), bind_and_activate=False)
+    server.socket.close()
+    server.socket = sock  # wspólne gniazdo nasłuchujące – jądro rozdziela połączenia między workery
+    server.daemon_threads = True
+    print(f"👷 Worker {worker_id} (pid {os.getpid()}) gotowy | RSS {rss_mb():.0f} MB, PSS {pss_mb():.0f} MB")
+    if warmer is not None:
+        warmer.start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+# ============================================================
+#  NADZORCA
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Serwowanie RAG w wielu procesach na współdzielonym snapshocie indeksu.")
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS, help="Liczba workerów (0 = liczba rdzeni)")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--embed-port", type=int, default=EMBED_SERVER_PORT)
+    parser.add_argument("--llm-url", default=SERVER_URL, help="Adres Ollamy (albo stuba: python -m src.llm_stub)")
+    parser.add_argument("--llm-concurrency", type=int, default=LLM_MAX_CONCURRENCY,
+                        help="Łączny limit równoległych generacji (jeden semafor wspólny dla wszystkich workerów)")
+    parser.add_argument("--root", default=INDEX_ROOT)
+    args = parser.parse_args()
+
+    workers = args.workers or os.cpu_count() or 1
+    if "fork" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("fork")
+    else:
+        # Bez fork nie przekażemy gniazda nasłuchującego – jeden worker w tym procesie
+        ctx = None
+        if workers > 1:
+            print("⚠️ Platforma bez fork() – uruchamiam jeden worker.")
+        workers = 1
+
+    db_path = active_db_path(args.root)
+    version = active_version(args.root)
+    embed_url = f"http://{args.host}:{args.embed_port}"
+    spawn = ctx or multiprocessing.get_context()
+
+    # 1) proces embeddingów – jedyny, który ładuje model
+    embedder = spawn.Process(
+        target=serve_embeddings, args=(args.host, args.embed_port, os.cpu_count() or 1), name="embeddings"
+    )
+    embedder.start()
+    if not wait_until_ready(embed_url):
+        embedder.terminate()
+        raise SystemExit("❌ Serwer embeddingów nie wystartował.")
+
+    # 2) snapshot + centroidy (osobny proces: Chroma nie zostaje w pamięci nadzorcy przed forkiem)
+    prep = spawn.Process(target=_prepare_snapshot, args=(db_path, version, embed_url), name="snapshot")
+    prep.start()
+    prep.join()
+    if prep.exitcode != 0:
+        embedder.terminate()
+        raise SystemExit("❌ Nie udało się przygotować snapshotu indeksu.")
+    snapshot_dir = snapshot_dir_for(db_path)
+
+    # 3) gniazdo nasłuchujące + workery
+    sock = socket.create_server((args.host, args.port), backlog=128)
+    # Limit generacji wspólny dla wszystkich workerów: semafor tworzony przed forkiem
+    # razem z licznikiem czekających – budżet retrievalu widzi kolejkę całego serwisu, nie jednego workera
+    llm_slots = ctx.BoundedSemaphore(args.llm_concurrency) if ctx is not None else None
+    llm_waiting = ctx.Value("i", 0) if ctx is not None else None
+    worker_args = (
+        snapshot_dir, db_path, version, embed_url, args.llm_url, args.llm_concurrency, llm_slots, llm_waiting
+    )
+    print(f"🚀 {workers} workerów na http://{args.host}:{args.port} | snapshot: {snapshot_dir} | "
+          f"LLM: {args.llm_concurrency} slot(y) łącznie")
+
+    # Log pytań kompaktujemy przed forkiem – potem dopisują do niego wszystkie workery
+    if QUERY_LOG_ENABLED:
+        dropped = QueryLog().compact()
+        if dropped:
+            print(f"🧹 Log pytań: usunięto {dropped} najstarszych wpisów")
+
+    if ctx is None:
+        try:
+            _run_worker(sock, 0, *worker_args)
+        finally:
+            embedder.terminate()
+        return
+
+    procs = [ctx.Process(target=_run_worker, args=(sock, i, *worker_args), name=f"worker-{i}") for i in range(workers)]
+    for p in procs:
+        p.start()
+    try:
+        while all(p.is_alive() for p in procs) and embedder.is_alive():
+            time.sleep(1)
+        print("⚠️ Jeden z procesów zakończył działanie – zatrzymuję serwis.")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs + [embedder]:
+            if p.is_alive():
+                p.terminate()
+        for p in procs + [embedder]:
+            p.join(timeout=5)
+        sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# src/centroid_router.py
+"""
+Drugi etap routingu: gdy aliasy z ACTS nic nie dopasują, porównujemy embedding
+pytania z centroidami rozdziałów (act_name + chapter) i zawężamy wyszukiwanie
+do najlepszych aktów. Wynik aktu = maksimum po jego rozdziałach, liczone jednym
+iloczynem macierzowym.
+"""
+import os
+from typing import List, Tuple
+
+import numpy as np
+
+from src.config import (
+    CENTROID_FILE,
+    CENTROID_MIN_SCORE,
+    CENTROID_MARGIN,
+)
+from src.numpy_store import normalize_rows
+from src.snapshot_store import source_fingerprint
+
+
+class CentroidRouter:
+    def __init__(self, act_names: List[str], group_acts: np.ndarray, centroids: np.ndarray, n_chunks: int,
+                 source: str = ""):
+        self.act_names = list(act_names)     # unikalne akty (kolejność = indeks w group_acts)
+        self.group_acts = group_acts         # dla każdego centroidu: indeks aktu, posortowane rosnąco
+        self.centroids = centroids           # (grupy x dim), znormalizowane
+        self.n_chunks = n_chunks
+        self.source = source                 # odcisk danych bazy (source_fingerprint), z których liczono
+        self._starts = np.flatnonzero(np.r_[True, group_acts[1:] != group_acts[:-1]])
+
+    # --- budowa ---
+
+    @classmethod
+    def build(cls, db, batch_size: int = 5000) -> "CentroidRouter":
+        sums = {}
+        counts = {}
+        offset = 0
+        while True:
+            raw = db.get(include=["embeddings", "metadatas"], limit=batch_size, offset=offset)
+            ids = raw.get("ids") or []
+            if not ids:
+                break
+            vecs = normalize_rows(np.asarray(raw["embeddings"], dtype=np.float32))
+            for vec, meta in zip(vecs, raw.get("metadatas") or []):
+                meta = meta or {}
+                key = (meta.get("act_name") or "", str(meta.get("chapter") or ""))
+                if key in sums:
+                    sums[key] += vec
+                else:
+                    sums[key] = vec.copy()
+                counts[key] = counts.get(key, 0) + 1
+            offset += len(ids)
+
+        keys = sorted(k for k in sums if k[0])
+        act_names = sorted({a for a, _ in keys})
+        act_index = {a: i for i, a in enumerate(act_names)}
+        group_acts = np.array([act_index[a] for a, _ in keys], dtype=np.int32)
+        centroids = normalize_rows(np.vstack([sums[k] / counts[k] for k in keys])) if keys else np.zeros((0, 0))
+        return cls(act_names, group_acts, centroids.astype(np.float32), offset)
+
+    def save(self, path: str) -> None:
+        np.savez(
+            path,
+            act_names=np.array(self.act_names, dtype=object),
+            group_acts=self.group_acts,
+            centroids=self.centroids,
+            n_chunks=np.array(self.n_chunks),
+            source=np.array(self.source),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "CentroidRouter":
+        data = np.load(path, allow_pickle=True)
+        source = str(data["source"]) if "source" in data.files else ""
+        return cls(list(data["act_names"]), data["group_acts"], data["centroids"], int(data["n_chunks"]), source)
+
+    @classmethod
+    def load_or_build(cls, db, db_path: str) -> "CentroidRouter":
+        """
+        Centroidy liczone raz na wersję indeksu; cache w katalogu bazy, unieważniany przy zmianie
+        danych (odcisk dziennika ingestii – nowelizacja aktu nie musi zmienić liczby chunków).
+        """
+        path = os.path.join(db_path, CENTROID_FILE)
+        source = source_fingerprint(db_path)
+        n_chunks = db._collection.count() if hasattr(db, "_collection") else len(db)
+        if os.path.exists(path):
+            try:
+                router = cls.load(path)
+                if router.source == source and router.n_chunks == n_chunks:
+                    return router
+            except Exception as e:
+                print(f"⚠️ Nie udało się wczytać centroidów ({e}) – przeliczam.")
+        router = cls.build(db)
+        router.source = source
+        try:
+            router.save(path)
+        except OSError as e:
+            print(f"⚠️ Nie udało się zapisać centroidów: {e}")
+        print(f"🧭 Centroidy routingu: {len(router.centroids)} rozdziałów w {len(router.act_names)} aktach.")
+        return router
+
+    # --- routing ---
+
+    def scores(self, query_vec) -> np.ndarray:
+        """Podobieństwo kosinusowe pytania do każdego aktu (max po rozdziałach)."""
+        if not len(self.centroids):
+            return np.zeros(0, dtype=np.float32)
+        q = normalize_rows(np.asarray(query_vec, dtype=np.float32))
+        return np.maximum.reduceat(self.centroids @ q, self._starts)
+
+    def route(self, query_vec, max_acts: int = 2) -> Tuple[List[str], List[float]]:
+        """
+        Zwraca akty, których wynik mieści się w CENTROID_MARGIN od najlepszego.
+        Brak pewności (za niski wynik albo zbyt wielu bliskich kandydatów) -> [] (fallback na cały korpus).
+        """
+        s = self.scores(query_vec)
+        if not len(s):
+            return [], []
+        order = np.argsort(-s)
+        best = float(s[order[0]])
+        close = [int(i) for i in order if best - float(s[i]) <= CENTROID_MARGIN]
+        if best < CENTROID_MIN_SCORE or len(close) > max_acts:
+            return [], [round(float(s[i]), 4) for i in order[:max_acts]]
+        return [self.act_names[i] for i in close], [round(float(s[i]), 4) for i in close]
+
+    def top_acts(self, query_vec, n: int = 3) -> List[Tuple[str, float]]:
+        s = self.scores(query_vec)
+        return [(self.act_names[i], round(float(s[i]), 4)) for i in np.argsort(-s)[:n]]
+
@@ -0,0 +1,234 @@
+# src/compressed_store.py
+"""
+Kompresja wektorów indeksu:
+  1) redukcja wymiaru: PCA albo obcięcie (Matryoshka) do COMPRESSION_DIM,
+  2) kwantyzacja pierwszego przebiegu: int8 (skala per wymiar) albo binarna (znak, Hamming),
+  3) dokładny rescoring COMPRESSION_RESCORE_CANDIDATES najlepszych kandydatów
+     na pełnych wektorach fp32 (w RAM albo w np.memmap na dysku).
+
+Serwowanie (open_compressed_store) nie otwiera Chroma: pełne wektory to memmap
+COMPRESSION_FULL_VECTORS_FILE, a id, teksty i metadane (z kolumnami filtrów) pochodzą
+ze snapshotu indeksu (src.snapshot_store). Zgodność pliku wektorów ze snapshotem
+sprawdzamy po liczbie wierszy i sumie kontrolnej zapisanych obok, bez porównywania macierzy.
+
+Uwaga: paraphrase-multilingual-mpnet-base-v2 nie był trenowany jako model
+Matryoshka, więc "truncate" traci więcej niż PCA – decyduje benchmark
+(run_compression_benchmark.py).
+"""
+import json
+import os
+from typing import Any, Optional, Tuple
+
+import numpy as np
+
+from src.config import (
+    COMPRESSION_METHOD,
+    COMPRESSION_DIM,
+    COMPRESSION_QUANTIZATION,
+    COMPRESSION_RESCORE_CANDIDATES,
+    COMPRESSION_FULL_VECTORS_FILE,
+)
+from src.numpy_store import NumpyVectorStore, export_chroma, vectors_checksum
+from src.snapshot_store import open_snapshot_store
+
+# popcount dla bajtu – odległość Hamminga na spakowanych bitach
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+_SCORE_BLOCK = 16384  # wiersze int8 dekwantyzowane blokami, żeby nie trzymać kopii fp32
+
+
+def _full_vectors_meta_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".json"
+
+
+def write_full_vectors(vectors: np.ndarray, path: str) -> dict:
+    """
+    Zapis atomowy (plik tymczasowy + os.replace). Procesy, które mają zmapowany poprzedni plik,
+    czytają dalej stary i-węzeł – nic nie jest obcinane pod działającym memmapem.
+    Obok zapisuje liczbę wierszy, wymiar i sumę kontrolną (plik .json) – zwraca je.
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+    os.replace(tmp, path)
+
+    meta = {
+        "count": int(len(vectors)),
+        "dim": int(vectors.shape[1]) if len(vectors) else 0,
+        "sha1": vectors_checksum(vectors),
+    }
+    meta_path = _full_vectors_meta_path(path)
+    with open(f"{meta_path}.{os.getpid()}.tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(f"{meta_path}.{os.getpid()}.tmp", meta_path)
+    return meta
+
+
+def full_vectors_match(path: str, count: int, sha1: Optional[str]) -> bool:
+    """Czy plik pełnych wektorów istnieje i według zapisanych obok danych zawiera te wektory."""
+    meta_path = _full_vectors_meta_path(path)
+    if not sha1 or not os.path.exists(path) or not os.path.exists(meta_path):
+        return False
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return meta.get("count") == count and meta.get("sha1") == sha1
+
+
+class CompressedVectorStore(NumpyVectorStore):
+    def __init__(
+        self,
+        embeddings,
+        ids,
+        vectors,
+        texts,
+        metadatas,
+        method: Optional[str] = COMPRESSION_METHOD,
+        dim: int = COMPRESSION_DIM,
+        quantization: Optional[str] = COMPRESSION_QUANTIZATION,
+        rescore_candidates: int = COMPRESSION_RESCORE_CANDIDATES,
+        mask_source: Any = None,
+    ):
+        """
+        vectors – pełne wektory fp32 do rescoringu: macierz w RAM albo np.memmap (strony wczytuje OS).
+        mask_source – opcjonalny store z własnym _mask (MmapSnapshotStore: maski z kolumn kodów).
+        """
+        if not isinstance(vectors, np.memmap):
+            vectors = np.asarray(vectors, dtype=np.float32)
+
+        super().__init__(embeddings, ids, vectors, texts, metadatas)
+        self.method = method
+        self.quantization = quantization
+        self.rescore_candidates = rescore_candidates
+        self._mask_source = mask_source
+
+        self._mean, self._projection = self._fit_projection(vectors, method, dim)
+        projected = self._project_blocks(vectors)
+        self.dim = projected.shape[1]
+        self._codes, self._scale, self._code_sq_norms = self._quantize(projected)
+
+    def _mask(self, where: Optional[dict]) -> Optional[np.ndarray]:
+        if self._mask_source is not None:
+            return self._mask_source._mask(where)
+        return super()._mask(where)
+
+    # --- redukcja wymiaru ---
+
+    @staticmethod
+    def _fit_projection(vectors: np.ndarray, method: Optional[str], dim: int) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """(średnia, macierz rzutu full_dim x dim); None = bez redukcji wymiaru."""
+        full_dim = vectors.shape[1] if vectors.ndim == 2 else 0
+        mean = np.zeros(full_dim, dtype=np.float32)
+        if not 0 < dim < full_dim:
+            return mean, None
+        if method == "pca":
+            sample = np.asarray(vectors[:: max(1, len(vectors) // 20000)], dtype=np.float32)
+            mean = sample.mean(axis=0)
+            _, _, vt = np.linalg.svd(sample - mean, full_matrices=False)
+            return mean, vt[:dim].T.astype(np.float32)
+        if method == "truncate":
+            return mean, np.eye(full_dim, dim, dtype=np.float32)
+        return mean, None
+
+    def _project(self, m: np.ndarray) -> np.ndarray:
+        m = np.asarray(m, dtype=np.float32) - self._mean
+        return m @ self._projection if self._projection is not None else m
+
+    def _project_blocks(self, vectors: np.ndarray) -> np.ndarray:
+        """Rzut blokami – bez pełnej kopii fp32 macierzy z memmapu."""
+        if not len(vectors):
+            return self._project(vectors)
+        return np.concatenate(
+            [self._project(vectors[start : start + _SCORE_BLOCK]) for start in range(0, len(vectors), _SCORE_BLOCK)]
+        )
+
+    # --- kwantyzacja ---
+
+    def _quantize(self, projected: np.ndarray):
+        if self.quantization == "int8":
+            scale = np.maximum(np.abs(projected).max(axis=0), 1e-12) / 127.0
+            codes = np.clip(np.round(projected / scale), -127, 127).astype(np.int8)
+            deq = codes.astype(np.float32) * scale
+            return codes, scale.astype(np.float32), np.einsum("ij,ij->i", deq, deq)
+        if self.quantization == "binary":
+            return np.packbits(projected > 0, axis=1), None, None
+        return projected.astype(np.float32), None, np.einsum("ij,ij->i", projected, projected)
+
+    def _first_pass_scores(self, query_vec: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        q = self._project(query_vec)
+        codes = self._codes if rows is None else self._codes[rows]
+
+        if self.quantization == "binary":
+            q_bits = np.packbits(q > 0)
+            return -_POPCOUNT[np.bitwise_xor(codes, q_bits)].sum(axis=1, dtype=np.int32).astype(np.float32)
+
+        sq_norms = self._code_sq_norms if rows is None else self._code_sq_norms[rows]
+        if self.quantization == "int8":
+            qs = q * self._scale
+            dots = np.empty(len(codes), dtype=np.float32)
+            for start in range(0, len(codes), _SCORE_BLOCK):
+                block = codes[start : start + _SCORE_BLOCK].astype(np.float32)
+                dots[start : start + _SCORE_BLOCK] = block @ qs
+            return 2.0 * dots - sq_norms
+        return 2.0 * (codes @ q) - sq_norms
+
+    def _candidates(self, query_vec: np.ndarray, n: int, where: Optional[dict]):
+        mask = self._mask(where)
+        rows = np.flatnonzero(mask) if mask is not None else None
+        approx = self._first_pass_scores(query_vec, rows)
+        if len(approx) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        m = min(max(n, self.rescore_candidates), len(approx))
+        top = np.argpartition(-approx, m - 1)[:m]
+        cand = np.sort(rows[top] if rows is not None else top)  # posortowane = sekwencyjny odczyt memmap
+
+        exact = self._exact_scores(query_vec, cand)
+        n = min(n, len(cand))
+        best = np.argsort(-exact)[:n]
+        return cand[best], exact[best]
+
+    # --- raport ---
+
+    def memory_report(self) -> dict:
+        n = len(self.ids)
+        full_dim = self.vectors.shape[1] if n else 0
+        return {
+            "chunks": n,
+            "full_fp32_mb": round(n * full_dim * 4 / 2**20, 2),
+            "first_pass_mb": round(self._codes.nbytes / 2**20, 2),
+            "method": self.method,
+            "dim": self.dim,
+            "quantization": self.quantization,
+            "rescore_candidates": self.rescore_candidates,
+        }
+
+
+def compress_store(db, embeddings, **kwargs) -> CompressedVectorStore:
+    """Skompresowany widok na kolekcję Chroma z wektorami w RAM (benchmarki)."""
+    ids, vectors, texts, metas = export_chroma(db)
+    store = CompressedVectorStore(embeddings, ids, vectors, texts, metas, **kwargs)
+    print(f"🗜️  Skompresowany indeks: {store.memory_report()}")
+    return store
+
+
+def open_compressed_store(embeddings, db_path: str, build_from=None, version: Optional[str] = None, **kwargs):
+    """
+    Skompresowany indeks do serwowania: snapshot (id, teksty, metadane, kolumny filtrów) +
+    memmap pełnych wektorów. build_from (Chroma) jest potrzebny tylko, gdy snapshot jest nieaktualny.
+    Plik pełnych wektorów niezgodny ze snapshotem odtwarzamy strumieniowo z wektorów snapshotu.
+    """
+    snapshot = open_snapshot_store(embeddings, db_path, build_from=build_from, version=version)
+    full_path = os.path.join(db_path, COMPRESSION_FULL_VECTORS_FILE)
+    if not full_vectors_match(full_path, snapshot.manifest["count"], snapshot.manifest.get("vectors_sha1")):
+        print(f"🔄 Odtwarzam {full_path} ze snapshotu indeksu.")
+        write_full_vectors(snapshot.vectors, full_path)
+    vectors = np.load(full_path, mmap_mode="r")
+
+    store = CompressedVectorStore(
+        embeddings, snapshot.ids, vectors, snapshot.texts, snapshot.metadatas, mask_source=snapshot, **kwargs
+    )
+    print(f"🗜️  Skompresowany indeks: {store.memory_report()}")
+    return store
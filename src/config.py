@@ -2,9 +2,106 @@
 DOCS_PATH = "./documents"
 DB_PATH = "./chroma_db"
 EMBEDDING_MODEL = "paraphrase-multilingual-mpnet-base-v2"
+EMBEDDING_BACKEND = "auto"   # "auto" (CUDA -> CPU), "cpu", "int8", "onnx" – porównanie: run_embedding_parity.py
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
 DEBUG = True
 SERVER_URL = "http://127.0.0.1:11434"
 MODEL_NAME = "gemma3:27b-it-q4_K_M"
-RETRIEVER_K = 10
\ No newline at end of file
+RETRIEVER_K = 10
+
+# Ingestia: dziennik postępu i rozmiar batcha (checkpoint po każdym batchu)
+INGEST_JOURNAL_FILE = "ingest_journal.json"
+INGEST_BATCH_SIZE = 256
+
+# Wersjonowane indeksy (blue/green): katalog wersji, wskaźnik aktywnej wersji
+INDEX_ROOT = "./indexes"
+INDEX_POINTER_FILE = "CURRENT.json"
+INDEX_KEEP_VERSIONS = 3          # ile wersji trzymać na dysku (rollback)
+INDEX_WATCH_INTERVAL_S = 30      # co ile sekund serwis sprawdza wskaźnik
+INDEX_VERIFY_MAX_P95_MS = 2000   # próg p95 retrievalu przy weryfikacji nowej wersji
+
+# Embedding przy ingestii: batche kubełkowane po długości w tokenach
+EMBED_BATCH_SIZE = 32
+EMBED_OVERLONG_POLICY = "flag"   # "flag" (tylko raport) albo "split" (docięcie chunków do limitu modelu)
+
+# Kompresja wektorów (opcjonalna): redukcja wymiaru + kwantyzacja + rescoring na pełnych wektorach
+COMPRESSION_ENABLED = False
+COMPRESSION_METHOD = "pca"           # "pca", "truncate" albo None (bez redukcji wymiaru)
+COMPRESSION_DIM = 256
+COMPRESSION_QUANTIZATION = "int8"    # "int8", "binary" albo None (fp32)
+COMPRESSION_RESCORE_CANDIDATES = 200 # ilu kandydatów z pierwszego przebiegu liczymy dokładnie
+COMPRESSION_FULL_VECTORS_FILE = "full_vectors.npy"  # memmap pełnych wektorów (w katalogu bazy)
+
+# Routing po centroidach (gdy aliasy z ACTS nic nie dopasują)
+CENTROID_ROUTING = True
+CENTROID_FILE = "act_centroids.npz"  # cache centroidów w katalogu bazy
+CENTROID_MIN_SCORE = 0.35            # minimalne podobieństwo kosinusowe najlepszego aktu
+CENTROID_MARGIN = 0.03               # akty w tej odległości od najlepszego traktujemy jako remis
+
+# Klient LLM: pula połączeń, limit równoległości, timeouty, keep_alive modelu w Ollamie
+LLM_MAX_CONCURRENCY = 2      # ile generacji naraz wysyłamy do Ollamy (reszta czeka w kolejce)
+LLM_POOL_SIZE = 8            # połączenia HTTP keep-alive w puli
+LLM_CONNECT_TIMEOUT_S = 5
+LLM_TIMEOUT_S = 180          # timeout odczytu pojedynczej generacji
+LLM_RETRIES = 2              # ponowienia przy błędach połączenia / 502-504
+LLM_KEEP_ALIVE = "30m"       # jak długo Ollama trzyma model w pamięci
+
+# Adaptacyjny budżet retrievalu pod obciążeniem (mniejsze k / fetch_k, MMR -> similarity)
+ADAPTIVE_BUDGET = True
+BUDGET_QUEUE_HIGH = 3        # tylu czekających na slot LLM = poziom "reduced" (2x = "minimal")
+BUDGET_SLO_P95_MS = 30000    # SLO p95 czasu odpowiedzi; przekroczenie = "reduced" (1.5x = "minimal")
+BUDGET_WINDOW_S = 120        # okno czasowe, z którego liczymy p95
+BUDGET_MIN_SAMPLES = 5       # poniżej tylu pomiarów w oknie ignorujemy sygnał latencji
+BUDGET_COOLDOWN_S = 30       # minimalny czas na poziomie przed powrotem o jeden poziom w dół
+
+# Serwowanie wieloprocesowe: snapshot indeksu mapowany do pamięci + osobny proces embeddingów
+SNAPSHOT_DIR = "snapshot"                 # katalog snapshotu w katalogu wersji indeksu
+SNAPSHOT_FILTER_COLUMNS = ("act_name", "article", "paragraph")  # pola filtrów jako kolumny kodów
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8000
+SERVE_WORKERS = 0                         # 0 = liczba rdzeni
+EMBED_SERVER_PORT = 8100
+EMBED_MAX_BATCH = 32                      # ile zapytań z różnych workerów łączyć w jeden batch
+EMBED_BATCH_WAIT_MS = 5                   # ile czekać na dobranie batcha
+EMBED_TIMEOUT_S = 30
+
+# Cache retrievalu w obrębie sesji czatu (pytania uzupełniające)
+SESSION_CACHE_MAX_DOCS = 30     # ile fragmentów trzymać w kontekście sesji
+SESSION_CACHE_MIN_SIM = 0.30    # minimalne podobieństwo kosinusowe fragmentu do pytania, by go ponownie użyć
+SESSION_CACHE_MIN_REUSE = 4     # tyle trafnych fragmentów w cache = bez nowego wyszukiwania
+SESSION_TOPIC_MIN_SIM = 0.60    # podobieństwo pytania do poprzedniego poniżej progu = zmiana tematu
+SESSION_TOPIC_MIN_BEST_SIM = 0.50  # najlepszy fragment z cache poniżej progu = zmiana tematu
+
+# Pliki wgrane w czacie: tymczasowy indeks w pamięci sesji (nigdy nie trafia do chroma_db)
+UPLOAD_MAX_SESSION_MB = 64      # limit pamięci indeksu jednej sesji (najstarsze pliki są usuwane)
+UPLOAD_MAX_TOTAL_MB = 512       # limit dla wszystkich sesji (usuwane najdawniej używane sesje)
+UPLOAD_SESSION_TTL_S = 3600     # po tylu sekundach bez aktywności indeks sesji jest zwalniany
+UPLOAD_K = 4                    # ile fragmentów z załączników dokładać do kontekstu
+UPLOAD_MIN_SIM = 0.25           # minimalne podobieństwo kosinusowe fragmentu załącznika do pytania
+UPLOAD_QUERY_WAIT_S = 15        # ile pytanie czeka na pliki wysłane w tej samej wiadomości
+UPLOAD_OCR_LANG = "pol"         # język OCR dla obrazów (pytesseract)
+
+# Deduplikacja prawie identycznych chunków przy ingestii (MinHash/LSH, w obrębie jednego pliku)
+DEDUP_ENABLED = True
+DEDUP_THRESHOLD = 0.9       # minimalne szacowane podobieństwo Jaccarda (shingle słów), by zwinąć chunk
+DEDUP_NUM_PERM = 128        # długość podpisu MinHash
+DEDUP_BANDS = 32            # pasma LSH (DEDUP_NUM_PERM / DEDUP_BANDS wierszy na pasmo)
+DEDUP_SHINGLE = 5           # długość shingla w słowach
+
+# Graf odwołań między przepisami (art. X § Y): przywołane przepisy dociągane po id, bez wyszukiwania
+XREF_ENABLED = True
+XREF_FILE = "xref_graph.json"   # w katalogu bazy; liczony przy ingestii
+XREF_MAX_DOCS = 3               # ile przywołanych fragmentów dokładać do kontekstu (poziom "full")
+XREF_CHUNKS_PER_REF = 1         # ile fragmentów jednego przywołanego przepisu
+
+# Rozgrzewka po starcie: log zanonimizowanych pytań + odtworzenie najczęstszych (routing, embedding, retrieval)
+QUERY_LOG_ENABLED = True
+QUERY_LOG_PATH = "./logs/query_log.jsonl"
+QUERY_LOG_MAX_LINES = 50000     # częstości liczymy z tylu ostatnich wpisów (starsze usuwa kompaktowanie)
+QUERY_LOG_MAX_CHARS = 300       # dłuższych pytań (opisy spraw, dane osobowe) nie zapisujemy
+QUERY_CACHE_SIZE = 2048         # cache wektorów pytań (LRU) w procesie serwującym
+WARMUP_TOP_N = 50               # ile najczęstszych pytań odtworzyć po starcie
+WARMUP_MIN_COUNT = 2            # pytań zadanych tylko raz nie odtwarzamy
+WARMUP_GENERATE_TOP_N = 0       # ile z nich przepuścić w tle przez LLM (0 = bez generacji)
+WARMUP_IDLE_WAIT_S = 2.0        # generacja w tle czeka, aż klient LLM będzie bezczynny
@@ -0,0 +1,198 @@
+# src/dedup.py
+"""
+Deduplikacja prawie identycznych chunków przy ingestii (MinHash + LSH).
+Kodeksy powtarzają dużo tekstu ("§ 1. (uchylony)", odnośniki do dyrektyw UE,
+te same ustępy w różnych artykułach), a CHUNK_OVERLAP dokłada kolejne powtórki.
+Duplikaty zajmują miejsce w indeksie i sloty kandydatów MMR.
+
+  - podpis MinHash liczony z shingli słów treści (bez nagłówka "USTAWA / DZIAŁ / ..."),
+  - LSH (DEDUP_BANDS pasm) wskazuje kandydatów, próg sprawdzany na całych podpisach,
+  - z grupy zostaje pierwszy chunk (reprezentant), pozostałe trafiają do listy
+    wskaźników w metadanych reprezentanta (JSON w polu "duplicates"),
+  - chunki różnych artykułów zwijamy tylko przy identycznej treści (po normalizacji białych
+    znaków) – inaczej "Art. 84." i "Art. 96." o tej samej treści, ale w różnych rozdziałach,
+    stałyby się jednym przepisem z błędnym numerem,
+  - deduplikujemy w obrębie jednego pliku, więc filtr po act_name działa jak dotąd.
+"""
+import json
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.config import DEDUP_THRESHOLD, DEDUP_NUM_PERM, DEDUP_BANDS, DEDUP_SHINGLE
+
+DUPLICATES_KEY = "duplicates"          # JSON: [{"id", "article", "paragraph", "page"}, ...]
+HAS_DUPLICATES_KEY = "has_duplicates"  # bool – do filtrowania reprezentantów w Chroma
+_POINTER_FIELDS = ("article", "paragraph", "page")
+
+_PRIME = np.uint64(4294967311)  # > 2^32, hashe shingli to crc32
+_WORD = re.compile(r"\w+")
+_HEADER_END = re.compile(r"^TREŚĆ(?: PRZEPISU)?:[ \t]*\n", re.MULTILINE)
+_SPACES = re.compile(r"\s+")
+
+
+def split_header(text: str) -> Tuple[str, str]:
+    """
+    (nagłówek, treść): nagłówek z nazwą aktu i struktury kończy się ostatnią linią "TREŚĆ PRZEPISU:"
+    (przy ingestii są dwa: nasz i z parsera). Bez nagłówka – ("", text).
+    """
+    last = None
+    for last in _HEADER_END.finditer(text):
+        pass
+    return (text[:last.end()], text[last.end():]) if last else ("", text)
+
+
+def _body(text: str) -> str:
+    return split_header(text)[1]
+
+
+def _exact_body(text: str) -> str:
+    return _SPACES.sub(" ", _body(text)).strip()
+
+
+class MinHasher:
+    """Podpisy MinHash (num_perm permutacji postaci (a*x + b) mod p), deterministyczne między procesami."""
+
+    def __init__(self, num_perm: int = DEDUP_NUM_PERM, shingle: int = DEDUP_SHINGLE, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, 1 << 31, num_perm).astype(np.uint64)
+        self.b = rng.randint(0, 1 << 31, num_perm).astype(np.uint64)
+        self.shingle = shingle
+
+    def signature(self, text: str) -> np.ndarray:
+        words = _WORD.findall(_body(text).lower())
+        k = self.shingle
+        shingles = {" ".join(words[i:i + k]) for i in range(max(1, len(words) - k + 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64)
+        return ((hashes[:, None] * self.a + self.b) % _PRIME).min(axis=0)
+
+
+def find_duplicates(
+    texts: List[str],
+    threshold: float = DEDUP_THRESHOLD,
+    num_perm: int = DEDUP_NUM_PERM,
+    bands: int = DEDUP_BANDS,
+    articles: Optional[List[Optional[str]]] = None,
+) -> Dict[int, List[int]]:
+    """
+    Zwraca {indeks reprezentanta: [indeksy duplikatów]}.
+    Reprezentantem jest najwcześniejszy chunk; duplikat musi spełniać próg względem
+    reprezentanta (bez łańcuchów A~B~C, w których A i C są już różne).
+    articles – numery artykułów chunków; przy różnych artykułach wymagana identyczna treść.
+    """
+    if len(texts) < 2:
+        return {}
+    hasher = MinHasher(num_perm)
+    sigs = np.stack([hasher.signature(t) for t in texts])
+    rows = num_perm // bands
+
+    buckets: Dict[Tuple[int, bytes], List[int]] = defaultdict(list)
+    for i, sig in enumerate(sigs):
+        for b in range(bands):
+            buckets[(b, sig[b * rows:(b + 1) * rows].tobytes())].append(i)
+
+    candidates: Dict[int, set] = defaultdict(set)
+    for members in buckets.values():
+        if len(members) > 1:
+            for i in members:
+                candidates[i].update(members)
+
+    groups: Dict[int, List[int]] = {}
+    assigned = set()
+    for i in range(len(texts)):
+        if i in assigned or i not in candidates:
+            continue
+        dups = [
+            j for j in sorted(candidates[i])
+            if j > i and j not in assigned and float(np.mean(sigs[i] == sigs[j])) >= threshold
+            and (articles is None or articles[i] == articles[j] or _exact_body(texts[i]) == _exact_body(texts[j]))
+        ]  # średnia zgodność podpisów = estymator podobieństwa Jaccarda
+        if dups:
+            groups[i] = dups
+            assigned.update(dups)
+    return groups
+
+
+def collapse_near_duplicates(
+    chunks: List[Document],
+    ids: List[str],
+    threshold: float = DEDUP_THRESHOLD,
+) -> Tuple[List[Document], List[str], dict]:
+    """
+    Usuwa prawie-duplikaty; reprezentant dostaje listę wskaźników do usuniętych chunków.
+    Zwraca (chunki, id, raport). Id pozostałych chunków się nie zmieniają.
+    """
+    groups = find_duplicates(
+        [c.page_content for c in chunks],
+        threshold,
+        articles=[(c.metadata or {}).get("article") for c in chunks],
+    )
+    dropped = {j for dups in groups.values() for j in dups}
+
+    kept_chunks: List[Document] = []
+    kept_ids: List[str] = []
+    for i, (chunk, chunk_id) in enumerate(zip(chunks, ids)):
+        if i in dropped:
+            continue
+        if i in groups:
+            pointers = []
+            for j in groups[i]:
+                meta = chunks[j].metadata or {}
+                pointers.append({"id": ids[j], **{f: meta.get(f) for f in _POINTER_FIELDS if meta.get(f) is not None}})
+            chunk = Document(
+                page_content=chunk.page_content,
+                metadata={
+                    **chunk.metadata,
+                    DUPLICATES_KEY: json.dumps(pointers, ensure_ascii=False),
+                    HAS_DUPLICATES_KEY: True,
+                },
+            )
+        kept_chunks.append(chunk)
+        kept_ids.append(chunk_id)
+
+    removed_chars = sum(len(chunks[j].page_content) for j in dropped)
+    report = {
+        "chunks_before": len(chunks),
+        "chunks_after": len(kept_chunks),
+        "removed": len(dropped),
+        "groups": len(groups),
+        "largest_group": max((len(d) + 1 for d in groups.values()), default=0),
+        "removed_chars": removed_chars,
+        "shrink_pct": round(100.0 * len(dropped) / len(chunks), 2) if chunks else 0.0,
+    }
+    return kept_chunks, kept_ids, report
+
+
+def duplicate_pointers(doc: Document) -> List[dict]:
+    """Lista wskaźników do zwiniętych duplikatów (pusta, gdy chunk nie jest reprezentantem)."""
+    raw = (doc.metadata or {}).get(DUPLICATES_KEY)
+    if not raw:
+        return []
+    try:
+        pointers = json.loads(raw)
+    except (TypeError, ValueError):
+        return []
+    return pointers if isinstance(pointers, list) else []
+
+
+def expand_pointer(doc: Document, pointer: dict) -> Document:
+    """Dokument duplikatu odtworzony z reprezentanta (tekst reprezentanta, metadane duplikatu)."""
+    meta = {k: v for k, v in (doc.metadata or {}).items() if k not in (DUPLICATES_KEY, HAS_DUPLICATES_KEY)}
+    meta.update({f: pointer[f] for f in _POINTER_FIELDS if f in pointer})
+    meta["duplicate_of"] = doc.id
+    return Document(page_content=doc.page_content, metadata=meta, id=pointer.get("id"))
+
+
+def format_shrink_report(report: dict, dim: Optional[int] = None) -> str:
+    line = (
+        f"{report['chunks_before']} -> {report['chunks_after']} chunków "
+        f"(-{report['removed']}, -{report['shrink_pct']}%) | grup: {report['groups']}, "
+        f"największa: {report['largest_group']}"
+    )
+    if dim:
+        line += f" | wektory: -{report['removed'] * dim * 4 / (1024 * 1024):.1f} MB"
+    return line
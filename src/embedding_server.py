@@ -0,0 +1,187 @@
+# src/embedding_server.py
+"""
+Dedykowany proces embeddingów dla serwowania wieloprocesowego:
+  POST /embed   {"texts": [...]} -> {"vectors": [[...], ...]}
+  GET  /health  – gotowość + statystyki batchowania
+Model jest ładowany raz (jedna kopia w pamięci), a zapytania z wielu workerów
+są łączone w mikro-batche (EMBED_MAX_BATCH, EMBED_BATCH_WAIT_MS).
+RemoteEmbeddings to klient (interfejs Embeddings z LangChain) używany przez workery.
+
+Uruchomienie samodzielne: python -m src.embedding_server --port 8100
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+
+import requests
+from langchain_core.embeddings import Embeddings
+
+from src.config import SERVE_HOST, EMBED_SERVER_PORT, EMBED_MAX_BATCH, EMBED_BATCH_WAIT_MS, EMBED_TIMEOUT_S
+
+
+class MicroBatcher:
+    """Zbiera teksty z równoległych żądań i liczy je jednym wywołaniem embed_documents."""
+
+    def __init__(self, embeddings: Embeddings, max_batch: int = EMBED_MAX_BATCH, wait_ms: float = EMBED_BATCH_WAIT_MS):
+        self.embeddings = embeddings
+        self.max_batch = max_batch
+        self.wait_s = wait_ms / 1000.0
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self.stats = {"texts": 0, "batches": 0, "max_batch_seen": 0}
+        threading.Thread(target=self._loop, name="embed-batcher", daemon=True).start()
+
+    def submit(self, texts: List[str]) -> List[List[float]]:
+        futures = []
+        for text in texts:
+            fut: Future = Future()
+            self._queue.put((text, fut))
+            futures.append(fut)
+        return [f.result() for f in futures]
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.wait_s
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                vectors = self.embeddings.embed_documents([text for text, _ in batch])
+                for (_, fut), vec in zip(batch, vectors):
+                    fut.set_result(list(vec))
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+            self.stats["texts"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(batch))
+
+
+def _make_handler(batcher: MicroBatcher):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, payload: dict, status: int = 200):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.startswith("/health"):
+                self._send({"ready": True, **batcher.stats})
+            else:
+                self._send({"error": "not found"}, 404)
+
+        def do_POST(self):
+            if not self.path.startswith("/embed"):
+                self._send({"error": "not found"}, 404)
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            data = json.loads(self.rfile.read(length) or b"{}")
+            try:
+                self._send({"vectors": batcher.submit(list(data.get("texts") or []))})
+            except Exception as e:
+                self._send({"error": f"{type(e).__name__}: {e}"}, 500)
+
+    return Handler
+
+
+def start_embedding_server(embeddings: Embeddings, host: str = SERVE_HOST, port: int = EMBED_SERVER_PORT):
+    """Startuje serwer w wątku w tle. Zwraca (serwer, base_url)."""
+    batcher = MicroBatcher(embeddings)
+    server = ThreadingHTTPServer((host, port), _make_handler(batcher))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="embedding-server", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+class RemoteEmbeddings(Embeddings):
+    """Klient serwera embeddingów; jedna sesja HTTP (keep-alive) na proces."""
+
+    def __init__(self, base_url: str, timeout_s: float = EMBED_TIMEOUT_S):
+        self.base_url = base_url.rstrip("/")
+        self.timeout_s = timeout_s
+        self.session = requests.Session()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        resp = self.session.post(f"{self.base_url}/embed", json={"texts": list(texts)}, timeout=self.timeout_s)
+        resp.raise_for_status()
+        return resp.json()["vectors"]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def wait_until_ready(base_url: str, timeout_s: float = 300.0) -> bool:
+    """Czeka, aż serwer embeddingów odpowie na /health (ładowanie modelu trwa)."""
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base_url.rstrip('/')}/health", timeout=2).ok:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def _use_threads(num_threads: int) -> None:
+    """
+    Limity wątków BLAS/OpenMP dziedziczone po nadzorcy (serve.py ustawia 1 wątek na worker)
+    zastępujemy pełną liczbą – ten proces liczy embeddingi zapytań wszystkich workerów.
+    """
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(num_threads)
+    try:
+        import torch
+
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+
+def serve_forever(host: str = SERVE_HOST, port: int = EMBED_SERVER_PORT, num_threads: Optional[int] = None):
+    """
+    Punkt wejścia procesu embeddingów (model ładowany dopiero tutaj).
+    num_threads – liczba wątków obliczeń modelu (None = bez zmian względem środowiska).
+    """
+    from src.embeddings import build_embeddings
+
+    if num_threads:
+        _use_threads(num_threads)
+    server, url = start_embedding_server(build_embeddings(), host, port)
+    print(f"🧠 Serwer embeddingów działa na {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dedykowany serwer embeddingów (serwowanie wieloprocesowe).")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=EMBED_SERVER_PORT)
+    args = parser.parse_args()
+    serve_forever(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
+import time
+from typing import Any, List, Optional
+
+from langchain_core.embeddings import Embeddings
 from langchain_huggingface import HuggingFaceEmbeddings
-from src.config import EMBEDDING_MODEL
+from src.config import EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBED_BATCH_SIZE
 
-def build_embeddings():
+def _build_auto():
     try:
         emb = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL, model_kwargs={"device": "cuda"})
         _ = emb.embed_query("test")
@@ -9,7 +13,167 @@ def build_embeddings():
         return emb
     except Exception as e:
         print(f"⚠️ CUDA niedostępna: {e}. Przełączam na CPU...")
-        emb = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL, model_kwargs={"device": "cpu"})
+        return _build_cpu()
+
+
+def _build_cpu():
+    emb = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL, model_kwargs={"device": "cpu"})
+    _ = emb.embed_query("test")
+    print("✅ Embeddings na CPU.")
+    return emb
+
+
+def _build_int8():
+    """Ten sam model fp32 na CPU + dynamiczna kwantyzacja warstw Linear do int8 (torch)."""
+    import torch
+
+    emb = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL, model_kwargs={"device": "cpu"})
+    torch.ao.quantization.quantize_dynamic(
+        emb._client, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+    )
+    _ = emb.embed_query("test")
+    print("✅ Embeddings na CPU (int8, dynamiczna kwantyzacja).")
+    return emb
+
+
+def _build_onnx():
+    """
+    Backend ONNX Runtime z sentence-transformers (wymaga optimum + onnxruntime).
+    Gdy eksport/wczytanie się nie uda (np. brak sieci i brak gotowego model.onnx),
+    spadamy na int8.
+    """
+    try:
+        emb = HuggingFaceEmbeddings(
+            model_name=EMBEDDING_MODEL,
+            model_kwargs={"device": "cpu", "backend": "onnx"},
+        )
         _ = emb.embed_query("test")
-        print("✅ Embeddings na CPU.")
+        print("✅ Embeddings na CPU (ONNX Runtime).")
         return emb
+    except Exception as e:
+        print(f"⚠️ Backend ONNX niedostępny: {e}. Przełączam na int8...")
+        return _build_int8()
+
+
+_BACKENDS = {
+    "auto": _build_auto,
+    "cpu": _build_cpu,
+    "int8": _build_int8,
+    "onnx": _build_onnx,
+}
+
+
+def build_embeddings(backend: str = EMBEDDING_BACKEND):
+    """
+    backend:
+      - "auto": CUDA, a jeśli niedostępna – CPU fp32
+      - "cpu":  CPU fp32
+      - "int8": CPU z dynamiczną kwantyzacją int8
+      - "onnx": ONNX Runtime (fallback: int8)
+    """
+    if backend not in _BACKENDS:
+        raise ValueError(f"Nieznany backend embeddingów: {backend} (dostępne: {', '.join(_BACKENDS)})")
+    return _BACKENDS[backend]()
+
+
+def sentence_transformer(embeddings) -> Optional[Any]:
+    """Model SentenceTransformer schowany w HuggingFaceEmbeddings (albo None dla innych backendów)."""
+    client = getattr(embeddings, "_client", None)
+    if client is None or not hasattr(client, "tokenizer"):
+        return None
+    return client
+
+
+def token_lengths(embeddings, texts: List[str]) -> Optional[List[int]]:
+    """Długości tekstów w tokenach modelu (z tokenami specjalnymi, bez obcinania)."""
+    model = sentence_transformer(embeddings)
+    if model is None:
+        return None
+    encoded = model.tokenizer(list(texts), add_special_tokens=True, truncation=False)
+    return [len(ids) for ids in encoded["input_ids"]]
+
+
+class BucketedEmbeddings(Embeddings):
+    """
+    Wrapper na embeddingi używany przy ingestii:
+      - pre-tokenizuje teksty i sortuje je po długości w tokenach,
+      - liczy batche z tekstów o podobnej długości (mniej paddingu),
+      - wynik wraca w oryginalnej kolejności, więc wektory są identyczne,
+      - zlicza chunki dłuższe niż max_seq_length (model je obcina).
+    Statystyki (padding, tokeny/s) zbiera do report(). Punkt odniesienia to padding samego
+    SentenceTransformer.encode, które też sortuje teksty – ale po długości w znakach, nie w tokenach.
+    """
+
+    def __init__(self, base: Embeddings, batch_size: int = EMBED_BATCH_SIZE):
+        self.base = base
+        self.batch_size = batch_size
+        model = sentence_transformer(base)
+        self.max_tokens: Optional[int] = getattr(model, "max_seq_length", None) if model else None
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.stats = {
+            "texts": 0,
+            "tokens": 0,
+            "padded_tokens": 0,
+            "encode_padded_tokens": 0,
+            "overlong": 0,
+            "seconds": 0.0,
+        }
+
+    def _padded(self, lengths: List[int]) -> int:
+        return sum(
+            max(lengths[i : i + self.batch_size]) * len(lengths[i : i + self.batch_size])
+            for i in range(0, len(lengths), self.batch_size)
+        )
+
+    def _encode_padded(self, texts: List[str], lengths: List[int]) -> int:
+        """Padding, jaki dałoby jedno wywołanie encode: malejąco po liczbie znaków, batche z encode_kwargs."""
+        batch = (getattr(self.base, "encode_kwargs", None) or {}).get("batch_size", 32)
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        return sum(
+            max(lengths[i] for i in order[start : start + batch]) * len(order[start : start + batch])
+            for start in range(0, len(order), batch)
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = list(texts)
+        raw_lengths = token_lengths(self.base, texts)
+        if raw_lengths is None or not texts:
+            return self.base.embed_documents(texts)
+
+        limit = self.max_tokens or max(raw_lengths)
+        lengths = [min(n, limit) for n in raw_lengths]
+        order = sorted(range(len(texts)), key=lambda i: lengths[i])
+
+        t0 = time.perf_counter()
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start : start + self.batch_size]
+            for i, vec in zip(idx, self.base.embed_documents([texts[i] for i in idx])):
+                vectors[i] = vec
+
+        self.stats["seconds"] += time.perf_counter() - t0
+        self.stats["texts"] += len(texts)
+        self.stats["tokens"] += sum(lengths)
+        self.stats["padded_tokens"] += self._padded([lengths[i] for i in order])
+        self.stats["encode_padded_tokens"] += self._encode_padded(texts, lengths)
+        self.stats["overlong"] += sum(1 for n in raw_lengths if n > limit)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.base.embed_query(text)
+
+    def report(self) -> dict:
+        s = self.stats
+        padded = s["padded_tokens"] or 1
+        encode = s["encode_padded_tokens"] or 1
+        return {
+            "texts": s["texts"],
+            "tokens": s["tokens"],
+            "padding_ratio": round(1 - s["tokens"] / padded, 3),
+            "padding_ratio_encode": round(1 - s["tokens"] / encode, 3),
+            "tokens_per_s": round(s["tokens"] / s["seconds"], 1) if s["seconds"] else 0.0,
+            "overlong": s["overlong"],
+            "max_tokens": self.max_tokens,
+        }
@@ -0,0 +1,425 @@
+# src/index_manager.py
+"""
+Wersjonowane indeksy (blue/green):
+  INDEX_ROOT/v<data_czas>/      – osobny katalog Chroma dla każdej wersji
+  INDEX_ROOT/INDEX_POINTER_FILE – wskaźnik na aktywną wersję (podmieniany atomowo)
+
+Nowa wersja jest budowana obok działającej, weryfikowana, a dopiero potem
+publikowana. Serwis podmienia vectorstore w retrieverze w locie (IndexWatcher),
+stare wersje zostają na dysku do rollbacku.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Tuple
+
+from src.config import (
+    DB_PATH,
+    DOCS_PATH,
+    CENTROID_ROUTING,
+    XREF_ENABLED,
+    COMPRESSION_ENABLED,
+    COMPRESSION_FULL_VECTORS_FILE,
+    INDEX_ROOT,
+    INDEX_POINTER_FILE,
+    INDEX_KEEP_VERSIONS,
+    INDEX_WATCH_INTERVAL_S,
+    INDEX_VERIFY_MAX_P95_MS,
+    RETRIEVER_K,
+)
+from src.metrics import percentile
+from src.vectorstore import build_vector_store, open_vector_store, is_index_complete
+
+VERIFY_REPORT_FILE = "verify_report.json"
+
+
+# ============================================================
+#  WSKAŹNIK AKTYWNEJ WERSJI
+# ============================================================
+
+def _pointer_path(root: str) -> str:
+    return os.path.join(root, INDEX_POINTER_FILE)
+
+
+def read_pointer(root: str = INDEX_ROOT) -> Optional[dict]:
+    path = _pointer_path(root)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            pointer = json.load(f)
+        return pointer if isinstance(pointer, dict) and pointer.get("version") else None
+    except Exception as e:
+        print(f"⚠️ Nie udało się odczytać wskaźnika indeksu ({e}).")
+        return None
+
+
+def _write_pointer(pointer: dict, root: str) -> None:
+    """os.replace jest atomowy: czytelnik widzi starą albo nową wersję, nigdy połowę pliku."""
+    os.makedirs(root, exist_ok=True)
+    path = _pointer_path(root)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(pointer, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def version_path(version: str, root: str = INDEX_ROOT) -> str:
+    return os.path.join(root, version)
+
+
+def active_version(root: str = INDEX_ROOT) -> Optional[str]:
+    pointer = read_pointer(root)
+    return pointer["version"] if pointer else None
+
+
+def active_db_path(root: str = INDEX_ROOT) -> str:
+    """Katalog aktywnej wersji; bez wskaźnika – klasyczny DB_PATH."""
+    version = active_version(root)
+    return version_path(version, root) if version else DB_PATH
+
+
+def list_versions(root: str = INDEX_ROOT) -> List[str]:
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        d for d in os.listdir(root)
+        if d.startswith("v") and os.path.isdir(os.path.join(root, d))
+    )
+
+
+# ============================================================
+#  BUDOWA / WERYFIKACJA / PUBLIKACJA
+# ============================================================
+
+def build_version(embeddings, root: str = INDEX_ROOT, docs_path: str = DOCS_PATH) -> str:
+    """Buduje nową wersję w osobnym katalogu – aktywny indeks nie jest dotykany."""
+    version = "v" + datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = version_path(version, root)
+    print(f"🏗️  Buduję nową wersję indeksu: {path}")
+    db, _ = build_vector_store(embeddings, db_path=path, docs_path=docs_path)
+    if COMPRESSION_ENABLED:
+        # Pełne wektory do rescoringu zapisujemy raz, przy budowie; serwowanie tylko je mapuje
+        from src.compressed_store import write_full_vectors
+        from src.numpy_store import export_chroma
+
+        write_full_vectors(export_chroma(db)[1], os.path.join(path, COMPRESSION_FULL_VECTORS_FILE))
+    return version
+
+
+def _benchmark_retriever(db, centroid_router=None):
+    # Te same parametry co w serwisie, żeby benchmark mierzył realną ścieżkę.
+    from src.routing_retriever import ActRoutingRetriever
+
+    return ActRoutingRetriever(
+        vectorstore=db,
+        centroid_router=centroid_router,
+        k=RETRIEVER_K,
+        max_acts=2,
+        debug=False,
+        search_type="mmr",
+        fetch_k=60,
+        lambda_mult=0.6,
+        enable_sanction_filter=True,
+        sanction_k=6,
+    )
+
+
+def _load_questions(questions_path: str) -> List[dict]:
+    items = []
+    with open(questions_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                items.append(json.loads(line))
+    return items
+
+
+def _doc_key(doc) -> Tuple[Any, Any, Any]:
+    meta = doc.metadata or {}
+    return meta.get("source"), meta.get("article"), meta.get("paragraph")
+
+
+def _run_benchmark(db, questions: List[dict], db_path: Optional[str] = None) -> dict:
+    router = centroid_router_for(db, db_path) if db_path else None
+    retriever = _benchmark_retriever(db, router)
+    retriever.invoke("test")  # rozgrzewka: wczytanie indeksu HNSW do pamięci
+
+    latencies, results, empty = [], {}, 0
+    for item in questions:
+        t0 = time.perf_counter()
+        docs = retriever.invoke(item["query"])
+        latencies.append((time.perf_counter() - t0) * 1000)
+        results[item["id"]] = {_doc_key(d) for d in docs}
+        empty += 0 if docs else 1
+
+    return {
+        "results": results,
+        "empty": empty,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+    }
+
+
+def verify_version(
+    embeddings,
+    version: str,
+    root: str = INDEX_ROOT,
+    questions_path: str = "tests/questions.jsonl",
+    docs_path: str = DOCS_PATH,
+) -> dict:
+    """
+    Sprawdza kandydata przed publikacją:
+      - dziennik ingestii potwierdza komplet plików,
+      - kolekcja nie jest pusta,
+      - p95 retrievalu na pytaniach testowych mieści się w INDEX_VERIFY_MAX_P95_MS,
+      - liczba pustych wyników nie jest gorsza niż w aktywnej wersji.
+    Raport trafia do katalogu wersji (VERIFY_REPORT_FILE).
+    """
+    path = version_path(version, root)
+    candidate = open_vector_store(embeddings, path)
+    questions = _load_questions(questions_path)
+
+    report = {
+        "version": version,
+        "verified_at": datetime.now().isoformat(timespec="seconds"),
+        "complete": is_index_complete(path, docs_path),
+        "chunks": candidate._collection.count(),
+        "questions": len(questions),
+    }
+
+    bench = _run_benchmark(candidate, questions, path)
+    report.update({k: bench[k] for k in ("empty", "p50_ms", "p95_ms")})
+
+    active_empty = None
+    current = active_version(root)
+    if current and current != version:
+        active_path = version_path(current, root)
+        active = open_vector_store(embeddings, active_path)
+        base = _run_benchmark(active, questions, active_path)
+        active_empty = base["empty"]
+        overlaps = []
+        for qid, keys in bench["results"].items():
+            prev = base["results"].get(qid, set())
+            union = keys | prev
+            overlaps.append(len(keys & prev) / len(union) if union else 1.0)
+        report["active_version"] = current
+        report["active_p95_ms"] = base["p95_ms"]
+        report["active_empty"] = active_empty
+        report["overlap_with_active"] = round(sum(overlaps) / len(overlaps), 3) if overlaps else None
+
+    report["passed"] = bool(
+        report["complete"]
+        and report["chunks"] > 0
+        and report["p95_ms"] <= INDEX_VERIFY_MAX_P95_MS
+        and (active_empty is None or report["empty"] <= active_empty)
+    )
+
+    with open(os.path.join(path, VERIFY_REPORT_FILE), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+def publish_version(version: str, root: str = INDEX_ROOT, force: bool = False) -> None:
+    """Przełącza wskaźnik na wersję; domyślnie tylko po udanej weryfikacji."""
+    path = version_path(version, root)
+    if not os.path.isdir(path):
+        raise RuntimeError(f"❌ Brak wersji indeksu: {version}")
+
+    if not force:
+        report_path = os.path.join(path, VERIFY_REPORT_FILE)
+        if not os.path.exists(report_path):
+            raise RuntimeError(f"❌ Wersja {version} nie była weryfikowana.")
+        with open(report_path, "r", encoding="utf-8") as f:
+            if not json.load(f).get("passed"):
+                raise RuntimeError(f"❌ Wersja {version} nie przeszła weryfikacji.")
+
+    previous = read_pointer(root) or {}
+    history = list(previous.get("history") or [])
+    if previous.get("version"):
+        history.append(previous["version"])
+
+    _write_pointer(
+        {
+            "version": version,
+            "published_at": datetime.now().isoformat(timespec="seconds"),
+            "history": history[-INDEX_KEEP_VERSIONS:],
+        },
+        root,
+    )
+    print(f"✅ Aktywna wersja indeksu: {version}")
+
+
+def rollback(root: str = INDEX_ROOT) -> str:
+    """Wraca do poprzednio opublikowanej wersji (bez ponownej weryfikacji)."""
+    pointer = read_pointer(root)
+    history = list((pointer or {}).get("history") or [])
+    while history:
+        version = history.pop()
+        if os.path.isdir(version_path(version, root)):
+            _write_pointer(
+                {
+                    "version": version,
+                    "published_at": datetime.now().isoformat(timespec="seconds"),
+                    "history": history,
+                    "rolled_back_from": pointer["version"],
+                },
+                root,
+            )
+            print(f"↩️  Rollback do wersji: {version}")
+            return version
+    raise RuntimeError("❌ Brak wcześniejszej wersji do rollbacku.")
+
+
+def prune_versions(root: str = INDEX_ROOT, keep: int = INDEX_KEEP_VERSIONS) -> List[str]:
+    """Usuwa najstarsze wersje poza aktywną i tymi z historii rollbacku."""
+    pointer = read_pointer(root) or {}
+    protected = {pointer.get("version"), *(pointer.get("history") or [])}
+    versions = list_versions(root)
+    removable = [v for v in versions if v not in protected]
+    excess = max(0, len(versions) - keep)
+    removed = removable[:excess]
+    for v in removed:
+        shutil.rmtree(version_path(v, root), ignore_errors=True)
+        print(f"🧹 Usunięto wersję indeksu: {v}")
+    return removed
+
+
+# ============================================================
+#  SERWOWANIE
+# ============================================================
+
+def _serving_store(open_db: Callable[[], Any], embeddings, db_path: str, version: Optional[str] = None):
+    """
+    Chroma albo – przy COMPRESSION_ENABLED – skompresowany widok na snapshocie i memmapie pełnych
+    wektorów. Wtedy Chroma jest otwierana tylko, gdy snapshot trzeba (jednorazowo) wyeksportować.
+    """
+    if not COMPRESSION_ENABLED:
+        return open_db()
+    from src.compressed_store import open_compressed_store
+    from src.snapshot_store import read_manifest, snapshot_dir_for, snapshot_is_current
+
+    fresh = snapshot_is_current(read_manifest(snapshot_dir_for(db_path)), db_path, version)
+    return open_compressed_store(embeddings, db_path, build_from=None if fresh else open_db(), version=version)
+
+
+def centroid_router_for(db, db_path: str):
+    """CentroidRouter dla danej wersji indeksu (albo None, gdy CENTROID_ROUTING wyłączony)."""
+    if not CENTROID_ROUTING:
+        return None
+    from src.centroid_router import CentroidRouter
+
+    return CentroidRouter.load_or_build(db, db_path)
+
+
+def xref_graph_for(db, db_path: str):
+    """CrossRefGraph dla danej wersji indeksu (albo None, gdy XREF_ENABLED wyłączony)."""
+    if not XREF_ENABLED:
+        return None
+    from src.xref_graph import CrossRefGraph
+
+    return CrossRefGraph.load_or_build(db, db_path)
+
+
+def open_active_store(embeddings, root: str = INDEX_ROOT) -> Tuple[Any, Optional[str]]:
+    """
+    Otwiera aktywną wersję indeksu. Bez opublikowanej wersji działa
+    po staremu: build_vector_store na DB_PATH (z dogrywaniem nowych plików).
+    """
+    version = active_version(root)
+    if version:
+        print(f"✅ Aktywna wersja indeksu: {version}")
+        path = version_path(version, root)
+        return _serving_store(lambda: open_vector_store(embeddings, path), embeddings, path, version), version
+    # Bez wersji ingestia (dogrywanie plików) idzie zawsze – Chroma musi być otwarta
+    db, _ = build_vector_store(embeddings)
+    return _serving_store(lambda: db, embeddings, DB_PATH), None
+
+
+class IndexWatcher:
+    """
+    Obserwuje wskaźnik aktywnej wersji i podmienia `vectorstore` w podanych
+    retrieverach. Nowa baza jest rozgrzewana przed podmianą, a samo przypisanie
+    atrybutu jest atomowe – trwające zapytania kończą się na starej bazie.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        retrievers: List[Any],
+        version: Optional[str],
+        root: str = INDEX_ROOT,
+        interval_s: float = INDEX_WATCH_INTERVAL_S,
+    ):
+        self.embeddings = embeddings
+        self.retrievers = retrievers
+        self.version = version
+        self.root = root
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> bool:
+        with self._lock:
+            version = active_version(self.root)
+            if not version or version == self.version:
+                return False
+            try:
+                path = version_path(version, self.root)
+                db = _serving_store(
+                    lambda: open_vector_store(self.embeddings, path), self.embeddings, path, version
+                )
+                db.similarity_search("test", k=1)  # rozgrzewka przed podmianą
+            except Exception as e:
+                print(f"⚠️ Nie udało się otworzyć wersji {version}: {e}. Zostaję na {self.version}.")
+                return False
+
+            router = centroid_router_for(db, path)
+            graph = xref_graph_for(db, path)
+            for retriever in self.retrievers:
+                if getattr(retriever, "centroid_router", None) is not None:
+                    retriever.centroid_router = router
+                if getattr(retriever, "xref_graph", None) is not None:
+                    retriever.xref_graph = graph
+                retriever.vectorstore = db
+            print(f"🔁 Przełączono indeks: {self.version} -> {version}")
+            self.version = version
+            return True
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ IndexWatcher: {e}")
+
+    def start(self) -> "IndexWatcher":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="index-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def versions_summary(root: str = INDEX_ROOT) -> List[dict]:
+    current = active_version(root)
+    rows = []
+    for v in list_versions(root):
+        report_path = Path(version_path(v, root)) / VERIFY_REPORT_FILE
+        report = json.loads(report_path.read_text(encoding="utf-8")) if report_path.exists() else {}
+        rows.append({
+            "version": v,
+            "active": v == current,
+            "passed": report.get("passed"),
+            "p95_ms": report.get("p95_ms"),
+        })
+    return rows
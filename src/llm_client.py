@@ -0,0 +1,270 @@
+# src/llm_client.py
+"""
+Warstwa klienta LLM (Ollama):
+  - jedna requests.Session na proces z pulą połączeń HTTP (keep-alive),
+  - rozgrzewka przy starcie: model ładowany i przypięty w pamięci Ollamy (keep_alive),
+  - semafor ograniczający liczbę równoległych generacji + metryki czasu w kolejce,
+  - timeouty per żądanie i ponowienia przy błędach połączenia / 502-504 (bez ponowień po timeoucie odczytu).
+PooledChatOllama to adapter LangChain (BaseChatModel) na ten klient.
+"""
+import inspect
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from src.config import (
+    SERVER_URL,
+    MODEL_NAME,
+    LLM_MAX_CONCURRENCY,
+    LLM_POOL_SIZE,
+    LLM_CONNECT_TIMEOUT_S,
+    LLM_TIMEOUT_S,
+    LLM_RETRIES,
+    LLM_KEEP_ALIVE,
+)
+from src.metrics import percentile, record_stage
+
+_RETRY_STATUS = (502, 503, 504)
+
+
+class LLMQueueTimeout(RuntimeError):
+    """Żądanie nie dostało slotu generacji w zadanym czasie."""
+
+
+class OllamaClient:
+    def __init__(
+        self,
+        base_url: str = SERVER_URL,
+        model: str = MODEL_NAME,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        pool_size: int = LLM_POOL_SIZE,
+        connect_timeout_s: float = LLM_CONNECT_TIMEOUT_S,
+        timeout_s: float = LLM_TIMEOUT_S,
+        retries: int = LLM_RETRIES,
+        keep_alive: str = LLM_KEEP_ALIVE,
+        slots: Any = None,
+        waiting: Any = None,
+    ):
+        """
+        slots – opcjonalny semafor współdzielony między procesami (multiprocessing.BoundedSemaphore
+        utworzony przed forkiem); wtedy max_concurrency to limit łączny dla wszystkich procesów.
+        waiting – licznik czekających współdzielony razem z semaforem (multiprocessing.Value("i"));
+        bez niego queue_depth() widzi tylko kolejkę bieżącego procesu.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.connect_timeout_s = connect_timeout_s
+        self.timeout_s = timeout_s
+        self.retries = retries
+        self.keep_alive = keep_alive
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._slots = slots if slots is not None else threading.BoundedSemaphore(max_concurrency)
+        self._shared_waiting = waiting
+        self._lock = threading.Lock()
+        self._queue_wait_ms: deque = deque(maxlen=2000)
+        self._latency_ms: deque = deque(maxlen=2000)
+        self._counters = {"requests": 0, "errors": 0, "retries": 0, "waiting": 0, "in_flight": 0}
+
+    # --- kolejka / metryki ---
+
+    @contextmanager
+    def slot(self, timeout_s: Optional[float] = None):
+        """Slot generacji; czas oczekiwania trafia do metryk kolejki."""
+        with self._lock:
+            self._counters["waiting"] += 1
+        self._add_shared_waiting(1)
+        t0 = time.perf_counter()
+        try:
+            acquired = self._slots.acquire(timeout=timeout_s) if timeout_s is not None else self._slots.acquire()
+        finally:
+            self._add_shared_waiting(-1)
+        waited_ms = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            self._counters["waiting"] -= 1
+            if acquired:
+                self._counters["in_flight"] += 1
+                self._queue_wait_ms.append(waited_ms)
+        if not acquired:
+            raise LLMQueueTimeout(f"Brak wolnego slotu LLM po {waited_ms:.0f} ms")
+        try:
+            yield waited_ms
+        finally:
+            with self._lock:
+                self._counters["in_flight"] -= 1
+            self._slots.release()
+
+    def _add_shared_waiting(self, delta: int) -> None:
+        if self._shared_waiting is not None:
+            with self._shared_waiting.get_lock():
+                self._shared_waiting.value += delta
+
+    def queue_depth(self) -> int:
+        """Ile żądań czeka teraz na slot generacji (we wszystkich procesach, gdy licznik jest współdzielony)."""
+        if self._shared_waiting is not None:
+            return max(0, self._shared_waiting.value)
+        with self._lock:
+            return self._counters["waiting"]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = list(self._queue_wait_ms)
+            lat = list(self._latency_ms)
+            return {
+                **self._counters,
+                "waiting_total": self.queue_depth(),
+                "max_concurrency": self.max_concurrency,
+                "queue_wait_p50_ms": round(percentile(waits, 50), 1),
+                "queue_wait_p95_ms": round(percentile(waits, 95), 1),
+                "latency_p50_ms": round(percentile(lat, 50), 1),
+                "latency_p95_ms": round(percentile(lat, 95), 1),
+            }
+
+    # --- HTTP ---
+
+    def _post(self, path: str, payload: dict, timeout_s: Optional[float] = None) -> dict:
+        timeout = (self.connect_timeout_s, timeout_s or self.timeout_s)
+        last_error: Optional[Exception] = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                with self._lock:
+                    self._counters["retries"] += 1
+                time.sleep(min(0.5 * 2 ** (attempt - 1), 4.0))
+            try:
+                resp = self.session.post(f"{self.base_url}{path}", json=payload, timeout=timeout)
+                if resp.status_code in _RETRY_STATUS:
+                    last_error = requests.HTTPError(f"{resp.status_code} {resp.reason}", response=resp)
+                    continue
+                resp.raise_for_status()
+                return resp.json()
+            except requests.ConnectionError as e:
+                # Także ConnectTimeout; ReadTimeout nie – generacja mogła już trwać, a ponowienie
+                # trzymałoby slot przez (retries + 1) x timeout
+                last_error = e
+        with self._lock:
+            self._counters["errors"] += 1
+        raise last_error if last_error else RuntimeError("Nieznany błąd klienta LLM")
+
+    def warm_up(self) -> float:
+        """
+        Puste żądanie /api/generate ładuje model i przypina go w pamięci na keep_alive.
+        Zwraca czas w sekundach (pierwsze wywołanie = koszt załadowania modelu).
+        """
+        t0 = time.perf_counter()
+        self._post(
+            "/api/generate",
+            {"model": self.model, "prompt": "", "keep_alive": self.keep_alive, "stream": False},
+            timeout_s=max(self.timeout_s, 600),
+        )
+        elapsed = time.perf_counter() - t0
+        print(f"🔥 Model {self.model} rozgrzany ({elapsed:.1f} s, keep_alive={self.keep_alive}).")
+        return elapsed
+
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        options: Optional[Dict[str, Any]] = None,
+        timeout_s: Optional[float] = None,
+        queue_timeout_s: Optional[float] = None,
+    ) -> dict:
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": False,
+            "keep_alive": self.keep_alive,
+            "options": options or {},
+        }
+        with self.slot(queue_timeout_s) as waited_ms:
+            record_stage("llm_queue", waited_ms)
+            t0 = time.perf_counter()
+            try:
+                data = self._post("/api/chat", payload, timeout_s)
+            finally:
+                elapsed_ms = (time.perf_counter() - t0) * 1000
+                record_stage("llm", elapsed_ms)
+                with self._lock:
+                    self._counters["requests"] += 1
+                    self._latency_ms.append(elapsed_ms)
+        data["queue_wait_ms"] = round(waited_ms, 1)
+        return data
+
+
+_ROLES = {"human": "user", "ai": "assistant", "system": "system"}
+
+
+class PooledChatOllama(BaseChatModel):
+    """Adapter LangChain: wiadomości -> OllamaClient.chat (wspólna pula, semafor, retry)."""
+
+    client: Any
+    temperature: float = 0.2
+
+    @property
+    def _llm_type(self) -> str:
+        return "pooled-ollama"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        payload = [{"role": _ROLES.get(m.type, "user"), "content": m.content} for m in messages]
+        options: Dict[str, Any] = {"temperature": self.temperature}
+        if stop:
+            options["stop"] = stop
+        data = self.client.chat(payload, options=options)
+
+        message = AIMessage(
+            content=(data.get("message") or {}).get("content", ""),
+            response_metadata={
+                "model": data.get("model"),
+                "eval_count": data.get("eval_count"),
+                "prompt_eval_count": data.get("prompt_eval_count"),
+                "queue_wait_ms": data.get("queue_wait_ms"),
+            },
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+_shared_clients: Dict[tuple, OllamaClient] = {}
+_shared_lock = threading.Lock()
+
+
+def get_client(**kwargs) -> OllamaClient:
+    """
+    Jeden klient (jedna pula połączeń i jeden semafor) na proces i zestaw parametrów –
+    np. build_llm(base_url=<stub>) nie trafi do klienta utworzonego wcześniej dla Ollamy.
+    """
+    # Klucz z parametrami domyślnymi: build_llm() i build_llm(base_url=SERVER_URL) to ten sam klient
+    bound = inspect.signature(OllamaClient).bind(**kwargs)
+    bound.apply_defaults()
+    key = tuple(sorted(bound.arguments.items()))
+    with _shared_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            client = _shared_clients[key] = OllamaClient(**kwargs)
+        return client
+
+
+def build_llm(temperature: float = 0.2, warm_up: bool = True, **client_kwargs) -> PooledChatOllama:
+    client = get_client(**client_kwargs)
+    if warm_up:
+        try:
+            client.warm_up()
+        except Exception as e:
+            print(f"⚠️ Rozgrzewka modelu nie powiodła się: {e}")
+    return PooledChatOllama(client=client, temperature=temperature)
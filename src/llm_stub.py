@@ -0,0 +1,139 @@
+# src/llm_stub.py
+"""
+Lokalny stub serwera Ollama do testów i testów obciążeniowych:
+  GET  /api/tags      – lista modeli
+  POST /api/generate  – rozgrzewka / generacja
+  POST /api/chat      – odpowiedź czatu (stream=false)
+Symuluje opóźnienie do pierwszego tokenu (latency_ms) i tempo generacji (tokens_per_s).
+
+Uruchomienie: python -m src.llm_stub --port 11500 --latency-ms 300 --tokens-per-s 25
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+_STUB_ANSWER = (
+    "Brak podstaw w dostarczonym kontekście do pełnej odpowiedzi (odpowiedź stuba). "
+    "PODSTAWA PRAWNA: • Kodeks Karny • Art. 278 § 1 • Kto zabiera w celu przywłaszczenia cudzą rzecz ruchomą."
+)
+
+
+class StubConfig:
+    def __init__(self, model: str, latency_ms: float, tokens_per_s: float, answer_tokens: int, load_ms: float):
+        self.model = model
+        self.latency_ms = latency_ms
+        self.tokens_per_s = tokens_per_s
+        self.answer_tokens = answer_tokens
+        self.load_ms = load_ms           # jednorazowy koszt "załadowania modelu"
+        self.loaded = False
+        self.lock = threading.Lock()
+        self.requests = 0
+
+
+def _make_handler(cfg: StubConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, payload: dict, status: int = 200):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _simulate(self, prompt_chars: int, generate: bool = True) -> Tuple[int, float]:
+            with cfg.lock:
+                cfg.requests += 1
+                cold = not cfg.loaded
+                cfg.loaded = True
+            delay = (cfg.load_ms if cold else 0) + (cfg.latency_ms if generate else 0)
+            gen_s = cfg.answer_tokens / cfg.tokens_per_s if generate and cfg.tokens_per_s > 0 else 0.0
+            time.sleep(delay / 1000 + gen_s)
+            return max(1, prompt_chars // 4), gen_s
+
+        def do_GET(self):
+            if self.path.startswith("/api/tags"):
+                self._send({"models": [{"name": cfg.model, "model": cfg.model}]})
+            else:
+                self._send({"error": "not found"}, 404)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            data = json.loads(self.rfile.read(length) or b"{}")
+
+            if self.path.startswith("/api/generate"):
+                prompt = data.get("prompt") or ""
+                prompt_tokens, _ = self._simulate(len(prompt), generate=bool(prompt))
+                self._send({
+                    "model": data.get("model", cfg.model),
+                    "response": _STUB_ANSWER if prompt else "",
+                    "done": True,
+                    "prompt_eval_count": prompt_tokens,
+                    "eval_count": cfg.answer_tokens if prompt else 0,
+                })
+            elif self.path.startswith("/api/chat"):
+                prompt_chars = sum(len(m.get("content") or "") for m in data.get("messages") or [])
+                prompt_tokens, gen_s = self._simulate(prompt_chars)
+                self._send({
+                    "model": data.get("model", cfg.model),
+                    "message": {"role": "assistant", "content": _STUB_ANSWER},
+                    "done": True,
+                    "prompt_eval_count": prompt_tokens,
+                    "eval_count": cfg.answer_tokens,
+                    "eval_duration": int(gen_s * 1e9),
+                })
+            else:
+                self._send({"error": "not found"}, 404)
+
+    return Handler
+
+
+def start_stub_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    model: str = "stub",
+    latency_ms: float = 200.0,
+    tokens_per_s: float = 50.0,
+    answer_tokens: int = 120,
+    load_ms: float = 0.0,
+) -> Tuple[ThreadingHTTPServer, str]:
+    """Startuje stub w wątku w tle; port=0 = wolny port. Zwraca (serwer, base_url)."""
+    cfg = StubConfig(model, latency_ms, tokens_per_s, answer_tokens, load_ms)
+    server = ThreadingHTTPServer((host, port), _make_handler(cfg))
+    server.daemon_threads = True
+    server.stub_config = cfg
+    threading.Thread(target=server.serve_forever, name="llm-stub", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub serwera Ollama (testy / load testy).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--model", default="stub")
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--tokens-per-s", type=float, default=50.0)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--load-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, url = start_stub_server(
+        args.host, args.port, args.model, args.latency_ms, args.tokens_per_s, args.answer_tokens, args.load_ms
+    )
+    print(f"🧪 Stub Ollama działa na {url} (Ctrl+C aby zakończyć)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
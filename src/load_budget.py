@@ -0,0 +1,157 @@
+# src/load_budget.py
+"""
+Adaptacyjny budżet retrievalu pod obciążeniem.
+Poziomy (od ustawień retrievera w dół):
+  0 "full"    – ustawienia retrievera bez zmian (MMR, fetch_k, k)
+  1 "reduced" – mniejsze k i fetch_k, nadal MMR
+  2 "minimal" – samo podobieństwo (bez MMR), k mocno ograniczone, bez dociągania odwołań
+Sygnały: liczba żądań czekających na slot LLM oraz p95 czasu odpowiedzi z ostatniego okna vs SLO.
+Eskalacja jest natychmiastowa, powrót – o jeden poziom, po spadku sygnałów i upływie cooldownu.
+"""
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from src.config import (
+    ADAPTIVE_BUDGET,
+    BUDGET_QUEUE_HIGH,
+    BUDGET_SLO_P95_MS,
+    BUDGET_WINDOW_S,
+    BUDGET_MIN_SAMPLES,
+    BUDGET_COOLDOWN_S,
+)
+from src.metrics import percentile
+
+# (nazwa, mnożnik k, mnożnik fetch_k, wymuszony search_type, mnożnik xref_k)
+_LEVELS = (
+    ("full", 1.0, 1.0, None, 1.0),
+    ("reduced", 0.6, 0.5, None, 0.5),
+    ("minimal", 0.4, 0.0, "similarity", 0.0),
+)
+_MIN_K = 3
+
+
+@dataclass(frozen=True)
+class RetrievalBudget:
+    level: int
+    name: str
+    search_type: str
+    k: int
+    fetch_k: int
+    lambda_mult: float
+    sanction_k: int
+    xref_k: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def budget_for_level(retriever, level: int) -> RetrievalBudget:
+    """Budżet danego poziomu wyliczony z ustawień retrievera (poziom 0 = bez zmian)."""
+    name, k_mult, fetch_mult, search_type, xref_mult = _LEVELS[level]
+    k = retriever.k if level == 0 else min(retriever.k, max(_MIN_K, round(retriever.k * k_mult)))
+    fetch_k = max(k, round(retriever.fetch_k * fetch_mult))
+    return RetrievalBudget(
+        level=level,
+        name=name,
+        search_type=search_type or retriever.search_type,
+        k=k,
+        fetch_k=fetch_k,
+        lambda_mult=retriever.lambda_mult,
+        sanction_k=min(retriever.sanction_k, k),
+        xref_k=round(retriever.xref_k * xref_mult),
+    )
+
+
+class LoadAwareBudget:
+    def __init__(
+        self,
+        queue_depth: Callable[[], int],
+        queue_high: int = BUDGET_QUEUE_HIGH,
+        slo_p95_ms: float = BUDGET_SLO_P95_MS,
+        window_s: float = BUDGET_WINDOW_S,
+        min_samples: int = BUDGET_MIN_SAMPLES,
+        cooldown_s: float = BUDGET_COOLDOWN_S,
+    ):
+        self.queue_depth = queue_depth
+        self.queue_high = queue_high
+        self.slo_p95_ms = slo_p95_ms
+        self.window_s = window_s
+        self.min_samples = min_samples
+        self.cooldown_s = cooldown_s
+
+        self.level = 0
+        self._changed_at = time.monotonic()
+        self._latencies: deque = deque(maxlen=5000)   # (monotonic, ms)
+        self._level_counts = [0] * len(_LEVELS)
+        self._lock = threading.Lock()
+
+    def observe(self, total_ms: float) -> None:
+        """Czas odpowiedzi zakończonego żądania (ścieżka z generacją)."""
+        with self._lock:
+            self._latencies.append((time.monotonic(), total_ms))
+
+    def _window_p95(self, now: float) -> Optional[float]:
+        while self._latencies and now - self._latencies[0][0] > self.window_s:
+            self._latencies.popleft()
+        if len(self._latencies) < self.min_samples:
+            return None
+        return percentile((ms for _, ms in self._latencies), 95)
+
+    def _target_level(self, depth: int, p95: Optional[float]) -> int:
+        over_slo = p95 is not None and p95 > self.slo_p95_ms
+        far_over_slo = p95 is not None and p95 > 1.5 * self.slo_p95_ms
+        if depth >= 2 * self.queue_high or far_over_slo:
+            return 2
+        if depth >= self.queue_high or over_slo:
+            return 1
+        return 0
+
+    def current_level(self) -> Tuple[int, int, Optional[float]]:
+        """Zwraca (poziom, głębokość kolejki, p95 z okna) i aktualizuje poziom z histerezą."""
+        depth = int(self.queue_depth() or 0)
+        now = time.monotonic()
+        with self._lock:
+            p95 = self._window_p95(now)
+            target = self._target_level(depth, p95)
+            if target > self.level:
+                self.level = target
+                self._changed_at = now
+            elif target < self.level and now - self._changed_at >= self.cooldown_s:
+                self.level -= 1
+                self._changed_at = now
+            self._level_counts[self.level] += 1
+            return self.level, depth, p95
+
+    def budget_for(self, retriever) -> Tuple[RetrievalBudget, Dict[str, Any]]:
+        level, depth, p95 = self.current_level()
+        signals = {"queue_depth": depth, "p95_ms": round(p95, 1) if p95 is not None else None}
+        return budget_for_level(retriever, level), signals
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "level": _LEVELS[self.level][0],
+                "requests_per_level": {name: n for (name, *_), n in zip(_LEVELS, self._level_counts)},
+            }
+
+
+_shared_policy: Optional[LoadAwareBudget] = None
+_shared_lock = threading.Lock()
+
+
+def build_budget_policy(llm_client, enabled: bool = ADAPTIVE_BUDGET) -> Optional[LoadAwareBudget]:
+    """
+    Jedna polityka na proces (wspólna dla wszystkich sesji), sterowana kolejką klienta LLM –
+    w serve.py łączną kolejką wszystkich workerów (licznik współdzielony z semaforem slotów).
+    enabled=False -> None (retriever używa stałych ustawień).
+    """
+    global _shared_policy
+    if not enabled:
+        return None
+    with _shared_lock:
+        if _shared_policy is None:
+            _shared_policy = LoadAwareBudget(queue_depth=llm_client.queue_depth)
+        return _shared_policy
@@ -0,0 +1,104 @@
+# src/loadgen.py
+"""
+Generator realistycznych zapytań do testów obciążeniowych, budowany z korpusu:
+  - tytuły rozdziałów ("Jakie przepisy dotyczą: ...")
+  - aliasy aktów z ACTS ("Co mówi kodeks o: alimenty?")
+  - kwoty wokół progu 800 zł (ścieżka _extract_amount_pln w routingu)
+  - wyszukania przepisu ("pokaż art. 148 kk") – szybka ścieżka bez LLM
+"""
+import json
+import os
+import random
+from typing import Dict, List, Optional, Tuple
+
+from src.config import DOCS_PATH
+from src.routing import ACTS
+
+# Skróty aktów (aliasy, które router rozpoznaje jako osobne słowo)
+_ABBREVIATIONS = {"kpk", "kpa", "kpc", "kc", "kk", "kks", "kkw", "kpw", "kw", "kp", "ksh", "kro"}
+
+_CHAPTER_TEMPLATES = (
+    "Co przewidują przepisy w zakresie: {topic}?",
+    "Jakie przepisy dotyczą: {topic}?",
+    "Wyjaśnij zasady: {topic}.",
+)
+_ALIAS_TEMPLATES = (
+    "Co mówi {act} o: {alias}?",
+    "Jakie są zasady dotyczące: {alias}?",
+    "Czy {alias} wymaga szczególnej formy?",
+)
+_AMOUNT_TEMPLATES = (
+    "Jaka kara grozi za kradzież {item} o wartości {amount} zł?",
+    "Co grozi za przywłaszczenie {item} wartego {amount} zł?",
+    "Czy kradzież {item} za {amount} zł to przestępstwo czy wykroczenie?",
+)
+_ITEMS = ("telefonu", "roweru", "portfela", "laptopa", "biżuterii", "narzędzi", "hulajnogi")
+
+DEFAULT_MIX = {"chapter": 0.35, "alias": 0.25, "amount": 0.25, "lookup": 0.15}
+
+
+def _load_corpus_index(docs_path: str) -> Tuple[List[str], Dict[str, List[str]]]:
+    """Zwraca (tytuły rozdziałów, {act_name: [numery artykułów]})."""
+    chapters: List[str] = []
+    articles: Dict[str, List[str]] = {}
+    for filename in sorted(os.listdir(docs_path)):
+        if not filename.lower().endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(docs_path, filename), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            continue
+        for item in data if isinstance(data, list) else []:
+            meta = item.get("metadata") if isinstance(item, dict) else None
+            if not isinstance(meta, dict):
+                continue
+            title = meta.get("chapter_title")
+            if isinstance(title, str) and 3 < len(title) < 120:
+                chapters.append(title.strip())
+            if meta.get("act_name") and meta.get("article"):
+                articles.setdefault(meta["act_name"], []).append(str(meta["article"]))
+    return sorted(set(chapters)), articles
+
+
+class QueryGenerator:
+    def __init__(self, docs_path: str = DOCS_PATH, seed: int = 42, mix: Optional[Dict[str, float]] = None):
+        self.rng = random.Random(seed)
+        self.mix = mix or DEFAULT_MIX
+        self.chapters, self.articles = _load_corpus_index(docs_path)
+        self.abbrev = {
+            act.act_name: next((a for a in act.aliases if a in _ABBREVIATIONS), None) for act in ACTS
+        }
+
+    def _chapter(self) -> str:
+        topic = self.rng.choice(self.chapters) if self.chapters else "kradzież"
+        topic = topic.lower() if topic.isupper() else topic[0].lower() + topic[1:]
+        return self.rng.choice(_CHAPTER_TEMPLATES).format(topic=topic)
+
+    def _alias(self) -> str:
+        act = self.rng.choice(ACTS)
+        aliases = [
+            a for a in act.aliases if a not in _ABBREVIATIONS and a != act.act_name.lower()
+        ] or list(act.aliases)
+        return self.rng.choice(_ALIAS_TEMPLATES).format(act=act.act_name.lower(), alias=self.rng.choice(aliases))
+
+    def _amount(self) -> str:
+        # Połowa kwot blisko progu 800 zł (KW vs KK), połowa z szerokiego zakresu
+        amount = int(self.rng.choice((self.rng.gauss(800, 250), self.rng.uniform(50, 20000))))
+        return self.rng.choice(_AMOUNT_TEMPLATES).format(item=self.rng.choice(_ITEMS), amount=max(1, amount))
+
+    def _lookup(self) -> str:
+        acts = [a for a in self.articles if self.abbrev.get(a)]
+        if not acts:
+            return self._chapter()
+        act = self.rng.choice(acts)
+        return f"pokaż art. {self.rng.choice(self.articles[act])} {self.abbrev[act]}"
+
+    def next(self) -> Tuple[str, str]:
+        """Zwraca (rodzaj, zapytanie)."""
+        kinds = list(self.mix)
+        kind = self.rng.choices(kinds, weights=[self.mix[k] for k in kinds])[0]
+        return kind, getattr(self, f"_{kind}")()
+
+    def take(self, n: int) -> List[Tuple[str, str]]:
+        return [self.next() for _ in range(n)]
@@ -0,0 +1,112 @@
+# src/metrics.py
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def percentile(values: Iterable[float], q: float) -> float:
+    """Percentyl metodą najbliższej rangi (q w zakresie 0-100); pusta lista -> 0.0."""
+    data: List[float] = sorted(values)
+    if not data:
+        return 0.0
+    rank = max(1, min(len(data), math.ceil(q / 100.0 * len(data))))
+    return float(data[rank - 1])
+
+
+def rss_mb() -> float:
+    """Bieżące RSS procesu w MB (Linux: /proc/self/status, inaczej szczytowe ru_maxrss)."""
+    try:
+        with open(f"/proc/{os.getpid()}/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    if resource is None:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def pss_mb() -> float:
+    """
+    PSS procesu w MB (Linux): strony współdzielone (np. mmap snapshotu indeksu) liczone
+    proporcjonalnie do liczby procesów – suma PSS workerów to realny koszt pamięci.
+    Poza Linuxem 0.0.
+    """
+    try:
+        with open(f"/proc/{os.getpid()}/smaps_rollup", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return 0.0
+
+
+# ============================================================
+#  CZASY ETAPÓW POJEDYNCZEGO ŻĄDANIA
+# ============================================================
+
+class RequestTrace:
+    """
+    Czasy etapów jednego żądania (ms) + dowolne adnotacje.
+    LangChain uruchamia kroki w kopiach kontekstu, ale obiekt jest współdzielony,
+    więc zapisy z podrzędnych kroków trafiają do tego samego śladu.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.info: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, ms: float) -> None:
+        with self._lock:
+            self.stages[name] = round(self.stages.get(name, 0.0) + ms, 2)
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+@contextmanager
+def trace_request():
+    trace = RequestTrace()
+    token = _current_trace.set(trace)
+    t0 = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.add("total", (time.perf_counter() - t0) * 1000)
+        _current_trace.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    """Mierzy etap i dopisuje go do bieżącego śladu (bez śladu – no-op)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, (time.perf_counter() - t0) * 1000)
+
+
+def record_stage(name: str, ms: float) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, ms)
+
+
+def annotate(key: str, value: Any) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.info[key] = value
@@ -0,0 +1,245 @@
+# src/numpy_store.py
+"""
+Prosty vectorstore na macierzach NumPy, zgodny z tą częścią API Chroma,
+której używa ActRoutingRetriever:
+  similarity_search(_by_vector), max_marginal_relevance_search(_by_vector), get(...)
+
+Ranking podobieństwa = odległość L2 na surowych wektorach (jak domyślna
+kolekcja Chroma), MMR = podobieństwo kosinusowe (jak w langchain_chroma).
+Klasy pochodne podmieniają tylko _candidates() (kompresja, mmap itd.).
+"""
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+# ============================================================
+#  FILTRY (podzbiór składni `where` z Chroma)
+# ============================================================
+
+def match_where(meta: dict, where: Optional[dict]) -> bool:
+    """
+    Obsługuje: {"pole": wartość}, {"pole": {"$eq"|"$ne"|"$in"|"$nin": ...}},
+    {"$and": [...]}, {"$or": [...]}.
+    """
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(match_where(meta, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(match_where(meta, c) for c in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = meta.get(key)
+            for op, arg in cond.items():
+                if op == "$eq" and value != arg:
+                    return False
+                if op == "$ne" and value == arg:
+                    return False
+                if op == "$in" and value not in arg:
+                    return False
+                if op == "$nin" and value in arg:
+                    return False
+        elif meta.get(key) != cond:
+            return False
+    return True
+
+
+def normalize_rows(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=-1, keepdims=True)
+    return m / np.maximum(norms, 1e-12)
+
+
+def mmr_select(query_vec: np.ndarray, cand_vecs: np.ndarray, k: int, lambda_mult: float) -> List[int]:
+    """Maximal Marginal Relevance na podobieństwie kosinusowym (indeksy w cand_vecs)."""
+    if len(cand_vecs) == 0:
+        return []
+    q = normalize_rows(np.asarray(query_vec, dtype=np.float32))
+    c = normalize_rows(np.asarray(cand_vecs, dtype=np.float32))
+    sim_q = c @ q
+    sim_c = c @ c.T
+
+    selected = [int(np.argmax(sim_q))]
+    while len(selected) < min(k, len(c)):
+        redundancy = sim_c[:, selected].max(axis=1)
+        score = lambda_mult * sim_q - (1 - lambda_mult) * redundancy
+        score[selected] = -np.inf
+        selected.append(int(np.argmax(score)))
+    return selected
+
+
+def vectors_checksum(vectors: np.ndarray, block: int = 16384) -> str:
+    """SHA-1 macierzy float32 liczony blokami (memmap nie jest wczytywany w całości)."""
+    h = hashlib.sha1()
+    for start in range(0, len(vectors), block):
+        h.update(np.ascontiguousarray(vectors[start : start + block], dtype=np.float32).tobytes())
+    return h.hexdigest()
+
+
+def export_chroma(db, batch_size: int = 5000) -> Tuple[List[str], np.ndarray, List[str], List[dict]]:
+    """Pobiera z kolekcji Chroma wszystkie id, wektory, teksty i metadane (stronicowanie po batch_size)."""
+    ids: List[str] = []
+    vectors: List[np.ndarray] = []
+    texts: List[str] = []
+    metas: List[dict] = []
+    offset = 0
+    while True:
+        raw = db.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+        batch_ids = raw.get("ids") or []
+        if not batch_ids:
+            break
+        ids.extend(batch_ids)
+        vectors.append(np.asarray(raw["embeddings"], dtype=np.float32))
+        texts.extend(raw.get("documents") or [""] * len(batch_ids))
+        metas.extend(m or {} for m in (raw.get("metadatas") or [{}] * len(batch_ids)))
+        offset += len(batch_ids)
+    matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+    return ids, matrix, texts, metas
+
+
+# ============================================================
+#  STORE
+# ============================================================
+
+class NumpyVectorStore:
+    """Dokładne wyszukiwanie (brute force) na macierzy wektorów w pamięci lub w np.memmap."""
+
+    _MASK_CACHE_SIZE = 64
+
+    def __init__(
+        self,
+        embeddings,
+        ids: Sequence[str],
+        vectors: np.ndarray,
+        texts: Sequence[str],
+        metadatas: Sequence[dict],
+    ):
+        self.embeddings = embeddings
+        self.ids = list(ids)
+        self.vectors = vectors
+        self.texts = texts
+        self.metadatas = metadatas
+        self._sq_norms = np.einsum("ij,ij->i", vectors, vectors) if len(vectors) else np.zeros(0)
+        self._id_index = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self._mask_cache: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def from_chroma(cls, db, embeddings, **kwargs) -> "NumpyVectorStore":
+        ids, vectors, texts, metas = export_chroma(db)
+        return cls(embeddings, ids, vectors, texts, metas, **kwargs)
+
+    # --- pomocnicze ---
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _mask(self, where: Optional[dict]) -> Optional[np.ndarray]:
+        """Maska wierszy pasujących do filtra; filtry się powtarzają (akty), więc cache."""
+        if not where:
+            return None
+        key = json.dumps(where, sort_keys=True, ensure_ascii=False)
+        mask = self._mask_cache.get(key)
+        if mask is None:
+            mask = np.fromiter((match_where(m, where) for m in self.metadatas), dtype=bool, count=len(self.ids))
+            if len(self._mask_cache) >= self._MASK_CACHE_SIZE:
+                self._mask_cache.pop(next(iter(self._mask_cache)))
+            self._mask_cache[key] = mask
+        return mask
+
+    def _exact_scores(self, query_vec: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """-||q - x||^2 bez stałej ||q||^2 (ten sam ranking co L2 w Chroma)."""
+        if rows is None:
+            return 2.0 * (self.vectors @ query_vec) - self._sq_norms
+        return 2.0 * (self.vectors[rows] @ query_vec) - self._sq_norms[rows]
+
+    def _candidates(self, query_vec: np.ndarray, n: int, where: Optional[dict]) -> Tuple[np.ndarray, np.ndarray]:
+        """Zwraca (indeksy, wyniki) n najlepszych wierszy, malejąco po wyniku."""
+        mask = self._mask(where)
+        rows = np.flatnonzero(mask) if mask is not None else None
+        scores = self._exact_scores(query_vec, rows)
+        if len(scores) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        n = min(n, len(scores))
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top])]
+        idx = rows[top] if rows is not None else top
+        return idx, scores[top]
+
+    def _doc(self, i: int) -> Document:
+        return Document(page_content=self.texts[i], metadata=dict(self.metadatas[i]), id=self.ids[i])
+
+    def _embed(self, query: str) -> np.ndarray:
+        return np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+
+    # --- API zgodne z Chroma ---
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter: Optional[dict] = None, **kwargs) -> List[Document]:
+        idx, _ = self._candidates(np.asarray(embedding, dtype=np.float32), k, filter)
+        return [self._doc(int(i)) for i in idx]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs) -> List[Document]:
+        return self.similarity_search_by_vector(self._embed(query), k=k, filter=filter)
+
+    def max_marginal_relevance_search_by_vector(
+        self,
+        embedding,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[dict] = None,
+        **kwargs,
+    ) -> List[Document]:
+        query_vec = np.asarray(embedding, dtype=np.float32)
+        idx, _ = self._candidates(query_vec, fetch_k, filter)
+        if len(idx) == 0:
+            return []
+        picked = mmr_select(query_vec, np.asarray(self.vectors[idx]), k, lambda_mult)
+        return [self._doc(int(idx[p])) for p in picked]
+
+    def max_marginal_relevance_search(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[dict] = None,
+        **kwargs,
+    ) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(
+            self._embed(query), k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, filter=filter
+        )
+
+    def get(
+        self,
+        ids: Optional[Sequence[str]] = None,
+        where: Optional[dict] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Sequence[str] = ("documents", "metadatas"),
+        **kwargs,
+    ) -> Dict[str, Any]:
+        if ids is not None:
+            rows = [self._id_index[i] for i in ids if i in self._id_index]
+            if where:
+                rows = [r for r in rows if match_where(self.metadatas[r], where)]
+        else:
+            mask = self._mask(where)
+            rows = list(np.flatnonzero(mask)) if mask is not None else list(range(len(self.ids)))
+        if offset:
+            rows = rows[offset:]
+        if limit is not None:
+            rows = rows[:limit]
+
+        out: Dict[str, Any] = {"ids": [self.ids[r] for r in rows]}
+        if "documents" in include:
+            out["documents"] = [self.texts[r] for r in rows]
+        if "metadatas" in include:
+            out["metadatas"] = [dict(self.metadatas[r]) for r in rows]
+        if "embeddings" in include:
+            out["embeddings"] = np.asarray(self.vectors[np.asarray(rows, dtype=np.int64)]) if rows else []
+        return out
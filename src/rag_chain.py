@@ -1,16 +1,63 @@
 # src/rag_chain.py
+from typing import List
+
 from langchain_classic.chains.combine_documents import create_stuff_documents_chain
 from langchain_classic.chains.retrieval import create_retrieval_chain
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+from src.config import CHUNK_OVERLAP
+from src.metrics import stage, trace_request
+
+# Tryby wywołania (klucz "mode" w wejściu łańcucha):
+#   "auto"     – szybka ścieżka dla czystych wyszukań przepisu, w pozostałych przypadkach LLM
+#   "lookup"   – zawsze zwróć treść przepisów bez LLM
+#   "generate" – zawsze pełna generacja
+MODES = ("auto", "lookup", "generate")
+
+
+def _merge_overlap(left: str, right: str) -> str:
+    """Skleja kolejne chunki tego samego przepisu bez powtarzania nakładki (CHUNK_OVERLAP)."""
+    for size in range(min(len(left), len(right), CHUNK_OVERLAP), 0, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return left + "\n" + right
+
+
+def format_provisions(docs: List[Document]) -> str:
+    """Treść przepisów z nagłówkami AKT – art. X § Y (jeden blok na przepis)."""
+    if not docs:
+        return "Nie znaleziono wskazanego przepisu w bazie."
 
+    blocks = {}
+    for d in docs:
+        meta = d.metadata or {}
+        key = (meta.get("act_name"), meta.get("article"), meta.get("paragraph"))
+        text = d.page_content.strip()
+        blocks[key] = _merge_overlap(blocks[key], text) if key in blocks else text
 
+    parts = []
+    for (act, article, paragraph), text in blocks.items():
+        header = f"**{act} – art. {article}"
+        if paragraph and paragraph != "all":
+            header += f" § {paragraph}"
+        parts.append(f"{header}**\n\n{text}")
+    return "\n\n---\n\n".join(parts)
 
-def build_rag_chain(llm, retriever, qa_prompt, document_prompt):
+
+def build_rag_chain(llm, retriever, qa_prompt, document_prompt, query_log=None):
     """
     Tworzy Retrieval-Augmented Generation chain
     - llm: model LLM
     - retriever: instancja retrievera Chroma
     - qa_prompt: prompt z zmiennymi ['context', 'input']
     - document_prompt: formatowanie pojedynczego dokumentu
+    - query_log: QueryLog (src.warmup) albo None – log pytań, z którego rozgrzewamy cache po starcie
+    Wejście: {"input": pytanie, "mode": "auto" | "lookup" | "generate"} (mode opcjonalny),
+    opcjonalnie "context" – gotowe dokumenty (np. z retriever.batch_retrieve), wtedy bez retrievalu.
+    "warmup": True oznacza żądanie rozgrzewki – nie trafia do logu pytań ani do pomiaru SLO.
+    Wynik zawiera dodatkowo "path": "lookup" albo "generate", "timings" (ms na etap)
+    oraz "retrieval_budget" (faktycznie użyte k / fetch_k / search_type; None dla ścieżki lookup).
     """
     # Łańcuch łączący dokumenty z promptem
     stuff_chain = create_stuff_documents_chain(
@@ -26,7 +73,44 @@ def build_rag_chain(llm, retriever, qa_prompt, document_prompt):
         combine_docs_chain=stuff_chain
     )
 
-    # Zwracamy oba obiekty:
-    # - rag_chain (do automatycznego wyszukiwania)
-    # - stuff_chain (do ręcznego podania dokumentów, np. po rerankingu BM25)
-    return rag_chain
\ No newline at end of file
+    can_lookup = hasattr(retriever, "lookup_provisions") and hasattr(retriever, "is_lookup_query")
+    budget_policy = getattr(retriever, "budget_policy", None)
+
+    def _run(inputs: dict, mode: str) -> dict:
+        query = inputs["input"]
+
+        # Szybka ścieżka: treść przepisu bez wywołania LLM
+        if can_lookup and (mode == "lookup" or (mode == "auto" and retriever.is_lookup_query(query))):
+            with stage("lookup"):
+                docs = retriever.lookup_provisions(query)
+            if docs or mode == "lookup":
+                return {"input": query, "context": docs, "answer": format_provisions(docs), "path": "lookup"}
+
+        if inputs.get("context") is not None:
+            docs = inputs["context"]
+            answer = stuff_chain.invoke({"input": query, "context": docs})
+            return {"input": query, "context": docs, "answer": answer, "path": "generate"}
+
+        result = rag_chain.invoke({k: v for k, v in inputs.items() if k not in ("mode", "warmup")})
+        return {**result, "path": "generate"}
+
+    def _invoke(inputs: dict) -> dict:
+        mode = inputs.get("mode") or "auto"
+        if mode not in MODES:
+            raise ValueError(f"Nieznany tryb: {mode} (dostępne: {', '.join(MODES)})")
+        warmup = bool(inputs.get("warmup"))
+        if query_log is not None and not warmup:
+            query_log.record(inputs["input"])
+        with trace_request() as trace:
+            result = _run(inputs, mode)
+        # Do SLO liczymy tylko żądania z generacją – lookup jest o rzędy wielkości szybszy
+        if budget_policy is not None and result["path"] == "generate" and not warmup:
+            budget_policy.observe(trace.stages["total"])
+        return {
+            **result,
+            "timings": dict(trace.stages),
+            "retrieval_budget": trace.info.get("retrieval_budget"),
+            "trace": dict(trace.info),
+        }
+
+    return RunnableLambda(_invoke)
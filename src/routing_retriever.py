@@ -1,10 +1,19 @@
+import json
 import re
-from typing import List, Optional, Any, Tuple
+from typing import Dict, List, Optional, Any, Tuple
+
+import numpy as np
 
 from langchain_core.documents import Document
 from langchain_core.retrievers import BaseRetriever
 
 from src.routing import route_act_names
+from src.metrics import annotate, stage
+from src.load_budget import RetrievalBudget, budget_for_level
+from src.numpy_store import mmr_select
+from src.dedup import HAS_DUPLICATES_KEY, duplicate_pointers, expand_pointer
+from src.xref_graph import chunk_order, normalize_article
+from src.config import XREF_MAX_DOCS
 
 
 class ActRoutingRetriever(BaseRetriever):
@@ -14,6 +23,9 @@ class ActRoutingRetriever(BaseRetriever):
       - MMR (max_marginal_relevance_search) dla lepszej różnorodności wyników
       - filtr sankcyjny dla pytań "co grozi / jaka kara"
       - jeśli pytanie sankcyjne i brak przepisów sankcyjnych -> zwróć pustą listę (wymusi "Brak podstaw...")
+      - gdy aliasy nic nie dopasują: routing po centroidach aktów (centroid_router)
+      - pod obciążeniem budget_policy zmniejsza k / fetch_k i przełącza MMR na similarity
+      - przepisy przywołane w wynikach ("art. 278 § 1") dociągane po id z grafu odwołań (xref_graph)
     """
     vectorstore: Any
     k: int = 12
@@ -28,9 +40,21 @@ class ActRoutingRetriever(BaseRetriever):
     enable_sanction_filter: bool = True
     sanction_k: int = 6            # ile doców sankcyjnych ostatecznie przepuścić
 
+    centroid_router: Any = None    # CentroidRouter; None = tylko aliasy
+    budget_policy: Any = None      # LoadAwareBudget; None = zawsze pełne ustawienia powyżej
+
+    xref_graph: Any = None         # CrossRefGraph; None = bez dociągania przywołanych przepisów
+    xref_k: int = XREF_MAX_DOCS    # ile przywołanych fragmentów najwyżej dołożyć
+
     _SANCTION_Q = ("co grozi", "jaka kara", "jaką karę", "kara", "sankcj", "odpowiedzialnosc")
     _SANCTION_T = ("podlega karze", "pozbawienia wolności", "grzywn", "areszt", "ograniczenia wolności", "kara")
 
+    # Szybka ścieżka "pokaż przepis" (bez LLM)
+    _LOOKUP_Q = ("pokaż", "pokaz", "treść", "tresc", "brzmienie", "jak brzmi", "przytocz", "zacytuj",
+                 "cytuj", "wyświetl", "wyswietl", "tekst")
+    _NOT_LOOKUP_Q = ("czy ", "co grozi", "jaka kara", "jaką karę", "dlaczego", "kiedy", "wyjaśnij",
+                     "wyjasnij", "porównaj", "różnic", "interpret", "czym jest", "co to")
+
     def _extract_refs(self, query: str) -> Tuple[Optional[str], Optional[str]]:
         article_match = re.search(r"(?:art\.?|artykuł)\s*(\d+[a-z]*)", query, re.IGNORECASE)
         paragraph_match = re.search(r"(?:§|par\.?|paragraf)\s*(\d+[a-z]*)", query, re.IGNORECASE)
@@ -38,6 +62,67 @@ class ActRoutingRetriever(BaseRetriever):
         paragraph = paragraph_match.group(1).lower() if paragraph_match else None
         return article, paragraph
 
+    def is_lookup_query(self, query: str) -> bool:
+        """
+        Czyste wyszukanie przepisu: jest art. (+ opcjonalnie §), akt rozpoznany po aliasach
+        i albo czasownik typu "pokaż / treść / jak brzmi", albo sama sygnatura ("art. 148 § 1 kk").
+        """
+        article, _ = self._extract_refs(query)
+        if not article or not route_act_names(query, max_acts=1):
+            return False
+        q = query.lower().strip()
+        if any(x in q for x in self._NOT_LOOKUP_Q) and not any(x in q for x in self._LOOKUP_Q):
+            return False
+        if any(x in q for x in self._LOOKUP_Q):
+            return True
+        rest = re.sub(r"(?:art\.?|artykuł|§|par\.?|paragraf)\s*\d+[a-z]*", " ", q)
+        return len(re.findall(r"\w+", rest)) <= 3 and "?" not in q
+
+    def lookup_provisions(self, query: str) -> List[Document]:
+        """
+        Pobiera fragmenty wskazanego przepisu filtrem po metadanych (bez wyszukiwania wektorowego),
+        w kolejności chunków w pliku źródłowym.
+        """
+        act_names = route_act_names(query, max_acts=1)
+        article, paragraph = self._extract_refs(query)
+        if not act_names or not article:
+            return []
+
+        where = self._where_article(act_names, article, paragraph)
+        raw = self.vectorstore.get(where=where, include=["documents", "metadatas"])
+        docs = [
+            Document(page_content=text or "", metadata=meta or {}, id=doc_id)
+            for doc_id, text, meta in zip(raw.get("ids") or [], raw.get("documents") or [], raw.get("metadatas") or [])
+        ]
+        # Zwinięte duplikaty dokładamy zawsze – artykuł może mieć tylko jeden ustęp zwinięty
+        # (np. KM art. 273 § 4), a pozostałe w bazie
+        known = {d.id for d in docs}
+        docs += [d for d in self._lookup_collapsed(act_names, article, paragraph) if d.id not in known]
+        docs.sort(key=lambda d: ((d.metadata or {}).get("source") or "", chunk_order(d.id)))
+
+        if self.debug:
+            print(f"[DEBUG] LOOKUP: {act_names[0]} art. {article}" + (f" § {paragraph}" if paragraph else "")
+                  + f" -> {len(docs)} fragmentów")
+        return docs
+
+    def _lookup_collapsed(self, act_names: List[str], article: str, paragraph: Optional[str]) -> List[Document]:
+        """
+        Przepisy zwinięte przy ingestii jako duplikaty (np. "§ 1. (uchylony)"): szukamy ich
+        na listach wskaźników reprezentantów danego aktu i odtwarzamy z tekstu reprezentanta.
+        """
+        where = {"$and": [self._where(act_names), {HAS_DUPLICATES_KEY: True}]}
+        raw = self.vectorstore.get(where=where, include=["documents", "metadatas"])
+        docs = []
+        for doc_id, text, meta in zip(raw.get("ids") or [], raw.get("documents") or [], raw.get("metadatas") or []):
+            rep = Document(page_content=text or "", metadata=meta or {}, id=doc_id)
+            for pointer in duplicate_pointers(rep):
+                if str(pointer.get("article", "")).lower() != article:
+                    continue
+                if paragraph and str(pointer.get("paragraph", "")).lower() not in (paragraph, "all"):
+                    continue
+                docs.append(expand_pointer(rep, pointer))
+        return docs
+
     def _is_sanction_question(self, query: str) -> bool:
         q = query.lower()
         return any(x in q for x in self._SANCTION_Q)
@@ -60,34 +145,86 @@ class ActRoutingRetriever(BaseRetriever):
             filters.append({"$or": [{"paragraph": paragraph}, {"paragraph": "all"}]})
         return {"$and": filters}
 
-    def _search(self, query: str, where: Optional[dict]) -> List[Document]:
+    def _embed_query(self, query: str) -> List[float]:
+        return self.vectorstore.embeddings.embed_query(query)
+
+    def route(self, query: str, embedding: Optional[List[float]] = None) -> Tuple[List[str], str, Optional[List[float]]]:
+        """
+        Zwraca (akty, źródło routingu, embedding pytania albo None).
+        Embedding liczymy tylko dla routingu po centroidach i używamy go potem w wyszukiwaniu
+        (albo bierzemy gotowy – batch_retrieve liczy wektory wszystkich pytań naraz).
+        """
+        act_names = route_act_names(query, max_acts=self.max_acts)
+        if act_names or self.centroid_router is None:
+            return act_names, "aliases" if act_names else "fallback", embedding
+
+        if embedding is None:
+            with stage("embed"):
+                embedding = self._embed_query(query)
+        act_names, scores = self.centroid_router.route(embedding, max_acts=self.max_acts)
+        if self.debug:
+            print(f"[DEBUG] CENTROID SCORES: {scores}")
+        return act_names, "centroids" if act_names else "fallback", embedding
+
+    def current_budget(self) -> RetrievalBudget:
+        """Budżet dla bieżącego żądania (zapisywany w śladzie żądania jako "retrieval_budget")."""
+        if self.budget_policy is None:
+            budget, signals = budget_for_level(self, 0), {}
+        else:
+            budget, signals = self.budget_policy.budget_for(self)
+        annotate("retrieval_budget", {**budget.as_dict(), **signals})
+        if self.debug and budget.level:
+            print(f"[DEBUG] BUDGET: {budget.name} (k={budget.k}, fetch_k={budget.fetch_k}, {budget.search_type}) {signals}")
+        return budget
+
+    def _search(
+        self,
+        query: str,
+        where: Optional[dict],
+        embedding: Optional[List[float]] = None,
+        budget: Optional[RetrievalBudget] = None,
+    ) -> List[Document]:
         """
         Chroma wspiera:
           - similarity_search(query, k=..., filter=...)
           - max_marginal_relevance_search(query, k=..., fetch_k=..., lambda_mult=..., filter=...)
+        oraz warianty *_by_vector, gdy embedding pytania jest już policzony.
         """
-        if self.search_type == "mmr":
+        b = budget or budget_for_level(self, 0)
+
+        if embedding is not None:
+            if b.search_type == "mmr":
+                return self.vectorstore.max_marginal_relevance_search_by_vector(
+                    embedding,
+                    k=b.k,
+                    fetch_k=b.fetch_k,
+                    lambda_mult=b.lambda_mult,
+                    filter=where,
+                )
+            return self.vectorstore.similarity_search_by_vector(embedding, k=b.k, filter=where)
+
+        if b.search_type == "mmr":
             if where:
                 return self.vectorstore.max_marginal_relevance_search(
                     query,
-                    k=self.k,
-                    fetch_k=self.fetch_k,
-                    lambda_mult=self.lambda_mult,
+                    k=b.k,
+                    fetch_k=b.fetch_k,
+                    lambda_mult=b.lambda_mult,
                     filter=where,
                 )
             return self.vectorstore.max_marginal_relevance_search(
                 query,
-                k=self.k,
-                fetch_k=self.fetch_k,
-                lambda_mult=self.lambda_mult,
+                k=b.k,
+                fetch_k=b.fetch_k,
+                lambda_mult=b.lambda_mult,
             )
 
         # similarity fallback
         if where:
-            return self.vectorstore.similarity_search(query, k=self.k, filter=where)
-        return self.vectorstore.similarity_search(query, k=self.k)
+            return self.vectorstore.similarity_search(query, k=b.k, filter=where)
+        return self.vectorstore.similarity_search(query, k=b.k)
 
-    def _filter_sanctions(self, query: str, docs: List[Document]) -> List[Document]:
+    def _filter_sanctions(self, query: str, docs: List[Document], sanction_k: Optional[int] = None) -> List[Document]:
         """
         Jeśli pytanie dotyczy sankcji, zostaw tylko fragmenty mające język sankcyjny.
         Jeśli po filtrze nie ma nic -> zwróć [] (wymusi "Brak podstaw..." na promptcie).
@@ -118,27 +255,181 @@ class ActRoutingRetriever(BaseRetriever):
         if not best:
             return []
 
-        return best[: self.sanction_k]
+        return best[: sanction_k or self.sanction_k]
+
+    def _search_filtered(
+        self, query: str, where: Optional[dict], embedding: List[float], budget: RetrievalBudget
+    ) -> List[Document]:
+        with stage("search"):
+            docs = self._search(query, where, embedding, budget)
+        with stage("sanction_filter"):
+            return self._filter_sanctions(query, docs, budget.sanction_k)
+
+    def expand_references(self, docs: List[Document], xref_k: Optional[int] = None) -> List[Document]:
+        """
+        Dokłada przepisy przywołane we fragmentach (krawędzie grafu odwołań, jeden get po id,
+        bez wyszukiwania wektorowego). Kolejność: odwołania z wyżej ocenionych fragmentów najpierw;
+        przepisy już obecne w wynikach pomijamy.
+        """
+        limit = self.xref_k if xref_k is None else xref_k
+        if self.xref_graph is None or not docs or limit <= 0:
+            return docs
+
+        with stage("xref"):
+            present = {d.id for d in docs}
+            covered = {
+                ((d.metadata or {}).get("act_name"), normalize_article((d.metadata or {}).get("article")))
+                for d in docs
+            }
+            wanted: List[str] = []
+            for act, article, paragraph in self.xref_graph.references(d.id for d in docs if d.id):
+                if len(wanted) >= limit:
+                    break
+                if (act, article) in covered:
+                    continue
+                for chunk_id in self.xref_graph.chunk_ids_for(act, article, paragraph):
+                    if chunk_id not in present and chunk_id not in wanted:
+                        wanted.append(chunk_id)
+            wanted = wanted[:limit]
+            if not wanted:
+                return docs
+
+            raw = self.vectorstore.get(ids=wanted, include=["documents", "metadatas"])
+            by_id = {
+                doc_id: (text, meta)
+                for doc_id, text, meta in zip(raw.get("ids") or [], raw.get("documents") or [], raw.get("metadatas") or [])
+            }
+            extra = [
+                Document(page_content=by_id[i][0] or "", metadata={**(by_id[i][1] or {}), "xref": True}, id=i)
+                for i in wanted if i in by_id
+            ]
+
+        annotate("xref", [f"{(d.metadata or {}).get('act_name')} art. {(d.metadata or {}).get('article')}" for d in extra])
+        if self.debug and extra:
+            print(f"[DEBUG] XREF: +{len(extra)} przywołanych przepisów")
+        # Na końcu: nie przesuwamy fragmentów z wyszukiwania
+        return docs + extra
+
+    # ------------------------------------------------------------
+    #  Retrieval wsadowy (ewaluacje offline, prekomputacja popularnych pytań)
+    # ------------------------------------------------------------
+
+    def _search_many(
+        self, embeddings: List[List[float]], where: Optional[dict], budget: RetrievalBudget
+    ) -> List[List[Document]]:
+        """
+        Wyszukiwanie wielu wektorów z tym samym filtrem. Chroma: jedno zapytanie
+        z wieloma query_embeddings (+ MMR lokalnie na zwróconych wektorach),
+        inne vectorstore'y (NumpyVectorStore, snapshot, kompresja): pętla *_by_vector.
+        """
+        collection = getattr(self.vectorstore, "_collection", None)
+        if collection is None:
+            return [self._search("", where, emb, budget) for emb in embeddings]
+
+        mmr = budget.search_type == "mmr"
+        raw = collection.query(
+            query_embeddings=[list(map(float, e)) for e in embeddings],
+            n_results=budget.fetch_k if mmr else budget.k,
+            where=where,
+            include=["documents", "metadatas", "embeddings"] if mmr else ["documents", "metadatas"],
+        )
+        results = []
+        for j, emb in enumerate(embeddings):
+            docs = [
+                Document(page_content=text or "", metadata=meta or {}, id=doc_id)
+                for doc_id, text, meta in zip(raw["ids"][j], raw["documents"][j], raw["metadatas"][j])
+            ]
+            if mmr and docs:
+                picked = mmr_select(np.asarray(emb), np.asarray(raw["embeddings"][j]), budget.k, budget.lambda_mult)
+                docs = [docs[p] for p in picked]
+            results.append(docs)
+        return results
+
+    def batch_retrieve(self, queries: List[str], routes: Optional[list] = None) -> List[List[Document]]:
+        """
+        Te same wyniki co invoke() dla każdego pytania, ale liczone wsadowo:
+          1) embedding wszystkich pytań jednym wywołaniem embed_documents
+             (model bez instrukcji dla zapytań – te same wektory co embed_query),
+          2) routing wszystkich pytań (centroidy na gotowych wektorach),
+          3) grupowanie po filtrze i jedno zapytanie wielowektorowe na grupę,
+          4) per pytanie: filtr sankcyjny, fallbacki jak w _get_relevant_documents, odwołania.
+        Budżet retrievalu jest wspólny dla całego wsadu. Jeśli podano listę routes,
+        dopisywane są do niej (akty, źródło routingu) kolejnych pytań.
+        """
+        if not queries:
+            return []
+        with stage("embed"):
+            vectors = self.vectorstore.embeddings.embed_documents(list(queries))
+        budget = self.current_budget()
+
+        # Kolejne filtry dla pytania: art./§ -> akt(y) -> cały korpus (tylko po routingu centroidami)
+        plans: List[List[Optional[dict]]] = []
+        with stage("routing"):
+            for query, vec in zip(queries, vectors):
+                act_names, route_source, _ = self.route(query, vec)
+                if routes is not None:
+                    routes.append((act_names, route_source))
+                article, paragraph = self._extract_refs(query)
+                plan: List[Optional[dict]] = []
+                if act_names and article:
+                    plan.append(self._where_article(act_names, article, paragraph))
+                plan.append(self._where(act_names))
+                if route_source == "centroids":
+                    plan.append(None)
+                plans.append(plan)
+
+        results: List[List[Document]] = [[] for _ in queries]
+        pending = list(range(len(queries)))
+        step = 0
+        while pending:
+            groups: Dict[str, List[int]] = {}
+            for i in pending:
+                groups.setdefault(json.dumps(plans[i][step], sort_keys=True, ensure_ascii=False), []).append(i)
+
+            with stage("search"):
+                for key, members in groups.items():
+                    found = self._search_many([vectors[i] for i in members], json.loads(key), budget)
+                    for i, docs in zip(members, found):
+                        results[i] = self._filter_sanctions(queries[i], docs, budget.sanction_k)
+
+            step += 1
+            pending = [i for i in pending if not results[i] and step < len(plans[i])]
+
+        if self.debug:
+            print(f"[DEBUG] BATCH: {len(queries)} pytań, {step} rund(y) wyszukiwania")
+        return [self.expand_references(docs, budget.xref_k) for docs in results]
 
     def _get_relevant_documents(self, query: str) -> List[Document]:
-        act_names = route_act_names(query, max_acts=self.max_acts)
-        article, paragraph = self._extract_refs(query)
+        with stage("routing"):
+            act_names, route_source, embedding = self.route(query)
+            article, paragraph = self._extract_refs(query)
+        annotate("routing", act_names if act_names else "ALL (fallback)")
+        annotate("routing_source", route_source)
 
         if self.debug:
-            print(f"[DEBUG] ROUTING: {act_names if act_names else 'ALL (fallback)'}")
+            print(f"[DEBUG] ROUTING ({route_source}): {act_names if act_names else 'ALL (fallback)'}")
             if article:
                 print(f"[DEBUG] ARTICLE FILTER: art. {article}" + (f" § {paragraph}" if paragraph else ""))
 
+        # Embedding pytania liczymy raz (osobny etap w metrykach) i używamy we wszystkich wyszukiwaniach
+        if embedding is None:
+            with stage("embed"):
+                embedding = self._embed_query(query)
+
+        budget = self.current_budget()
+
         # 1) Jeśli user podał art./§ to próbujemy twardy filtr
         if act_names and article:
             where = self._where_article(act_names, article, paragraph)
-            docs = self._search(query, where)
-            docs = self._filter_sanctions(query, docs)
+            docs = self._search_filtered(query, where, embedding, budget)
             if docs:
-                return docs
+                return self.expand_references(docs, budget.xref_k)
 
         # 2) Normalnie: filtr po akcie (albo ALL)
         where = self._where(act_names)
-        docs = self._search(query, where)
-        docs = self._filter_sanctions(query, docs)
-        return docs
+        docs = self._search_filtered(query, where, embedding, budget)
+
+        # 3) Centroidy to tylko zawężenie – jeśli nic nie zostało, szukamy w całym korpusie
+        if not docs and route_source == "centroids":
+            docs = self._search_filtered(query, None, embedding, budget)
+        return self.expand_references(docs, budget.xref_k)
@@ -0,0 +1,258 @@
+# src/session_retriever.py
+"""
+Retriever sesji czatu: ponownie używa fragmentów pobranych we wcześniejszych turach.
+Pytania uzupełniające ("a jeśli wartość była 900 zł?") zwykle dotyczą tych samych przepisów:
+  - fragmenty z cache są oceniane tanio (kosinus do wektora pytania, bez wyszukiwania),
+  - nowe wyszukiwanie idzie tylko po brakujące akty albo gdy trafnych fragmentów jest za mało;
+    zmiana tematu zawsze wymusza wyszukiwanie – wykrywana z samego pytania (niskie podobieństwo
+    do poprzedniego pytania albo brak naprawdę trafnego fragmentu w cache), niezależnie od źródła
+    routingu, a dodatkowo przy routingu ogólnym i przy innych aktach z centroidów niż poprzednio,
+  - kolejność fragmentów jest stabilna (najpierw starsze z cache), więc początek promptu
+    się nie zmienia i Ollama może użyć cache promptu.
+Bazowy ActRoutingRetriever jest współdzielony przez sesje; stan sesji trzyma SessionCache.
+Fragmenty z plików wgranych w sesji (SessionUploadIndex) są dokładane na końcu kontekstu.
+"""
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from src.config import (
+    SESSION_CACHE_MAX_DOCS,
+    SESSION_CACHE_MIN_SIM,
+    SESSION_CACHE_MIN_REUSE,
+    SESSION_TOPIC_MIN_SIM,
+    SESSION_TOPIC_MIN_BEST_SIM,
+    UPLOAD_K,
+    UPLOAD_MIN_SIM,
+)
+from src.metrics import annotate, stage
+from src.numpy_store import normalize_rows
+
+_FOLLOW_UP = re.compile(
+    r"^\s*(a\s|a,|i\s|oraz\s|co\s+jeśli|co\s+jesli|co\s+gdy|czy\s+wtedy|a\s+gdyby|jeśli\s+tak|jesli\s+tak|to\s+)",
+    re.IGNORECASE,
+)
+
+
+class SessionCache:
+    """Fragmenty pobrane w sesji (kolejność dodania) + ich wektory."""
+
+    def __init__(self, max_docs: int = SESSION_CACHE_MAX_DOCS):
+        self.max_docs = max_docs
+        self.docs: List[Document] = []
+        self.vectors = np.zeros((0, 0), dtype=np.float32)  # znormalizowane wiersze
+        self.acts: List[str] = []
+        self.last_query: Optional[str] = None
+        self.last_acts: List[str] = []     # akty z routingu ostatniego pytania (nie uzupełniającego)
+        self.store_id: Optional[int] = None
+        self.stats = {"turns": 0, "reused_only": 0, "searches": 0, "reused_docs": 0}
+
+    def clear(self) -> None:
+        self.docs, self.acts, self.last_query, self.last_acts = [], [], None, []
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+
+    def ids(self) -> set:
+        return {d.id for d in self.docs}
+
+    def add(self, docs: List[Document], vectors: np.ndarray) -> None:
+        """Dopisuje nowe fragmenty na końcu; po przekroczeniu limitu wypadają najstarsze."""
+        if not docs:
+            return
+        vectors = normalize_rows(np.asarray(vectors, dtype=np.float32))
+        self.docs.extend(docs)
+        self.vectors = vectors if not len(self.vectors) else np.vstack([self.vectors, vectors])
+        for d in docs:
+            act = (d.metadata or {}).get("act_name")
+            if act and act not in self.acts:
+                self.acts.append(act)
+        if len(self.docs) > self.max_docs:
+            drop = len(self.docs) - self.max_docs
+            self.docs, self.vectors = self.docs[drop:], self.vectors[drop:]
+            self.acts = list(dict.fromkeys((d.metadata or {}).get("act_name") for d in self.docs if d.metadata))
+
+    def best_similarity(self, query_vec: np.ndarray, acts: Optional[List[str]] = None) -> float:
+        """Najwyższe podobieństwo fragmentu z cache do pytania (opcjonalnie tylko z podanych aktów)."""
+        if not self.docs:
+            return -1.0
+        sims = self.vectors @ query_vec
+        if acts:
+            sims = sims[np.array([(d.metadata or {}).get("act_name") in acts for d in self.docs])]
+        return float(sims.max()) if len(sims) else -1.0
+
+    def relevant(self, query_vec: np.ndarray, min_sim: float, limit: int, acts: Optional[List[str]] = None) -> List[int]:
+        """Indeksy najtrafniejszych fragmentów (>= min_sim, opcjonalnie tylko z podanych aktów), w kolejności cache."""
+        if not self.docs:
+            return []
+        sims = self.vectors @ query_vec
+        if acts:
+            allowed = np.array([(d.metadata or {}).get("act_name") in acts for d in self.docs])
+            sims = np.where(allowed, sims, -np.inf)
+        best = [int(i) for i in np.argsort(-sims)[:limit] if sims[i] >= min_sim]
+        return sorted(best)
+
+
+class SessionRetriever(BaseRetriever):
+    """Nakładka sesyjna na ActRoutingRetriever (base)."""
+
+    base: Any
+    cache: Any = None              # SessionCache; jeden obiekt na sesję
+    min_sim: float = SESSION_CACHE_MIN_SIM
+    min_reuse: int = SESSION_CACHE_MIN_REUSE
+    topic_min_sim: float = SESSION_TOPIC_MIN_SIM
+    topic_min_best_sim: float = SESSION_TOPIC_MIN_BEST_SIM
+    uploads: Any = None            # SessionUploadIndex; None = bez załączników
+
+    def model_post_init(self, __context: Any) -> None:
+        if self.cache is None:
+            self.cache = SessionCache()
+
+    # Szybka ścieżka lookup i polityka budżetu – bez zmian, z bazowego retrievera
+    def is_lookup_query(self, query: str) -> bool:
+        return self.base.is_lookup_query(query)
+
+    def lookup_provisions(self, query: str) -> List[Document]:
+        return self.base.lookup_provisions(query)
+
+    @property
+    def budget_policy(self):
+        return self.base.budget_policy
+
+    def reset(self) -> None:
+        self.cache.clear()
+
+    def _remember(self, docs: List[Document]) -> None:
+        """Dopisuje do cache nowe fragmenty razem z ich wektorami (jeden get po id)."""
+        known = self.cache.ids()
+        new = [d for d in docs if d.id and d.id not in known]
+        if not new:
+            return
+        raw = self.base.vectorstore.get(ids=[d.id for d in new], include=["embeddings"])
+        vectors = raw.get("embeddings")
+        by_id = dict(zip(raw.get("ids") or [], vectors if vectors is not None else []))
+        new = [d for d in new if d.id in by_id]
+        if new:
+            self.cache.add(new, np.asarray([by_id[d.id] for d in new], dtype=np.float32))
+
+    def _get_relevant_documents(self, query: str) -> List[Document]:
+        docs, embedding = self._corpus_documents(query)
+        if self.uploads is None or not self.uploads.has_documents():
+            return docs
+
+        with stage("uploads_search"):
+            if embedding is None:
+                embedding = self.base._embed_query(query)
+            extra = self.uploads.search(embedding, UPLOAD_K, UPLOAD_MIN_SIM)
+        annotate("uploads", len(extra))
+        # Po fragmentach korpusu – nie przesuwamy stabilnego początku kontekstu
+        return docs + extra
+
+    def _corpus_documents(self, query: str) -> Tuple[List[Document], Optional[List[float]]]:
+        base, cache = self.base, self.cache
+        cache.stats["turns"] += 1
+
+        # Podmiana wersji indeksu (IndexWatcher) unieważnia cache – id chunków mogą się zmienić
+        if cache.store_id != id(base.vectorstore):
+            cache.clear()
+            cache.store_id = id(base.vectorstore)
+
+        # Jawne art./§ albo pusta sesja: zwykła ścieżka bazowa, wynik trafia do cache
+        article, _ = base._extract_refs(query)
+        if article or not cache.docs:
+            docs = base.invoke(query)
+            with stage("session_cache"):
+                self._remember(docs)
+            cache.last_query = query
+            cache.last_acts = list(dict.fromkeys(
+                d.metadata.get("act_name") for d in docs if d.metadata and not d.metadata.get("xref")
+            ))
+            cache.stats["searches"] += 1
+            annotate("session_cache", {"reused": 0, "searched": True})
+            return docs, None
+
+        with stage("routing"):
+            act_names, route_source, embedding = base.route(query)
+        if embedding is None:
+            with stage("embed"):
+                embedding = base._embed_query(query)
+        query_vec = normalize_rows(np.asarray(embedding, dtype=np.float32))
+
+        follow_up = bool(_FOLLOW_UP.match(query))
+        if follow_up and route_source == "fallback":
+            # Pytanie uzupełniające bez własnego routingu dziedziczy akty z sesji
+            act_names, route_source = list(cache.acts[: base.max_acts]), "session"
+        annotate("routing", act_names if act_names else "ALL (fallback)")
+        annotate("routing_source", route_source)
+
+        budget = base.current_budget()
+
+        with stage("session_cache"):
+            # Wektor trafności: dla pytań uzupełniających mieszamy z poprzednim pytaniem
+            rel_vec, query_sim = query_vec, None
+            if cache.last_query:
+                last_vec = normalize_rows(np.asarray(base._embed_query(cache.last_query), dtype=np.float32))
+                query_sim = float(query_vec @ last_vec)
+                if follow_up:
+                    rel_vec = normalize_rows(query_vec + last_vec)
+            reused_idx = cache.relevant(rel_vec, self.min_sim, budget.k, act_names)
+            reused = [cache.docs[i] for i in reused_idx]
+            missing_acts = [a for a in act_names if a not in cache.acts]
+            best_sim = cache.best_similarity(rel_vec, act_names)
+
+        # Zmiana tematu – cache nie może zastąpić wyszukiwania. Z samego pytania (dla każdego
+        # źródła routingu): nowe pytanie mało podobne do poprzedniego albo żaden fragment z cache
+        # nie jest naprawdę trafny (np. kradzież -> zabójstwo, oba w KK przez aliasy). Z routingu:
+        # routing ogólny (fallback) albo inne akty z centroidów niż w poprzedniej turze.
+        topic_reasons = []
+        if not follow_up and query_sim is not None and query_sim < self.topic_min_sim:
+            topic_reasons.append("query")
+        if best_sim < self.topic_min_best_sim:
+            topic_reasons.append("cache")
+        if route_source == "fallback" or (route_source == "centroids" and set(act_names) != set(cache.last_acts)):
+            topic_reasons.append("routing")
+        topic_change = bool(topic_reasons)
+
+        new_docs: List[Document] = []
+        searched = False
+        if missing_acts and not topic_change:
+            new_docs = base._search_filtered(query, base._where(missing_acts), embedding, budget)
+            searched = True
+        if topic_change or len(reused) + len(new_docs) < min(self.min_reuse, budget.k):
+            searched = True
+            found = base._search_filtered(query, base._where(act_names), embedding, budget)
+            # Jak w ActRoutingRetriever: centroidy tylko zawężają – pusto = cały korpus
+            if not found and route_source == "centroids":
+                found = base._search_filtered(query, None, embedding, budget)
+            if topic_change:
+                # Z cache zostaje tylko to, co wyszukiwanie i tak zwróciło (stabilna kolejność)
+                found_ids = {d.id for d in found}
+                reused = [d for d in reused if d.id in found_ids]
+            known = {d.id for d in reused + new_docs}
+            new_docs += [d for d in found if d.id not in known]
+
+        with stage("session_cache"):
+            known = {d.id for d in reused}
+            new_docs = [d for d in new_docs if d.id not in known][: max(0, budget.k - len(reused))]
+            self._remember(new_docs)
+        # Pytanie uzupełniające nie zastępuje pytania, do którego się odnosi
+        if not follow_up:
+            cache.last_query = query
+            cache.last_acts = list(act_names)
+
+        # Stabilna kolejność: fragmenty z cache (kolejność sesji), potem nowe
+        docs = base._filter_sanctions(query, reused + new_docs, budget.sanction_k)
+        docs = base.expand_references(docs, budget.xref_k)
+
+        cache.stats["searches" if searched else "reused_only"] += 1
+        cache.stats["reused_docs"] += len(reused)
+        info: Dict[str, Any] = {"reused": len(reused), "new": len(new_docs), "searched": searched}
+        if topic_change:
+            info["topic_change"] = topic_reasons
+        if missing_acts:
+            info["missing_acts"] = missing_acts
+        annotate("session_cache", info)
+        if base.debug:
+            print(f"[DEBUG] SESSION CACHE: {info} | follow_up={follow_up} | acts={act_names}")
+        return docs, embedding
@@ -0,0 +1,252 @@
+# src/snapshot_store.py
+"""
+Snapshot indeksu tylko do odczytu, mapowany do pamięci (np.memmap / mmap).
+Wiele procesów serwujących otwiera ten sam snapshot – strony pliku są
+współdzielone przez cache systemu operacyjnego, więc N workerów nie kosztuje
+N kopii wektorów, tekstów ani metadanych.
+
+Układ katalogu (SNAPSHOT_DIR w katalogu wersji indeksu):
+  manifest.json           – liczba chunków, wymiar, suma kontrolna wektorów, kolumny filtrów,
+                            wersja, odcisk danych źródłowych
+  vectors.npy             – macierz float32 [N, dim]
+  ids.bin / ids.idx.npy   – id chunków (UTF-8 sklejone + offsety int64 [N+1])
+  texts.bin / texts.idx.npy
+  metas.bin / metas.idx.npy – metadane jako JSON per wiersz
+  col_<pole>.npy          – kody int32 wartości pól filtrów (act_name, article, paragraph)
+"""
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from src.config import SNAPSHOT_DIR, SNAPSHOT_FILTER_COLUMNS, INGEST_JOURNAL_FILE
+from src.numpy_store import NumpyVectorStore, export_chroma, match_where, vectors_checksum
+
+MANIFEST_FILE = "manifest.json"
+_FORMAT_VERSION = 1
+_CHROMA_SQLITE = "chroma.sqlite3"
+
+
+# ============================================================
+#  ZAPIS
+# ============================================================
+
+def _write_packed(path: str, items: Sequence[bytes]) -> None:
+    offsets = np.zeros(len(items) + 1, dtype=np.int64)
+    with open(path + ".bin", "wb") as f:
+        for i, data in enumerate(items):
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    np.save(path + ".idx.npy", offsets)
+
+
+def _value_key(value) -> str:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+def source_fingerprint(db_path: str) -> str:
+    """
+    Odcisk danych bazy. Każda ingestia (build_vector_store) przepisuje dziennik ingestii,
+    więc odcisk zmienia się także bez publikacji wersji (zwykłe DB_PATH). Baza bez dziennika:
+    rozmiar i mtime pliku SQLite Chroma.
+    """
+    h = hashlib.sha1()
+    journal = os.path.join(db_path, INGEST_JOURNAL_FILE)
+    if os.path.exists(journal):
+        with open(journal, "rb") as f:
+            h.update(f.read())
+    else:
+        sqlite = os.path.join(db_path, _CHROMA_SQLITE)
+        if os.path.exists(sqlite):
+            st = os.stat(sqlite)
+            h.update(f"{st.st_size}:{st.st_mtime_ns}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def snapshot_is_current(manifest: Optional[dict], db_path: str, version: Optional[str] = None) -> bool:
+    """Snapshot pasuje do wersji indeksu i do danych, z których powstał (i ma sumę kontrolną wektorów)."""
+    return (
+        manifest is not None
+        and manifest.get("version") == version
+        and manifest.get("source") == source_fingerprint(db_path)
+        and bool(manifest.get("vectors_sha1"))
+    )
+
+
+def export_snapshot(
+    db,
+    out_dir: str,
+    version: Optional[str] = None,
+    columns: Sequence[str] = SNAPSHOT_FILTER_COLUMNS,
+    source: Optional[str] = None,
+) -> dict:
+    """
+    Eksportuje cały indeks (Chroma albo NumpyVectorStore) do katalogu snapshotu.
+    Zapis do katalogu tymczasowego i rename – czytelnicy nie zobaczą połowy snapshotu.
+    source – odcisk danych (source_fingerprint) liczony PRZED eksportem.
+    """
+    ids, vectors, texts, metas = export_chroma(db)
+    tmp_dir = out_dir.rstrip("/\\") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    np.save(os.path.join(tmp_dir, "vectors.npy"), np.ascontiguousarray(vectors, dtype=np.float32))
+    _write_packed(os.path.join(tmp_dir, "ids"), [i.encode("utf-8") for i in ids])
+    _write_packed(os.path.join(tmp_dir, "texts"), [(t or "").encode("utf-8") for t in texts])
+    _write_packed(os.path.join(tmp_dir, "metas"), [json.dumps(m, ensure_ascii=False).encode("utf-8") for m in metas])
+
+    # Kolumny filtrów: maska liczona wektorowo zamiast dekodowania metadanych każdego wiersza
+    vocab: Dict[str, List[str]] = {}
+    for col in columns:
+        codes_by_value: Dict[str, int] = {}
+        codes = np.full(len(ids), -1, dtype=np.int32)
+        for i, m in enumerate(metas):
+            if col in m:
+                codes[i] = codes_by_value.setdefault(_value_key(m[col]), len(codes_by_value))
+        np.save(os.path.join(tmp_dir, f"col_{col}.npy"), codes)
+        vocab[col] = list(codes_by_value)
+
+    manifest = {
+        "format": _FORMAT_VERSION,
+        "version": version,
+        "source": source,
+        "count": len(ids),
+        "dim": int(vectors.shape[1]) if len(ids) else 0,
+        "vectors_sha1": vectors_checksum(vectors),
+        "columns": vocab,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    print(f"📦 Snapshot indeksu: {out_dir} ({manifest['count']} chunków, dim={manifest['dim']})")
+    return manifest
+
+
+def snapshot_dir_for(db_path: str) -> str:
+    return os.path.join(db_path, SNAPSHOT_DIR)
+
+
+def read_manifest(snapshot_dir: str) -> Optional[dict]:
+    path = os.path.join(snapshot_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ============================================================
+#  ODCZYT
+# ============================================================
+
+class PackedStrings(Sequence):
+    """Sekwencja napisów dekodowanych na żądanie z mapowanego pliku (bez kopii w pamięci procesu)."""
+
+    def __init__(self, path: str, decode_json: bool = False):
+        self._offsets = np.load(path + ".idx.npy", mmap_mode="r")
+        size = int(self._offsets[-1])
+        self._data = np.memmap(path + ".bin", dtype=np.uint8, mode="r") if size else np.zeros(0, dtype=np.uint8)
+        self._decode_json = decode_json
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        text = self._data[start:end].tobytes().decode("utf-8")
+        return json.loads(text) if self._decode_json else text
+
+
+class MmapSnapshotStore(NumpyVectorStore):
+    """NumpyVectorStore na snapshocie z dysku: wektory, teksty i metadane mapowane tylko do odczytu."""
+
+    def __init__(self, embeddings, snapshot_dir: str):
+        manifest = read_manifest(snapshot_dir)
+        if manifest is None:
+            raise FileNotFoundError(f"Brak snapshotu indeksu: {snapshot_dir}")
+        if manifest.get("format") != _FORMAT_VERSION:
+            raise ValueError(f"Nieobsługiwany format snapshotu: {manifest.get('format')}")
+
+        self.snapshot_dir = snapshot_dir
+        self.manifest = manifest
+        vectors = np.load(os.path.join(snapshot_dir, "vectors.npy"), mmap_mode="r")
+        ids = PackedStrings(os.path.join(snapshot_dir, "ids"))
+        texts = PackedStrings(os.path.join(snapshot_dir, "texts"))
+        metas = PackedStrings(os.path.join(snapshot_dir, "metas"), decode_json=True)
+        super().__init__(embeddings, ids, vectors, texts, metas)
+
+        self._columns = {
+            col: np.load(os.path.join(snapshot_dir, f"col_{col}.npy"), mmap_mode="r")
+            for col in manifest.get("columns", {})
+        }
+        self._vocab = {
+            col: {key: code for code, key in enumerate(values)}
+            for col, values in manifest.get("columns", {}).items()
+        }
+
+    def _column_mask(self, where: dict) -> np.ndarray:
+        """Maska z kolumn kodów; KeyError, gdy filtr używa pola spoza kolumn."""
+        mask = np.ones(len(self.ids), dtype=bool)
+        for key, cond in where.items():
+            if key == "$and":
+                for c in cond:
+                    mask &= self._column_mask(c)
+            elif key == "$or":
+                any_mask = np.zeros(len(self.ids), dtype=bool)
+                for c in cond:
+                    any_mask |= self._column_mask(c)
+                mask &= any_mask
+            else:
+                codes = self._columns[key]
+                vocab = self._vocab[key]
+                ops = cond if isinstance(cond, dict) else {"$eq": cond}
+                for op, arg in ops.items():
+                    if op in ("$eq", "$ne"):
+                        hit = codes == vocab.get(_value_key(arg), -2)
+                        mask &= hit if op == "$eq" else ~hit
+                    elif op in ("$in", "$nin"):
+                        wanted = [vocab[_value_key(a)] for a in arg if _value_key(a) in vocab]
+                        hit = np.isin(codes, wanted)
+                        mask &= hit if op == "$in" else ~hit
+                    else:
+                        raise KeyError(op)
+        return mask
+
+    def _mask(self, where: Optional[dict]) -> Optional[np.ndarray]:
+        if not where:
+            return None
+        key = json.dumps(where, sort_keys=True, ensure_ascii=False)
+        mask = self._mask_cache.get(key)
+        if mask is None:
+            try:
+                mask = self._column_mask(where)
+            except KeyError:
+                mask = np.fromiter((match_where(m, where) for m in self.metadatas), dtype=bool, count=len(self.ids))
+            if len(self._mask_cache) >= self._MASK_CACHE_SIZE:
+                self._mask_cache.pop(next(iter(self._mask_cache)))
+            self._mask_cache[key] = mask
+        return mask
+
+
+def open_snapshot_store(embeddings, db_path: str, build_from=None, version: Optional[str] = None) -> MmapSnapshotStore:
+    """
+    Otwiera snapshot wersji indeksu; jeśli go nie ma, a podano build_from (vectorstore),
+    najpierw go eksportuje. Eksport robi jeden proces (nadzorca) przed startem workerów.
+    """
+    path = snapshot_dir_for(db_path)
+    if not snapshot_is_current(read_manifest(path), db_path, version):
+        if build_from is None:
+            if read_manifest(path) is None:
+                raise FileNotFoundError(f"Brak snapshotu indeksu: {path} (manage_index.py snapshot)")
+            print(f"⚠️ Snapshot {path} nie odpowiada danym bazy – odśwież go (manage_index.py snapshot).")
+        else:
+            export_snapshot(build_from, path, version=version, source=source_fingerprint(db_path))
+    return MmapSnapshotStore(embeddings, path)
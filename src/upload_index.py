@@ -0,0 +1,301 @@
+# src/upload_index.py
+"""
+Tymczasowy indeks plików wgranych w czacie (PDF, obrazy):
+  - tekst: pypdf dla PDF, OCR (pytesseract) dla obrazów,
+  - chunking jak przy ingestii korpusu, embedding w wątku w tle (czat nie czeka),
+  - indeks w pamięci sesji (NumpyVectorStore), nigdy nie zapisywany do chroma_db,
+  - limity pamięci: per sesja (usuwane najstarsze pliki) i łącznie (usuwane najdawniej
+    używane sesje); indeks sesji jest zwalniany po jej zakończeniu albo po UPLOAD_SESSION_TTL_S.
+"""
+import io
+import os
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.config import (
+    EMBED_BATCH_SIZE,
+    UPLOAD_MAX_SESSION_MB,
+    UPLOAD_MAX_TOTAL_MB,
+    UPLOAD_SESSION_TTL_S,
+    UPLOAD_OCR_LANG,
+)
+from src.numpy_store import NumpyVectorStore, normalize_rows
+
+_MB = 1024 * 1024
+
+# Jeden wątek embeddingu załączników na proces: nie konkuruje z zapytaniami o cały CPU/GPU
+_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload-embed")
+
+
+# ============================================================
+#  EKSTRAKCJA TEKSTU
+# ============================================================
+
+def extract_pages(name: str, data: bytes) -> List[Tuple[int, str]]:
+    """Zwraca [(numer strony, tekst)]; obrazy = jedna strona z OCR."""
+    ext = os.path.splitext(name)[1].lower()
+    if ext == ".pdf":
+        from pypdf import PdfReader
+
+        reader = PdfReader(io.BytesIO(data))
+        return [(i + 1, page.extract_text() or "") for i, page in enumerate(reader.pages)]
+    if ext in (".png", ".jpg", ".jpeg"):
+        try:
+            import pytesseract
+        except ImportError:
+            raise RuntimeError("OCR niedostępny (brak pakietu pytesseract).")
+        from PIL import Image
+
+        return [(1, pytesseract.image_to_string(Image.open(io.BytesIO(data)), lang=UPLOAD_OCR_LANG))]
+    raise ValueError(f"Nieobsługiwany typ pliku: {ext or name}")
+
+
+# ============================================================
+#  INDEKS SESJI
+# ============================================================
+
+class UploadedFile:
+    def __init__(self, name: str, size: int):
+        self.file_id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.size = size
+        self.status = "pending"        # pending -> parsing -> embedding -> ready | error | evicted
+        self.error: Optional[str] = None
+        self.chunks = 0
+        self.embedded = 0
+        self.docs: List[Document] = []
+        self.vectors: Optional[np.ndarray] = None
+
+    def memory_bytes(self) -> int:
+        vec = self.vectors.nbytes if self.vectors is not None else 0
+        return vec + sum(len(d.page_content.encode("utf-8")) for d in self.docs)
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "status": self.status,
+            "chunks": self.chunks,
+            "embedded": self.embedded,
+            "memory_mb": round(self.memory_bytes() / _MB, 2),
+            "error": self.error,
+        }
+
+
+class SessionUploadIndex:
+    """Załączniki jednej sesji: wyszukiwanie tylko po plikach w stanie "ready"."""
+
+    def __init__(self, embeddings, max_bytes: int = UPLOAD_MAX_SESSION_MB * _MB):
+        self.embeddings = embeddings
+        self.max_bytes = max_bytes
+        self.last_used = time.monotonic()
+        self._files: "OrderedDict[str, UploadedFile]" = OrderedDict()
+        self._store: Optional[NumpyVectorStore] = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    # --- dodawanie (w tle) ---
+
+    def add_file(self, name: str, data: bytes) -> Future:
+        entry = UploadedFile(name, len(data))
+        with self._lock:
+            if self._closed:
+                # Zwolniony przez TTL / limit łączny – indeks sesji bierzemy ponownie z session_uploads()
+                raise RuntimeError("Indeks załączników sesji został zwolniony.")
+            self._files[entry.file_id] = entry
+        self.last_used = time.monotonic()
+        return _EXECUTOR.submit(self._process, entry, data)
+
+    def _process(self, entry: UploadedFile, data: bytes) -> UploadedFile:
+        from src.vectorstore import _split_documents
+
+        try:
+            entry.status = "parsing"
+            pages = extract_pages(entry.name, data)
+            raw = [
+                Document(page_content=text, metadata={"source": entry.name, "page": page})
+                for page, text in pages if text and text.strip()
+            ]
+            if not raw:
+                raise ValueError("Nie znaleziono tekstu (skan bez warstwy tekstowej?).")
+            chunks = _split_documents(raw)
+            for i, chunk in enumerate(chunks):
+                chunk.id = f"upload:{entry.file_id}:{i}"
+                chunk.metadata.update({"act_name": f"Załącznik: {entry.name}", "upload": True})
+            entry.chunks = len(chunks)
+
+            entry.status = "embedding"
+            vectors: List[List[float]] = []
+            for start in range(0, len(chunks), EMBED_BATCH_SIZE):
+                if self._closed or entry.status == "evicted":
+                    entry.status = "evicted"
+                    return entry
+                batch = chunks[start:start + EMBED_BATCH_SIZE]
+                vectors.extend(self.embeddings.embed_documents([c.page_content for c in batch]))
+                entry.embedded += len(batch)
+
+            with self._lock:
+                if self._closed or entry.file_id not in self._files:
+                    entry.status = "evicted"
+                    return entry
+                entry.docs = chunks
+                entry.vectors = normalize_rows(np.asarray(vectors, dtype=np.float32))
+                entry.status = "ready"
+                self._enforce_limit()
+                self._rebuild()
+        except Exception as e:
+            entry.status = "error"
+            entry.error = f"{type(e).__name__}: {e}"
+        return entry
+
+    def _enforce_limit(self) -> None:
+        """Usuwa najstarsze gotowe pliki, aż indeks zmieści się w limicie (najnowszy zostaje zawsze)."""
+        ready = [f for f in self._files.values() if f.status == "ready"]
+        total = sum(f.memory_bytes() for f in ready)
+        for f in ready[:-1]:
+            if total <= self.max_bytes:
+                break
+            total -= f.memory_bytes()
+            self._evict_file(f)
+
+    def _evict_file(self, entry: UploadedFile) -> None:
+        entry.status = "evicted"
+        entry.docs, entry.vectors = [], None
+        self._files.pop(entry.file_id, None)
+
+    def _rebuild(self) -> None:
+        """Nowy NumpyVectorStore z gotowych plików; podmiana referencji jest atomowa dla czytelników."""
+        ready = [f for f in self._files.values() if f.status == "ready"]
+        if not ready:
+            self._store = None
+            return
+        docs = [d for f in ready for d in f.docs]
+        self._store = NumpyVectorStore(
+            self.embeddings,
+            [d.id for d in docs],
+            np.vstack([f.vectors for f in ready]),
+            [d.page_content for d in docs],
+            [d.metadata for d in docs],
+        )
+
+    # --- odczyt ---
+
+    def has_documents(self) -> bool:
+        return self._store is not None
+
+    def pending(self) -> bool:
+        return any(f.status in ("pending", "parsing", "embedding") for f in self._files.values())
+
+    def search(self, query_vec, k: int, min_sim: float) -> List[Document]:
+        """Najbliższe fragmenty załączników (kosinus >= min_sim)."""
+        self.last_used = time.monotonic()
+        store = self._store
+        if store is None:
+            return []
+        q = normalize_rows(np.asarray(query_vec, dtype=np.float32))
+        idx, scores = store._candidates(q, k, None)
+        # Wiersze znormalizowane: wynik 2q·x - ||x||² = 2cos - 1
+        return [store._doc(int(i)) for i, s in zip(idx, scores) if (s + 1) / 2 >= min_sim]
+
+    def wait_for(self, futures: Sequence[Future], timeout_s: float) -> bool:
+        _, not_done = wait(list(futures), timeout=timeout_s)
+        return not not_done
+
+    def status(self) -> List[dict]:
+        with self._lock:
+            return [f.as_dict() for f in self._files.values()]
+
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(f.memory_bytes() for f in self._files.values())
+
+    def close(self) -> None:
+        """Zwalnia pamięć; trwające embeddingi przerywają się przy następnym batchu."""
+        with self._lock:
+            self._closed = True
+            for f in list(self._files.values()):
+                self._evict_file(f)
+            self._store = None
+
+
+# ============================================================
+#  REJESTR SESJI
+# ============================================================
+
+class SessionToken:
+    """Znacznik życia sesji (do weakref.finalize)."""
+
+
+class UploadRegistry:
+    """Indeksy załączników wszystkich sesji procesu + sprzątanie (koniec sesji, TTL, limit łączny)."""
+
+    def __init__(self, max_total_bytes: int = UPLOAD_MAX_TOTAL_MB * _MB, ttl_s: float = UPLOAD_SESSION_TTL_S):
+        self.max_total_bytes = max_total_bytes
+        self.ttl_s = ttl_s
+        self._sessions: Dict[str, SessionUploadIndex] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+
+    def get(self, session_id: str, embeddings, owner=None) -> SessionUploadIndex:
+        """
+        Indeks sesji (tworzony przy pierwszym użyciu i ponownie po zwolnieniu przez TTL / limit).
+        Wołane w każdej turze odświeża last_used. owner – SessionToken trzymany w stanie
+        sesji; gdy sesja się kończy i token zbiera GC, indeks jest zwalniany.
+        """
+        with self._lock:
+            index = self._sessions.get(session_id)
+            if index is None or index._closed:
+                index = SessionUploadIndex(embeddings)
+                self._sessions[session_id] = index
+                if owner is not None:
+                    weakref.finalize(owner, self.evict, session_id)
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_loop, name="upload-reaper", daemon=True)
+                self._reaper.start()
+        index.last_used = time.monotonic()
+        return index
+
+    def evict(self, session_id: str) -> None:
+        with self._lock:
+            index = self._sessions.pop(session_id, None)
+        if index is not None:
+            index.close()
+
+    def reap(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            idle = [sid for sid, idx in self._sessions.items() if now - idx.last_used > self.ttl_s]
+        for sid in idle:
+            self.evict(sid)
+
+        # Limit łączny: zwalniamy najdawniej używane sesje
+        with self._lock:
+            by_age = sorted(self._sessions.items(), key=lambda kv: kv[1].last_used)
+        total = sum(idx.memory_bytes() for _, idx in by_age)
+        for sid, idx in by_age:
+            if total <= self.max_total_bytes:
+                break
+            total -= idx.memory_bytes()
+            self.evict(sid)
+
+    def _reap_loop(self, interval_s: float = 60.0) -> None:
+        while True:
+            time.sleep(interval_s)
+            try:
+                self.reap()
+            except Exception as e:
+                print(f"⚠️ Sprzątanie indeksów załączników nie powiodło się: {e}")
+
+
+_registry = UploadRegistry()
+
+
+def session_uploads(session_id: str, embeddings, owner=None) -> SessionUploadIndex:
+    return _registry.get(session_id, embeddings, owner)
@@ -1,6 +1,7 @@
 # src/vectorstore.py
 import os
 import json
+import hashlib
 from typing import List, Set, Tuple, Any, Optional
 
 from langchain_chroma import Chroma
@@ -13,8 +14,16 @@ from src.config import (
     EMBEDDING_MODEL,
     CHUNK_SIZE,
     CHUNK_OVERLAP,
-    RETRIEVER_K
+    RETRIEVER_K,
+    INGEST_BATCH_SIZE,
+    INGEST_JOURNAL_FILE,
+    EMBED_OVERLONG_POLICY,
+    DEDUP_ENABLED,
+    XREF_ENABLED,
 )
+from src.dedup import collapse_near_duplicates, format_shrink_report, split_header
+from src.embeddings import BucketedEmbeddings, sentence_transformer
+from src.xref_graph import CrossRefGraph
 
 # ============================================================
 #  HELPERS
@@ -153,97 +162,330 @@ def _load_json_files(docs_path: str, new_files: List[str]) -> List[Document]:
 
 
 # ============================================================
-#  MAIN
+#  DZIENNIK INGESTII (wznawianie po przerwaniu)
 # ============================================================
 
-def build_vector_store(embeddings) -> Tuple[Chroma, Any]:
+def _journal_path(db_path: str) -> str:
+    return os.path.join(db_path, INGEST_JOURNAL_FILE)
+
+
+def _load_journal(db_path: str) -> dict:
     """
-    Buduje lub aktualizuje bazę Chroma.
+    Dziennik ma postać:
+    {"files": {"kodeks_karny.json": {"status": "done" | "in_progress",
+                                     "fingerprint": "...", "total_chunks": N,
+                                     "batch_size": B, "done_batches": [0, 1, ...]}}}
     """
+    path = _journal_path(db_path)
+    if not os.path.exists(path):
+        return {"files": {}}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            journal = json.load(f)
+        if not isinstance(journal, dict) or not isinstance(journal.get("files"), dict):
+            raise ValueError("niepoprawny format dziennika")
+        return journal
+    except Exception as e:
+        print(f"   ⚠️ Nie udało się odczytać dziennika ingestii ({e}) – traktuję jako pusty.")
+        return {"files": {}}
+
+
+def _save_journal(db_path: str, journal: dict) -> None:
+    """Zapis atomowy: plik tymczasowy + os.replace (przerwanie nie zostawi połowy JSON-a)."""
+    os.makedirs(db_path, exist_ok=True)
+    path = _journal_path(db_path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(journal, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _file_fingerprint(file_path: str) -> str:
+    """SHA-1 zawartości pliku – zmiana aktu (nowelizacja) wymusza reindeksację."""
+    h = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _chunk_id(source: str, index: int, content: str) -> str:
+    """
+    Deterministyczne id chunka: ten sam plik + ta sama konfiguracja chunkingu
+    => te same id, więc ponowienie batcha to idempotentny upsert, a nie duplikat.
+    """
+    digest = hashlib.sha1(f"{source}\x00{index}\x00{content}".encode("utf-8")).hexdigest()
+    return f"{source}:{index}:{digest[:16]}"
 
 
-    db: Optional[Chroma] = None
-    existing_sources: Set[str] = set()
+def _source_ids(db: Chroma, source: str) -> List[str]:
+    try:
+        return db.get(where={"source": source}, include=[]).get("ids") or []
+    except Exception:
+        return []
 
-    # 1) Czy baza już istnieje?
-    if os.path.exists(DB_PATH) and os.listdir(DB_PATH):
-        print(f"✅ Wykryto istniejącą bazę w '{DB_PATH}'.")
-        db = Chroma(
-            persist_directory=DB_PATH,
-            embedding_function=embeddings,
+
+def _delete_source(db: Chroma, source: str) -> None:
+    ids = _source_ids(db, source)
+    for batch in _batched(ids, MAX_BATCH):
+        db.delete(ids=batch)
+    if ids:
+        print(f"   🧹 Usunięto {len(ids)} starych chunków pliku {source}.")
+
+
+def _split_documents(raw_docs: List[Document]) -> List[Document]:
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        separators=["\n\n", "\n", " ", ""],
+    )
+    return splitter.split_documents(raw_docs)
+
+
+def _split_overlong(chunks: List[Document], embeddings, max_tokens: Optional[int]) -> List[Document]:
+    """
+    Dzieli chunki dłuższe niż limit modelu na kawałki mieszczące się w max_tokens
+    (granice wg offsetów tokenizera), zamiast pozwolić modelowi po cichu je obciąć.
+    Każdy kawałek dostaje nagłówek chunka ("USTAWA: ... TREŚĆ PRZEPISU:"), tak jak pierwszy.
+    """
+    model = sentence_transformer(embeddings)
+    if model is None or not max_tokens:
+        return chunks
+
+    window = max_tokens - 2  # miejsce na tokeny specjalne (CLS/SEP)
+    result: List[Document] = []
+    for chunk in chunks:
+        text = chunk.page_content
+        if len(model.tokenizer(text, add_special_tokens=False)["input_ids"]) <= window:
+            result.append(chunk)
+            continue
+
+        header, body = split_header(text)
+        header_tokens = len(model.tokenizer(header, add_special_tokens=False)["input_ids"]) if header else 0
+        if header_tokens > window // 2:
+            header, body, header_tokens = "", text, 0  # nagłówek zjadłby większość okna
+        body_window = window - header_tokens - 2  # margines na styk nagłówka i treści przy tokenizacji
+        offsets = model.tokenizer(body, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+        for start in range(0, len(offsets), body_window):
+            part = offsets[start : start + body_window]
+            piece = body[part[0][0] : part[-1][1]].strip()
+            if piece:
+                result.append(Document(page_content=header + piece, metadata=dict(chunk.metadata)))
+    return result
+
+
+def _ingest_file(
+    db: Chroma,
+    db_path: str,
+    journal: dict,
+    filename: str,
+    chunks: List[Document],
+    fingerprint: str,
+    ids: Optional[List[str]] = None,
+) -> int:
+    """
+    Zapisuje chunki jednego pliku batchami, odhaczając każdy batch w dzienniku.
+    Przy wznowieniu pomija batche już zapisane; plik jest "done" dopiero po ostatnim batchu.
+    ids – gotowe id chunków (po deduplikacji id liczymy z numeracji sprzed usunięcia duplikatów).
+    """
+    entry = journal["files"].get(filename) or {}
+    resumable = (
+        entry.get("status") == "in_progress"
+        and entry.get("fingerprint") == fingerprint
+        and entry.get("total_chunks") == len(chunks)
+    )
+    if not resumable:
+        if entry.get("status") == "in_progress":
+            # Przerwany zapis, którego nie da się wznowić (np. inna liczba chunków po zmianie
+            # CHUNK_SIZE/deduplikacji): id zapisanych batchy mogą nie pokryć się z nowymi – usuwamy je
+            print(f"   🔄 {filename}: przerwanego zapisu nie da się wznowić – reindeksuję od zera.")
+            _delete_source(db, filename)
+        entry = {
+            "status": "in_progress",
+            "fingerprint": fingerprint,
+            "total_chunks": len(chunks),
+            "batch_size": min(INGEST_BATCH_SIZE, MAX_BATCH),
+            "done_batches": [],
+        }
+        journal["files"][filename] = entry
+        _save_journal(db_path, journal)
+
+    batch_size = entry["batch_size"]
+    done_batches = set(entry.get("done_batches") or [])
+    if ids is None:
+        ids = [_chunk_id(filename, i, c.page_content) for i, c in enumerate(chunks)]
+
+    if done_batches:
+        print(f"   ↩️  Wznawiam {filename}: {len(done_batches)} batchy już zapisanych.")
+
+    written = 0
+    for batch_no, start in enumerate(range(0, len(chunks), batch_size)):
+        if batch_no in done_batches:
+            continue
+        db.add_documents(
+            chunks[start : start + batch_size],
+            ids=ids[start : start + batch_size],
         )
-        existing_sources = _list_existing_sources(db)
+        written += len(chunks[start : start + batch_size])
+        entry["done_batches"].append(batch_no)
+        _save_journal(db_path, journal)
+        print(f"   → {filename}: zapisano do {min(start + batch_size, len(chunks))}/{len(chunks)}")
+
+    entry["status"] = "done"
+    entry["done_batches"] = []
+    _save_journal(db_path, journal)
+    return written
+
+
+# ============================================================
+#  MAIN
+# ============================================================
+
+def build_vector_store(
+    embeddings,
+    db_path: str = DB_PATH,
+    docs_path: str = DOCS_PATH,
+) -> Tuple[Chroma, Any]:
+    """
+    Buduje lub aktualizuje bazę Chroma.
+    Postęp zapisywany jest w dzienniku (INGEST_JOURNAL_FILE w katalogu bazy),
+    więc przerwana ingestia wznawia się od ostatniego zapisanego batcha.
+    """
+    is_existing = os.path.exists(db_path) and os.listdir(db_path)
+    if is_existing:
+        print(f"✅ Wykryto istniejącą bazę w '{db_path}'.")
     else:
         print("⚡ Tworzę nową, pustą bazę Chroma.")
 
-    # 2) JSON-y w folderze
+    # Przy zapisie embedujemy batchami kubełkowanymi po długości w tokenach
+    ingest_embeddings = BucketedEmbeddings(embeddings)
+    db = Chroma(
+        persist_directory=db_path,
+        embedding_function=ingest_embeddings,
+    )
+    journal = _load_journal(db_path)
+    existing_sources: Set[str] = _list_existing_sources(db) if is_existing else set()
+
+    # 1) JSON-y w folderze
     all_files = [
-        f for f in os.listdir(DOCS_PATH)
+        f for f in os.listdir(docs_path)
         if f.lower().endswith(".json")
     ]
-    print("[DEBUG] DOCS_PATH =", DOCS_PATH)
+    print("[DEBUG] DOCS_PATH =", docs_path)
     print("[DEBUG] JSON files in DOCS_PATH:")
     for f in sorted(all_files):
         print(" -", f)
 
-    new_files = [f for f in all_files if f not in existing_sources]
+    # 2) Co jest do zrobienia? (zakończone + niezmienione pliki pomijamy)
+    fingerprints = {f: _file_fingerprint(os.path.join(docs_path, f)) for f in all_files}
+    done_files: List[str] = []
+    pending_files: List[str] = []
+    for f in sorted(all_files):
+        entry = journal["files"].get(f)
+        if entry and entry.get("status") == "done" and entry.get("fingerprint") == fingerprints[f]:
+            done_files.append(f)
+        else:
+            pending_files.append(f)
 
     print("\n📊 STATUS BAZY:")
-    print(f" - Pliki w bazie: {len(existing_sources)}")
+    print(f" - Pliki w bazie (zakończone): {len(done_files)}")
     print(f" - Pliki w folderze: {len(all_files)}")
-    print(f" - Do dodania: {len(new_files)}")
-
-    # 3) Jeśli nic nowego, tylko zwróć DB+retriever
-    if not new_files:
-        print("✅ Baza jest aktualna.")
-        if db is None:
-            db = Chroma(
-                persist_directory=DB_PATH,
-                embedding_function=embeddings,
-            )
-
-        retriever = db.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": RETRIEVER_K},
-        )
-        return db, retriever
-
-    # 4) Wczytanie JSON-ów
-    print(f"\n🚀 Rozpoczynam procesowanie {len(new_files)} nowych plików...")
-    raw_docs = _load_json_files(DOCS_PATH, new_files)
-
-    if not raw_docs:
-        raise RuntimeError("❌ Nie udało się wczytać żadnych dokumentów.")
-
-    # 5) Chunking
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP,
-        separators=["\n\n", "\n", " ", ""],
-    )
-
-    final_chunks = splitter.split_documents(raw_docs)
-    print(f"✂️  Dokumenty pocięte na {len(final_chunks)} chunków.")
-
-    # 6) Zapis do bazy
-    if db is None:
-        db = Chroma(
-            persist_directory=DB_PATH,
-            embedding_function=embeddings,
-        )
+    print(f" - Do dodania / dokończenia: {len(pending_files)}")
 
+    # 3) Przetwarzanie plik po pliku
     total_added = 0
-    print("💾 Zapisywanie do bazy wektorowej...")
+    shrink = {"chunks_before": 0, "removed": 0}
+    if pending_files:
+        print(f"\n🚀 Rozpoczynam procesowanie {len(pending_files)} plików...")
+        print("💾 Zapisywanie do bazy wektorowej...")
+
+    for filename in pending_files:
+        raw_docs = _load_json_files(docs_path, [filename])
+        if not raw_docs:
+            print(f"   ⚠️ Brak dokumentów w {filename} – pomijam.")
+            continue
+
+        chunks = _split_documents(raw_docs)
+        if EMBED_OVERLONG_POLICY == "split":
+            chunks = _split_overlong(chunks, embeddings, ingest_embeddings.max_tokens)
+        ids = [_chunk_id(filename, i, c.page_content) for i, c in enumerate(chunks)]
+        if DEDUP_ENABLED:
+            chunks, ids, report = collapse_near_duplicates(chunks, ids)
+            shrink["chunks_before"] += report["chunks_before"]
+            shrink["removed"] += report["removed"]
+            if report["removed"]:
+                print(f"   🧬 Deduplikacja {filename}: {format_shrink_report(report)}")
+        entry = journal["files"].get(filename)
+        fingerprint = fingerprints[filename]
+
+        if entry is None and filename in existing_sources:
+            # Baza sprzed dziennika: akceptujemy plik tylko, jeśli jest kompletny.
+            if len(_source_ids(db, filename)) == len(chunks):
+                journal["files"][filename] = {"status": "done", "fingerprint": fingerprint,
+                                              "total_chunks": len(chunks)}
+                _save_journal(db_path, journal)
+                print(f"   ✅ {filename}: kompletny w istniejącej bazie, dopisuję do dziennika.")
+                continue
+            print(f"   ⚠️ {filename}: niekompletny w bazie – reindeksuję od zera.")
+            _delete_source(db, filename)
+        elif entry is not None and entry.get("fingerprint") != fingerprint:
+            print(f"   🔄 {filename}: plik zmieniony – reindeksuję.")
+            _delete_source(db, filename)
+
+        print(f"✂️  {filename}: {len(chunks)} chunków.")
+        ingest_embeddings.reset_stats()
+        total_added += _ingest_file(db, db_path, journal, filename, chunks, fingerprint, ids)
+
+        stats = ingest_embeddings.report()
+        if stats["texts"]:
+            print(
+                f"   📐 Embedding {filename}: {stats['tokens_per_s']} tok/s | "
+                f"padding {stats['padding_ratio']:.1%} (samo encode: {stats['padding_ratio_encode']:.1%}) | "
+                f"za długie (> {stats['max_tokens']} tok.): {stats['overlong']}"
+            )
 
-    for batch in _batched(final_chunks, MAX_BATCH):
-        db.add_documents(batch)
-        total_added += len(batch)
-        print(f"   → Zapisano {total_added}/{len(final_chunks)}")
+    if shrink["removed"]:
+        pct = 100.0 * shrink["removed"] / shrink["chunks_before"]
+        print(f"🧬 Deduplikacja: usunięto {shrink['removed']} z {shrink['chunks_before']} chunków (-{pct:.1f}% indeksu).")
+    if pending_files:
+        print(f"✅ Baza zaktualizowana (zapisano {total_added} chunków).")
+    else:
+        print("✅ Baza jest aktualna.")
 
-    print("✅ Baza zaktualizowana.")
+    # 4) Graf odwołań między przepisami (art. X § Y) – przeliczany po każdej zmianie plików
+    if XREF_ENABLED:
+        CrossRefGraph.load_or_build(db, db_path, rebuild=bool(pending_files))
 
     retriever = db.as_retriever(
         search_type="similarity",
         search_kwargs={"k": RETRIEVER_K},
     )
     return db, retriever
+
+
+def open_vector_store(embeddings, db_path: str = DB_PATH) -> Chroma:
+    """
+    Otwiera gotową bazę bez ingestii (tryb serwowania wersji indeksu).
+    """
+    if not os.path.exists(db_path) or not os.listdir(db_path):
+        raise RuntimeError(f"❌ Brak bazy w '{db_path}'.")
+    return Chroma(
+        persist_directory=db_path,
+        embedding_function=embeddings,
+    )
+
+
+def is_index_complete(db_path: str, docs_path: str = DOCS_PATH) -> bool:
+    """Czy dziennik potwierdza, że wszystkie JSON-y z docs_path zostały w pełni zapisane."""
+    files = _load_journal(db_path)["files"]
+    for f in os.listdir(docs_path):
+        if not f.lower().endswith(".json"):
+            continue
+        entry = files.get(f)
+        if not entry or entry.get("status") != "done":
+            return False
+        if entry.get("fingerprint") != _file_fingerprint(os.path.join(docs_path, f)):
+            return False
+    return True
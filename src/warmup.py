@@ -0,0 +1,311 @@
+# src/warmup.py
+"""
+Rozgrzewka po starcie / wdrożeniu. Zaraz po restarcie procesy mają puste cache
+(wektory pytań, strony indeksu, maski filtrów), więc p95 pierwszych minut jest wyraźnie gorsze.
+  - QueryLog: append-only JSONL z zanonimizowanymi, znormalizowanymi pytaniami,
+    częstości liczone z ostatnich QUERY_LOG_MAX_LINES wpisów,
+  - QueryEmbeddingCache: LRU wektorów pytań (embed_query) ze statystykami trafień,
+  - CacheWarmer: w wątku w tle odtwarza WARMUP_TOP_N najczęstszych pytań przez retriever
+    (routing, embedding, wyszukiwanie); opcjonalnie generuje odpowiedzi, gdy LLM jest bezczynny.
+Żądania rozgrzewki nie trafiają do logu pytań ani do SLO budżetu (rag_chain, "warmup": True).
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from src.config import (
+    QUERY_LOG_PATH,
+    QUERY_LOG_MAX_LINES,
+    QUERY_LOG_MAX_CHARS,
+    QUERY_CACHE_SIZE,
+    WARMUP_TOP_N,
+    WARMUP_MIN_COUNT,
+    WARMUP_GENERATE_TOP_N,
+    WARMUP_IDLE_WAIT_S,
+)
+from src.metrics import percentile
+
+_EMAIL = re.compile(r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b")
+_LONG_NUMBER = re.compile(r"\d(?:[\d \-/]*\d){5,}")   # PESEL, NIP, telefony, numery kont i spraw
+_SPACES = re.compile(r"\s+")
+
+# Wątek rozgrzewki – jego zapytania nie liczą się do statystyk ruchu w QueryEmbeddingCache
+_warmup_thread = threading.local()
+
+
+def canonical_query(query: str) -> str:
+    """Postać pytania do porównań: małe litery, pojedyncze spacje, bez końcowej interpunkcji."""
+    return _SPACES.sub(" ", query).strip().lower().rstrip("?!. ")
+
+
+def normalize_query(query: str) -> Optional[str]:
+    """
+    Pytanie do logu: postać kanoniczna z zamaskowanymi e-mailami i długimi numerami.
+    Numery artykułów i kwoty zostają (są krótkie i potrzebne do routingu).
+    Zwraca None dla pytań dłuższych niż QUERY_LOG_MAX_CHARS – opisy spraw często zawierają
+    dane osobowe, a i tak się nie powtarzają.
+    """
+    text = canonical_query(query)
+    if not text or len(text) > QUERY_LOG_MAX_CHARS:
+        return None
+    text = _EMAIL.sub("<email>", text)
+    return _LONG_NUMBER.sub("<nr>", text)
+
+
+# ============================================================
+#  LOG PYTAŃ
+# ============================================================
+
+class QueryLog:
+    """
+    Log pytań współdzielony przez procesy: każdy wpis to jedna krótka linia dopisywana
+    w trybie append, więc workery serve.py mogą pisać do tego samego pliku.
+    """
+
+    def __init__(self, path: str = QUERY_LOG_PATH, max_lines: int = QUERY_LOG_MAX_LINES):
+        self.path = path
+        self.max_lines = max_lines
+        self._lock = threading.Lock()
+
+    def record(self, query: str) -> None:
+        normalized = normalize_query(query)
+        if normalized is None:
+            return
+        line = json.dumps({"q": normalized, "t": int(time.time())}, ensure_ascii=False) + "\n"
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+        except OSError as e:
+            print(f"⚠️ Nie udało się zapisać pytania do logu ({e}).")
+
+    def _tail(self) -> List[str]:
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        return lines[-self.max_lines:]
+
+    def top(self, n: int = WARMUP_TOP_N, min_count: int = WARMUP_MIN_COUNT) -> List[Tuple[str, int]]:
+        """Najczęstsze pytania z ostatnich max_lines wpisów: [(pytanie, liczba)]."""
+        counts: Counter = Counter()
+        for line in self._tail():
+            try:
+                counts[json.loads(line)["q"]] += 1
+            except (ValueError, KeyError, TypeError):
+                continue  # urwana linia (np. przerwany zapis)
+        return [(q, c) for q, c in counts.most_common(n) if c >= min_count]
+
+    def compact(self) -> int:
+        """
+        Zostawia ostatnie max_lines wpisów (podmiana atomowa). Wołać przed startem workerów –
+        wpisy dopisane w trakcie kompaktowania by przepadły. Zwraca liczbę usuniętych linii.
+        """
+        if not os.path.exists(self.path):
+            return 0
+        with self._lock:
+            with open(self.path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+            if len(lines) <= self.max_lines:
+                return 0
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.writelines(lines[-self.max_lines:])
+            os.replace(tmp, self.path)
+        return len(lines) - self.max_lines
+
+
+# ============================================================
+#  CACHE WEKTORÓW PYTAŃ
+# ============================================================
+
+class QueryEmbeddingCache(Embeddings):
+    """
+    LRU na embed_query (klucz: postać kanoniczna pytania). embed_documents idzie prosto
+    do modelu – tą drogą liczone są fragmenty załączników i nie powinny wypychać pytań.
+    Statystyki dotyczą tylko ruchu (bez wątku rozgrzewki); "warm_hits" to trafienia we wpisy
+    dodane przez rozgrzewkę, czyli zysk z niej.
+    """
+
+    def __init__(self, base: Embeddings, max_size: int = QUERY_CACHE_SIZE):
+        self.base = base
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[List[float], bool]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "warm_hits": 0, "warmed": 0}
+
+    def __getattr__(self, name: str) -> Any:
+        # Pozostałe atrybuty (np. _client modelu) z bazowych embeddingów
+        return getattr(self.__dict__["base"], name)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = canonical_query(text)
+        warming = getattr(_warmup_thread, "active", False)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            if not warming:
+                self._stats["lookups"] += 1
+                if entry is not None:
+                    self._stats["hits"] += 1
+                    self._stats["warm_hits"] += int(entry[1])
+        if entry is not None:
+            return entry[0]
+
+        vector = self.base.embed_query(text)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (vector, warming)
+                self._stats["warmed"] += int(warming)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return vector
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+            size = len(self._entries)
+        lookups = s["lookups"] or 1
+        return {
+            **s,
+            "size": size,
+            "max_size": self.max_size,
+            "hit_rate": round(s["hits"] / lookups, 3),
+            "warm_hit_rate": round(s["warm_hits"] / lookups, 3),
+        }
+
+
+# ============================================================
+#  ROZGRZEWKA
+# ============================================================
+
+def _lower_thread_priority(niceness: int = 10) -> None:
+    """Niższy priorytet CPU dla bieżącego wątku (Linux: nice per wątek); gdzie indziej no-op."""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), niceness)
+    except (AttributeError, OSError):
+        pass
+
+
+class CacheWarmer:
+    """
+    Odtwarza najczęstsze pytania z logu w wątku w tle (serwis przyjmuje ruch od razu).
+    progress() – stan do /health i logów: ile pytań odtworzono, czasy pierwszego (zimnego)
+    i kolejnych wywołań, statystyki cache pytań.
+    """
+
+    def __init__(
+        self,
+        retriever,
+        query_log: QueryLog,
+        rag_chain=None,
+        llm_client=None,
+        top_n: int = WARMUP_TOP_N,
+        generate_n: int = WARMUP_GENERATE_TOP_N,
+        idle_wait_s: float = WARMUP_IDLE_WAIT_S,
+        query_cache: Optional[QueryEmbeddingCache] = None,
+        label: str = "",
+    ):
+        self.retriever = retriever
+        self.query_log = query_log
+        self.rag_chain = rag_chain
+        self.llm_client = llm_client
+        self.top_n = top_n
+        self.generate_n = generate_n if rag_chain is not None else 0
+        self.idle_wait_s = idle_wait_s
+        self.query_cache = query_cache
+        self.label = label
+        self._state: Dict[str, Any] = {"status": "idle", "queries": 0, "replayed": 0, "failed": 0, "generated": 0}
+        self._latency_ms: List[float] = []
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "CacheWarmer":
+        self._thread = threading.Thread(target=self._run_background, name="cache-warmup", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run_background(self) -> None:
+        _lower_thread_priority()
+        self.run()
+
+    def run(self) -> None:
+        """Rozgrzewka w bieżącym wątku (start() uruchamia ją w tle z niższym priorytetem)."""
+        _warmup_thread.active = True
+        try:
+            self._replay()
+        finally:
+            _warmup_thread.active = False
+
+    def _replay(self) -> None:
+        queries = [q for q, _ in self.query_log.top(self.top_n)]
+        self._state.update({"status": "running", "queries": len(queries), "started_at": time.time()})
+        if not queries:
+            self._state["status"] = "done"
+            print(f"🔥 Rozgrzewka{self.label}: brak powtarzających się pytań w logu – pomijam.")
+            return
+
+        t0 = time.perf_counter()
+        step = max(1, len(queries) // 5)
+        for i, query in enumerate(queries, 1):
+            t = time.perf_counter()
+            try:
+                self.retriever.invoke(query)
+                self._latency_ms.append((time.perf_counter() - t) * 1000)
+                self._state["replayed"] += 1
+            except Exception as e:
+                self._state["failed"] += 1
+                print(f"⚠️ Rozgrzewka{self.label}: pytanie nie przeszło ({type(e).__name__}: {e})")
+            if i % step == 0 or i == len(queries):
+                print(f"🔥 Rozgrzewka{self.label}: {i}/{len(queries)} pytań")
+        self._state["retrieval_s"] = round(time.perf_counter() - t0, 2)
+
+        if self.generate_n:
+            self._state["status"] = "generating"
+            self._generate(queries[: self.generate_n])
+
+        self._state["status"] = "done"
+        p = self.progress()
+        print(
+            f"✅ Rozgrzewka{self.label} zakończona: {p['replayed']}/{p['queries']} pytań w {p['retrieval_s']} s "
+            f"(pierwsze {p['first_ms']} ms, p50 {p['p50_ms']} ms), odpowiedzi w tle: {p['generated']}"
+        )
+
+    def _llm_idle(self) -> bool:
+        if self.llm_client is None:
+            return True
+        stats = self.llm_client.stats()
+        return self.llm_client.queue_depth() == 0 and stats.get("in_flight", 0) == 0
+
+    def _generate(self, queries: List[str]) -> None:
+        """Pełne odpowiedzi (rozgrzewa model i cache promptu w Ollamie) – tylko przy bezczynnym LLM."""
+        for query in queries:
+            while not self._llm_idle():
+                time.sleep(self.idle_wait_s)
+            try:
+                self.rag_chain.invoke({"input": query, "mode": "generate", "warmup": True})
+                self._state["generated"] += 1
+            except Exception as e:
+                print(f"⚠️ Rozgrzewka{self.label}: generacja nie powiodła się ({type(e).__name__}: {e})")
+                return
+
+    def progress(self) -> Dict[str, Any]:
+        lat = list(self._latency_ms)
+        out = {
+            **self._state,
+            "first_ms": round(lat[0], 1) if lat else None,
+            "p50_ms": round(percentile(lat[1:] or lat, 50), 1) if lat else None,
+        }
+        if self.query_cache is not None:
+            out["query_cache"] = self.query_cache.stats()
+        return out
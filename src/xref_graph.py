@@ -0,0 +1,260 @@
+# src/xref_graph.py
+"""
+Graf odwołań między przepisami ("w przypadkach określonych w art. 278 § 1").
+Zamiast podnosić RETRIEVER_K w nadziei, że przywołany przepis też wróci z wyszukiwania,
+liczymy przy ingestii:
+  - krawędzie: chunk -> przywołane (akt, artykuł, paragraf),
+  - przepisy:  "akt|artykuł" -> [(id chunka, paragraf)], w kolejności w pliku,
+a retriever dociąga przywołane przepisy po id (jeden get, bez wyszukiwania wektorowego).
+
+Akt odwołania: "niniejszego kodeksu / niniejszej ustawy" albo brak wskazania = ten sam akt;
+"Kodeksu karnego", "ustawy z dnia ..." itd. = inny akt (tylko akty z korpusu, reszta jest pomijana).
+Numery artykułów normalizujemy (indeksy górne -> cyfry), bo ekstrakcja z PDF gubi indeksy górne.
+"""
+import json
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from src.config import XREF_FILE, XREF_CHUNKS_PER_REF
+from src.dedup import duplicate_pointers
+from src.routing import ACTS
+
+_FORMAT_VERSION = 1
+_SUPERSCRIPTS = str.maketrans("⁰¹²³⁴⁵⁶⁷⁸⁹", "0123456789")
+
+_NUM = r"\d+[a-z]*[⁰¹²³⁴⁵⁶⁷⁸⁹]*"
+_REF = re.compile(
+    rf"\bart\.\s*(?P<art>{_NUM})(?:\s*§\s*(?P<par>{_NUM}))?"
+    rf"(?P<more>(?:\s*(?:,|\bi\b|\blub\b|\boraz\b|\balbo\b)\s*(?:art\.\s*)?{_NUM}(?:\s*§\s*{_NUM})?)*)",
+    re.IGNORECASE,
+)
+_MORE_ITEM = re.compile(rf"(?P<art_kw>art\.\s*)?(?P<num>{_NUM})(?:\s*§\s*(?P<par>{_NUM}))?", re.IGNORECASE)
+_OWN_ACT = re.compile(r"^\W*(?:niniejszego\s+kodeksu|niniejszej\s+ustawy|tego\s+kodeksu|tej\s+ustawy)", re.IGNORECASE)
+# Wskazanie innego aktu tuż po odwołaniu (przed kolejnym "art.")
+_OTHER_ACT = re.compile(r"^\W*(?:kodeksu|ustawy|ordynacji|konstytucji|rozporządzenia|dyrektywy|k\.\s*\w)", re.IGNORECASE)
+# "art. 5 ust. 2 pkt 3 ustawy ..." – jednostki redakcyjne między numerem a nazwą aktu
+_QUALIFIERS = re.compile(r"^(?:\s*(?:ust\.|pkt|lit\.|zd\.|zdanie)\s*\w+[,)]?)+", re.IGNORECASE)
+_ABBREVIATIONS = {
+    "k.k.s.": "Kodeks karny skarbowy",
+    "k.k.w.": "Kodeks karny wykonawczy",
+    "k.p.k.": "Kodeks postępowania karnego",
+    "k.p.c.": "Kodeks postępowania cywilnego",
+    "k.p.a.": "Kodeks postępowania administracyjnego",
+    "k.p.s.w.": "Kodeks postępowania w sprawach o wykroczenia",
+    "k.r.o.": "Kodeks rodzinny i opiekuńczy",
+    "k.s.h.": "Kodeks spółek handlowych",
+    "k.k.": "Kodeks Karny",
+    "k.c.": "Kodeks cywilny",
+    "k.p.": "Kodeks pracy",
+    "k.w.": "Kodeks wykroczeń",
+}
+_CONTEXT_CHARS = 120
+
+Ref = Tuple[str, str, Optional[str]]  # (akt, artykuł, paragraf albo None)
+
+
+def normalize_article(article) -> str:
+    return str(article or "").translate(_SUPERSCRIPTS).strip().lower()
+
+
+def chunk_order(doc_id: Optional[str]) -> int:
+    """Numer chunka w pliku z jego id – kolejność tekstu przepisu (wspólna dla grafu i lookupu)."""
+    # id chunków: "<plik>:<nr chunka>:<hash>" (vectorstore._chunk_id)
+    try:
+        return int(str(doc_id).split(":")[-2])
+    except (ValueError, IndexError):
+        return 0
+
+
+def _genitive(act_name: str) -> str:
+    """Dopełniacz nazwy aktu w tekście przepisów: "Kodeks karny wykonawczy" -> "kodeksu karnego wykonawczego"."""
+    words = act_name.lower().split()
+    if words[0] == "ordynacja":
+        return "ordynacji " + " ".join(w[:-1] + "ej" if w.endswith("a") else w for w in words[1:])
+    if words[0] == "konstytucja":
+        return "konstytucji " + " ".join(words[1:])
+    out = ["kodeksu"]
+    for w in words[1:]:
+        if w.endswith(("ny", "wy", "czy")):
+            w = w[:-1] + "ego"
+        elif w.endswith("ki"):
+            w = w[:-1] + "iego"
+        out.append(w)
+    return " ".join(out)
+
+
+# Najdłuższe nazwy najpierw: "kodeksu karnego wykonawczego" przed "kodeksu karnego"
+_ACT_FORMS: List[Tuple[str, str]] = sorted(
+    ((_genitive(a.act_name), a.act_name) for a in ACTS), key=lambda x: -len(x[0])
+)
+
+
+def _target_act(after: str, own_act: str, act_names: Sequence[str]) -> Optional[str]:
+    """Akt, do którego odnosi się odwołanie (None = akt spoza korpusu)."""
+    after = _QUALIFIERS.sub("", after)
+    if _OWN_ACT.match(after):
+        return own_act
+    if not _OTHER_ACT.match(after):
+        return own_act
+    head = re.sub(r"\s+", " ", after.lower()).lstrip(" ,;:()")
+    compact = head.replace(" ", "")
+    for abbr in sorted(_ABBREVIATIONS, key=len, reverse=True):
+        if compact.startswith(abbr):
+            act = _ABBREVIATIONS[abbr]
+            return act if act in act_names else None
+    for form, act in _ACT_FORMS:
+        if head.startswith(form):
+            return act if act in act_names else None
+    return None
+
+
+def extract_references(text: str, own_act: str, act_names: Sequence[str]) -> List[Ref]:
+    """Odwołania "art. X § Y" z tekstu chunka (bez powtórzeń, w kolejności wystąpienia)."""
+    refs: List[Ref] = []
+    for m in _REF.finditer(text):
+        after = text[m.end():m.end() + _CONTEXT_CHARS]
+        nxt = after.lower().find("art.")
+        act = _target_act(after[:nxt] if nxt >= 0 else after, own_act, act_names)
+        if act is None:
+            continue
+
+        article, paragraph = m.group("art"), m.group("par")
+        items = [(article, paragraph)]
+        # "art. 148 § 1 i 2" -> paragrafy tego samego artykułu; "art. 12, 13 i 15" -> kolejne artykuły
+        for more in _MORE_ITEM.finditer(m.group("more") or ""):
+            if more.group("art_kw") or not items[-1][1]:
+                items.append((more.group("num"), more.group("par")))
+            else:
+                items.append((items[-1][0], more.group("num")))
+
+        for art, par in items:
+            ref = (act, normalize_article(art), normalize_article(par) if par else None)
+            if ref not in refs:
+                refs.append(ref)
+    return refs
+
+
+def _provision_key(act: str, article) -> str:
+    return f"{act}|{normalize_article(article)}"
+
+
+# ============================================================
+#  GRAF
+# ============================================================
+
+class CrossRefGraph:
+    def __init__(self, edges: Dict[str, List[list]], provisions: Dict[str, List[list]], n_chunks: int):
+        self.edges = edges              # id chunka -> [[akt, artykuł, paragraf|None], ...]
+        self.provisions = provisions    # "akt|artykuł" -> [[id chunka, paragraf], ...]
+        self.n_chunks = n_chunks
+
+    # --- budowa ---
+
+    @classmethod
+    def build(cls, db, batch_size: int = 5000) -> "CrossRefGraph":
+        rows: List[Tuple[str, str, dict]] = []
+        offset = 0
+        while True:
+            raw = db.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            ids = raw.get("ids") or []
+            if not ids:
+                break
+            rows.extend(zip(ids, raw.get("documents") or [""] * len(ids), raw.get("metadatas") or [{}] * len(ids)))
+            offset += len(ids)
+
+        act_names = sorted({(m or {}).get("act_name") for _, _, m in rows if (m or {}).get("act_name")})
+        provisions: Dict[str, List[list]] = {}
+        edges: Dict[str, List[list]] = {}
+        for doc_id, text, meta in sorted(rows, key=lambda r: ((r[2] or {}).get("source") or "", chunk_order(r[0]))):
+            meta = meta or {}
+            act, article = meta.get("act_name"), meta.get("article")
+            if not act:
+                continue
+            if article:
+                provisions.setdefault(_provision_key(act, article), []).append([doc_id, meta.get("paragraph")])
+            # Duplikaty zwinięte przy ingestii wskazują na reprezentanta
+            for p in duplicate_pointers(Document(page_content="", metadata=meta)):
+                if p.get("article"):
+                    provisions.setdefault(_provision_key(act, p["article"]), []).append([doc_id, p.get("paragraph")])
+
+            # Tekst chunka + pole cross_references z parsera (o ile jest)
+            source_text = (text or "") + "\n" + str(meta.get("cross_references") or "")
+            own = normalize_article(article)
+            refs = [r for r in extract_references(source_text, act, act_names) if not (r[0] == act and r[1] == own)]
+            if refs:
+                edges[doc_id] = [list(r) for r in refs]
+
+        # Krawędzie tylko do przepisów obecnych w indeksie
+        for doc_id in list(edges):
+            edges[doc_id] = [r for r in edges[doc_id] if _provision_key(r[0], r[1]) in provisions]
+            if not edges[doc_id]:
+                del edges[doc_id]
+        return cls(edges, provisions, offset)
+
+    def save(self, path: str) -> None:
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {"format": _FORMAT_VERSION, "n_chunks": self.n_chunks, "edges": self.edges, "provisions": self.provisions},
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CrossRefGraph":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format") != _FORMAT_VERSION:
+            raise ValueError(f"nieobsługiwany format grafu odwołań: {data.get('format')}")
+        return cls(data["edges"], data["provisions"], int(data["n_chunks"]))
+
+    @classmethod
+    def load_or_build(cls, db, db_path: str, rebuild: bool = False) -> "CrossRefGraph":
+        """Graf liczony raz na wersję indeksu; cache w katalogu bazy (unieważniany przy zmianie liczby chunków)."""
+        path = os.path.join(db_path, XREF_FILE)
+        n_chunks = db._collection.count() if hasattr(db, "_collection") else len(db)
+        if os.path.exists(path) and not rebuild:
+            try:
+                graph = cls.load(path)
+                if graph.n_chunks == n_chunks:
+                    return graph
+            except Exception as e:
+                print(f"⚠️ Nie udało się wczytać grafu odwołań ({e}) – przeliczam.")
+        graph = cls.build(db)
+        try:
+            graph.save(path)
+        except OSError as e:
+            print(f"⚠️ Nie udało się zapisać grafu odwołań: {e}")
+        print(f"🔗 Graf odwołań: {sum(len(v) for v in graph.edges.values())} krawędzi z {len(graph.edges)} chunków, "
+              f"{len(graph.provisions)} przepisów.")
+        return graph
+
+    # --- odczyt ---
+
+    def chunk_ids_for(self, act: str, article: str, paragraph: Optional[str] = None,
+                      limit: int = XREF_CHUNKS_PER_REF) -> List[str]:
+        """Chunki przepisu: najpierw dokładny paragraf, potem cały artykuł ("all") / pozostałe."""
+        chunks = self.provisions.get(_provision_key(act, article)) or []
+        if paragraph:
+            exact = [cid for cid, par in chunks if normalize_article(par) == paragraph]
+            whole = [cid for cid, par in chunks if par in (None, "all")]
+            ids = exact + [c for c in whole if c not in exact]
+            if not ids:
+                ids = [cid for cid, _ in chunks]
+        else:
+            ids = [cid for cid, _ in chunks]
+        return list(dict.fromkeys(ids))[:limit]
+
+    def references(self, doc_ids: Iterable[str]) -> List[Ref]:
+        """Odwołania z podanych chunków (kolejność: ranking chunków, potem kolejność w tekście)."""
+        out: List[Ref] = []
+        for doc_id in doc_ids:
+            for act, article, paragraph in self.edges.get(doc_id) or []:
+                ref = (act, article, paragraph)
+                if ref not in out:
+                    out.append(ref)
+        return out